@@ -0,0 +1,151 @@
+"""Admission control for the expensive zero-shot classification path."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Hashable, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float = 1.0, now: Optional[float] = None) -> bool:
+        """Take tokens if available; never blocks."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def delay(self, amount: float = 1.0, now: Optional[float] = None) -> float:
+        """Seconds until ``amount`` tokens will be available."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def give_back(self, amount: float = 1.0):
+        """Return tokens taken for work that was not done."""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdmissionController:
+    """Bound concurrent model calls with per-chat buckets, a global slot limit and a queue deadline.
+
+    ``admit()`` yields ``True`` when the caller may run the model and ``False``
+    when the request should be degraded to the rule-based answer.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float,
+                 chat_rate: float, chat_burst: float, max_chats: int = 10000):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._waiting = 0
+        self.in_flight = 0
+        self.stats: Dict[str, int] = {
+            'admitted': 0,
+            'shed_chat_rate': 0,
+            'shed_queue_full': 0,
+            'shed_queue_timeout': 0
+        }
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._buckets[chat_id] = bucket
+            # Ограничиваем память: вытесняем давно не активные чаты
+            if len(self._buckets) > self.max_chats:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(chat_id)
+        return bucket
+
+    def _shed(self, reason: str) -> bool:
+        self.stats[reason] += 1
+        logger.warning("Model call shed: %s", reason)
+        return False
+
+    @contextmanager
+    def admit(self, chat_id: Optional[Hashable] = None):
+        bucket = None
+        with self._lock:
+            if chat_id is not None:
+                bucket = self._chat_bucket(chat_id)
+            # Очередь проверяется раньше лимита чата: отказ из-за перегрузки не тратит токен чата
+            if self._waiting >= self.max_queue:
+                admitted = self._shed('shed_queue_full')
+            elif bucket is not None and not bucket.try_take():
+                admitted = self._shed('shed_chat_rate')
+            else:
+                admitted = None
+                self._waiting += 1
+
+        if admitted is None:
+            try:
+                admitted = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+                    if admitted:
+                        self.in_flight += 1
+                        self.stats['admitted'] += 1
+                    else:
+                        self._shed('shed_queue_timeout')
+                        # Модель не вызывалась - токен возвращается чату
+                        if bucket is not None:
+                            bucket.give_back()
+
+        if not admitted:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+
+# Shared controller for the zero-shot classifier
+model_admission = AdmissionController(
+    max_in_flight=int(os.getenv('MODEL_MAX_IN_FLIGHT', '2')),
+    max_queue=int(os.getenv('MODEL_MAX_QUEUE', '16')),
+    queue_timeout=float(os.getenv('MODEL_QUEUE_TIMEOUT', '2.0')),
+    chat_rate=float(os.getenv('MODEL_CHAT_RATE', '0.2')),
+    chat_burst=float(os.getenv('MODEL_CHAT_BURST', '3'))
+)
+
+
+def _collect_admission_metrics():
+    for outcome, value in model_admission.stats.items():
+        yield ('bot_model_admission_total', 'counter', 'Zero-shot admission decisions by outcome',
+               {'outcome': outcome}, value)
+    yield ('bot_model_in_flight', 'gauge', 'Zero-shot classifier calls currently running',
+           {}, model_admission.in_flight)
+
+
+metrics.REGISTRY.register_collector(_collect_admission_metrics)
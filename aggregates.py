@@ -0,0 +1,346 @@
+"""Task counts and activity fill rates kept in aggregate tables for "сколько ..." questions.
+
+task_counts holds one row per (status, assignee, ISO week of the deadline) and
+activity_fill one row per activity type. Both are updated in the transaction that
+changes the source rows: ORM writes through the after_flush listener below, Core
+statements through the explicit ``record_*`` helpers their callers invoke. Summaries
+read the aggregate rows, joining departments at query time, so they cost O(groups)
+instead of a scan of tasks. ``python manage.py verify-aggregates`` compares the
+tables with a full recompute.
+"""
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from intents import department_keywords, task_priority_keywords, task_status_keywords
+from models import NO_DEADLINE, Activity, ActivityFill, ActivityType, Employee, Task, TaskCount, TaskStatus
+from morphology import normalize_text
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+FILL_COLUMNS = ('activities', 'participants', 'seats', 'booked', 'full_activities')
+
+TaskKey = Tuple[str, int, date]
+
+
+def week_start(day: Optional[date]) -> date:
+    """Monday of the ISO week of ``day``; tasks without a deadline share NO_DEADLINE."""
+    if day is None:
+        return NO_DEADLINE
+    return day - timedelta(days=day.weekday())
+
+
+def task_key(status, assignee_id: Optional[int], deadline: Optional[date]) -> TaskKey:
+    if isinstance(status, TaskStatus):
+        status = status.name
+    return status or '', assignee_id or 0, week_start(deadline)
+
+
+def activity_contribution(activity_type, is_active, participant_count, max_participants):
+    """(activity_fill key, column values) an activity adds, or None for inactive ones."""
+    if not is_active:
+        return None
+    if isinstance(activity_type, ActivityType):
+        activity_type = activity_type.name
+    participants = participant_count or 0
+    limited = bool(max_participants)
+    return activity_type or '', (
+        1,
+        participants,
+        max_participants if limited else 0,
+        participants if limited else 0,
+        1 if limited and participants >= max_participants else 0
+    )
+
+
+def _upsert(connection, table, key_columns, value_columns, rows: List[Dict]):
+    statement = _UPSERT_DIALECTS[connection.dialect.name](table)
+    statement = statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: getattr(table.c, column) + getattr(statement.excluded, column) for column in value_columns}
+    )
+    connection.execute(statement, rows)
+
+
+def apply_task_deltas(connection, deltas: Counter):
+    rows = [
+        {'status': status, 'assignee_id': assignee_id, 'deadline_week': week, 'task_count': count}
+        for (status, assignee_id, week), count in deltas.items() if count
+    ]
+    if not rows:
+        return
+    table = TaskCount.__table__
+    _upsert(connection, table, ['status', 'assignee_id', 'deadline_week'], ['task_count'], rows)
+    # Пустые группы удаляем, чтобы таблица оставалась размером с число групп
+    connection.execute(delete(table).where(table.c.task_count == 0))
+
+
+def apply_fill_deltas(connection, deltas: Dict[str, List[int]]):
+    rows = [
+        {'activity_type': key, **dict(zip(FILL_COLUMNS, values))}
+        for key, values in deltas.items() if any(values)
+    ]
+    if not rows:
+        return
+    table = ActivityFill.__table__
+    _upsert(connection, table, ['activity_type'], FILL_COLUMNS, rows)
+    connection.execute(delete(table).where(table.c.activities == 0))
+
+
+def _add_fill(deltas: Dict[str, List[int]], contribution, sign: int):
+    if contribution is None:
+        return
+    key, values = contribution
+    totals = deltas.setdefault(key, [0] * len(FILL_COLUMNS))
+    for index, value in enumerate(values):
+        totals[index] += sign * value
+
+
+def _previous(state, attribute: str):
+    """Value of the attribute before the pending flush."""
+    history = state.attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), attribute)
+
+
+def _task_key_of(state, previous: bool = False) -> TaskKey:
+    read = _previous if previous else (lambda state, attribute: getattr(state.obj(), attribute))
+    return task_key(read(state, 'status'), read(state, 'assignee_id'), read(state, 'deadline'))
+
+
+def _activity_contribution_of(state, previous: bool = False):
+    read = _previous if previous else (lambda state, attribute: getattr(state.obj(), attribute))
+    return activity_contribution(
+        read(state, 'type'), read(state, 'is_active'), read(state, 'participant_count'), read(state, 'max_participants')
+    )
+
+
+def _load_previous(target, value, oldvalue, initiator):
+    pass
+
+
+# Без active_history присваивание истекшему после commit атрибуту не загружает старое
+# значение, и группа, из которой уходит строка, была бы неизвестна
+for _attribute in (Task.status, Task.assignee_id, Task.deadline,
+                   Activity.type, Activity.is_active, Activity.participant_count, Activity.max_participants):
+    event.listen(_attribute, 'set', _load_previous, active_history=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    # История атрибутов еще хранит значения до flush - из нее берем старые ключи групп
+    task_deltas = Counter()
+    fill_deltas = {}
+    for instance in session.new:
+        state = inspect(instance)
+        if isinstance(instance, Task):
+            task_deltas[_task_key_of(state)] += 1
+        elif isinstance(instance, Activity):
+            _add_fill(fill_deltas, _activity_contribution_of(state), 1)
+    for instance in session.dirty:
+        if not isinstance(instance, (Task, Activity)) or not session.is_modified(instance):
+            continue
+        state = inspect(instance)
+        if isinstance(instance, Task):
+            task_deltas[_task_key_of(state, previous=True)] -= 1
+            task_deltas[_task_key_of(state)] += 1
+        else:
+            _add_fill(fill_deltas, _activity_contribution_of(state, previous=True), -1)
+            _add_fill(fill_deltas, _activity_contribution_of(state), 1)
+    for instance in session.deleted:
+        state = inspect(instance)
+        if isinstance(instance, Task):
+            task_deltas[_task_key_of(state, previous=True)] -= 1
+        elif isinstance(instance, Activity):
+            _add_fill(fill_deltas, _activity_contribution_of(state, previous=True), -1)
+    if task_deltas or fill_deltas:
+        connection = session.connection()
+        apply_task_deltas(connection, task_deltas)
+        apply_fill_deltas(connection, fill_deltas)
+
+
+def record_tasks(session, rows: Iterable, sign: int = 1):
+    """Count tasks written with Core statements; rows have status, assignee_id and deadline."""
+    deltas = Counter()
+    for row in rows:
+        row = row if isinstance(row, dict) else row._mapping
+        deltas[task_key(row['status'], row['assignee_id'], row['deadline'])] += sign
+    apply_task_deltas(session.connection(), deltas)
+
+
+def record_status_change(session, rows: Iterable, status: TaskStatus):
+    """Move tasks read before a Core UPDATE of their status to the new status group."""
+    deltas = Counter()
+    for row in rows:
+        deltas[task_key(row.status, row.assignee_id, row.deadline)] -= 1
+        deltas[task_key(status, row.assignee_id, row.deadline)] += 1
+    apply_task_deltas(session.connection(), deltas)
+
+
+def record_participants_added(session, activity_id: int, count: int = 1):
+    """Account for participants added with Core statements, after participant_count was raised."""
+    row = session.execute(
+        select(Activity.type, Activity.is_active, Activity.participant_count, Activity.max_participants)
+        .where(Activity.id == activity_id)
+    ).first()
+    if row is None:
+        return
+    deltas = {}
+    _add_fill(deltas, activity_contribution(row.type, row.is_active, row.participant_count - count, row.max_participants), -1)
+    _add_fill(deltas, activity_contribution(*row), 1)
+    apply_fill_deltas(session.connection(), deltas)
+
+
+def recompute(session) -> Tuple[Counter, Dict[str, List[int]]]:
+    """Aggregates computed from scratch by streaming tasks and activities."""
+    task_counts = Counter()
+    for row in session.execute(
+        select(Task.status, Task.assignee_id, Task.deadline).execution_options(yield_per=1000)
+    ):
+        task_counts[task_key(row.status, row.assignee_id, row.deadline)] += 1
+    fill = {}
+    for row in session.execute(
+        select(Activity.type, Activity.is_active, Activity.participant_count, Activity.max_participants)
+        .execution_options(yield_per=1000)
+    ):
+        _add_fill(fill, activity_contribution(*row), 1)
+    return task_counts, {key: values for key, values in fill.items() if values[0]}
+
+
+def stored(session) -> Tuple[Counter, Dict[str, List[int]]]:
+    task_counts = Counter({
+        (row.status, row.assignee_id, row.deadline_week): row.task_count
+        for row in session.execute(select(TaskCount.__table__))
+    })
+    fill = {
+        row.activity_type: [getattr(row, column) for column in FILL_COLUMNS]
+        for row in session.execute(select(ActivityFill.__table__))
+    }
+    return task_counts, fill
+
+
+def verify(session) -> List[str]:
+    """Differences between the aggregate tables and a full recompute; empty when they agree."""
+    expected_tasks, expected_fill = recompute(session)
+    actual_tasks, actual_fill = stored(session)
+    problems = []
+    for key in sorted(set(expected_tasks) | set(actual_tasks)):
+        if expected_tasks[key] != actual_tasks[key]:
+            problems.append(f"task_counts {key}: stored {actual_tasks[key]}, actual {expected_tasks[key]}")
+    for key in sorted(set(expected_fill) | set(actual_fill)):
+        expected = expected_fill.get(key, [0] * len(FILL_COLUMNS))
+        actual = actual_fill.get(key, [0] * len(FILL_COLUMNS))
+        if expected != actual:
+            problems.append(f"activity_fill {key or '-'}: stored {actual}, actual {expected}")
+    return problems
+
+
+def rebuild(session) -> Tuple[int, int]:
+    """Replace the aggregate tables with a full recompute; returns the number of groups. The caller commits."""
+    task_counts, fill = recompute(session)
+    connection = session.connection()
+    connection.execute(delete(TaskCount.__table__))
+    connection.execute(delete(ActivityFill.__table__))
+    apply_task_deltas(connection, task_counts)
+    apply_fill_deltas(connection, fill)
+    return len(task_counts), len(fill)
+
+
+def is_summary_query(query: str) -> bool:
+    """Count questions task_counts can answer: no priority, tag or day/month deadline filter."""
+    query_lower = query.lower()
+    if 'сколько' not in query_lower and 'есть ли' not in query_lower:
+        return False
+    # Таких ключей в агрегатах нет - эти вопросы идут обычным поиском
+    if any(word in query_lower for word in ('сегодня', 'завтра', 'месяц', 'тег')):
+        return False
+    return not task_priority_keywords.matches(query_lower, normalize_text(query_lower))
+
+
+def is_fill_query(query: str) -> bool:
+    query_lower = query.lower()
+    return 'заполнен' in query_lower or 'свободн' in query_lower or ('сколько' in query_lower and 'мест' in query_lower)
+
+
+def task_summary(session, query: str, today: Optional[date] = None, assignee: Optional[Employee] = None) -> str:
+    """Answer "сколько задач в работе по отделу" / "есть ли блокеры у Ивана" from task_counts."""
+    query_lower = query.lower()
+    normalized_query = normalize_text(query_lower)
+    statuses = task_status_keywords.matches(query_lower, normalized_query)
+    # У одного исполнителя один отдел - разбивка по отделам не нужна
+    departments = department_keywords.matches(query_lower, normalized_query) if assignee is None else []
+    this_week = 'недел' in query_lower
+    by_status = not statuses
+
+    # Отдел исполнителя присоединяется при чтении - по одной строке на группу
+    group = TaskCount.status if by_status else Employee.department
+    summary = select(group, func.sum(TaskCount.task_count)).select_from(TaskCount).outerjoin(
+        Employee, Employee.id == TaskCount.assignee_id
+    )
+    if statuses:
+        summary = summary.where(TaskCount.status.in_(statuses))
+    if assignee is not None:
+        summary = summary.where(TaskCount.assignee_id == assignee.id)
+    if departments:
+        summary = summary.where(or_(*[
+            Employee.department.ilike(f'%{keyword}%')
+            for department in departments for keyword in department_keywords[department]
+        ]))
+    if this_week:
+        summary = summary.where(TaskCount.deadline_week == week_start(today or datetime.now().date()))
+    groups = session.execute(summary.group_by(group)).all()
+    total = sum(count for _, count in groups)
+
+    title = "Задачи"
+    if statuses:
+        title += " " + ", ".join(f"«{TaskStatus[status].value}»" for status in statuses)
+    if departments:
+        title += " в отделе " + ", ".join(department.upper() for department in departments)
+    if assignee is not None:
+        title += f" у {assignee.name}"
+    if this_week:
+        title += " со сроком на этой неделе"
+    if not total:
+        return f"{title}: нет."
+
+    response = f"📊 {title}: {total}\n"
+    rows = sorted(groups, key=lambda item: -item[1])
+    if by_status:
+        response += "\nПо статусам:\n"
+        for status, count in rows:
+            response += f"• {TaskStatus[status].value if status else 'без статуса'}: {count}\n"
+    elif not departments and assignee is None:
+        response += "\nПо отделам:\n"
+        for department, count in rows:
+            response += f"• {department or 'без исполнителя'}: {count}\n"
+    return response
+
+
+def activity_summary(session) -> str:
+    """Active activities by type with participants and seat fill from activity_fill."""
+    rows = session.execute(select(ActivityFill.__table__).order_by(ActivityFill.activity_type)).all()
+    if not rows:
+        return "Активных активностей нет."
+    response = "📊 Заполненность активностей:\n\n"
+    for row in rows:
+        name = ActivityType[row.activity_type].value if row.activity_type else 'без типа'
+        response += f"• {name}: {row.activities} акт., {row.participants} участн."
+        if row.seats:
+            response += f", занято {row.booked}/{row.seats} мест ({row.booked / row.seats:.0%})"
+            if row.full_activities:
+                response += f", заполнено: {row.full_activities}"
+        response += "\n"
+    return response
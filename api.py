@@ -0,0 +1,123 @@
+"""Read-only JSON search API over the same query builders as the bot.
+
+``GET /api/<entity>?q=...&limit=20&offset=0`` where entity is employees, events,
+tasks or activities, and ``GET /api/health``. Responses carry an ETag of the body,
+answer ``If-None-Match`` with 304 and are cacheable for API_CACHE_MAX_AGE seconds.
+Run under gunicorn::
+
+    gunicorn -c gunicorn.conf.py api:app
+"""
+import hashlib
+import json
+import logging
+import os
+
+from flask import Flask, Response, request
+from sqlalchemy.orm import Query, joinedload
+
+import metrics
+import search
+from calendar_index import calendar_index
+from models import Task, get_session
+
+logger = logging.getLogger(__name__)
+
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '20'))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '100'))
+# Seconds a client may reuse a response without revalidating
+API_CACHE_MAX_AGE = int(os.getenv('API_CACHE_MAX_AGE', '30'))
+# Writes come from the bot process, whose change hooks do not reach the API workers
+API_CALENDAR_MAX_AGE = float(os.getenv('API_CALENDAR_MAX_AGE', '60'))
+
+API_REQUESTS = metrics.counter('api_requests_total', 'HTTP API responses', ['entity', 'status'])
+
+ENTITIES = {
+    'employees': (search.employees_query, search.EMPLOYEE_FIELDS),
+    'events': (search.events_query, search.EVENT_FIELDS),
+    'tasks': (search.tasks_query, search.TASK_FIELDS),
+    'activities': (search.activities_query, search.ACTIVITY_FIELDS),
+}
+
+app = Flask(__name__)
+calendar_index.max_age = API_CALENDAR_MAX_AGE
+
+
+def json_response(payload, status: int = 200) -> Response:
+    """JSON response with an ETag, Cache-Control and If-None-Match handling."""
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    response = Response(body, status=status, mimetype='application/json')
+    if status == 200:
+        response.set_etag(hashlib.sha1(body).hexdigest())
+        # Ответы содержат контакты сотрудников - кэшировать может только клиент, не общий прокси
+        response.cache_control.private = True
+        response.cache_control.max_age = API_CACHE_MAX_AGE
+        response = response.make_conditional(request)
+    return response
+
+
+def page_args():
+    limit = int(request.args.get('limit', API_PAGE_SIZE))
+    offset = int(request.args.get('offset', 0))
+    if limit < 1 or offset < 0:
+        raise ValueError("limit must be positive and offset non-negative")
+    return min(limit, API_MAX_PAGE_SIZE), offset
+
+
+def birthday_rows(session, query: str):
+    return [
+        {'kind': 'birthday', 'date': day.isoformat(), 'employee_id': person.employee_id,
+         'name': person.name, 'department': person.department}
+        for day, person in search.birthdays(session, query)
+    ]
+
+
+@app.get('/api/health')
+def health():
+    return Response('{"ok": true}', mimetype='application/json')
+
+
+@app.get('/api/<entity>')
+def search_entity(entity: str):
+    if entity not in ENTITIES:
+        API_REQUESTS.labels('unknown', '404').inc()
+        return json_response({'error': f"unknown entity: {entity}"}, 404)
+    query = request.args.get('q', '').strip()
+    try:
+        limit, offset = page_args()
+    except ValueError as e:
+        API_REQUESTS.labels(entity, '400').inc()
+        return json_response({'error': str(e)}, 400)
+
+    build, fields = ENTITIES[entity]
+    session = get_session()
+    try:
+        if entity == 'events' and search.is_birthday_query(query):
+            items, total = search.fetch_page(birthday_rows(session, query), offset, limit)
+        else:
+            result = build(session, query)
+            if isinstance(result, Query) and entity == 'tasks':
+                # Имя исполнителя тем же запросом, без отдельного SELECT на строку
+                result = result.options(joinedload(Task.assignee))
+            rows, total = search.fetch_page(result, offset, limit)
+            items = [search.as_dict(row, fields) for row in rows]
+            if entity == 'tasks':
+                for item, task in zip(items, rows):
+                    item['assignee'] = task.assignee.name if task.assignee else None
+    except Exception as e:
+        logger.error(f"Error searching {entity}: {e}")
+        metrics.ERRORS.labels(f'api_{entity}').inc()
+        API_REQUESTS.labels(entity, '500').inc()
+        return json_response({'error': 'search failed'}, 500)
+    finally:
+        session.close()
+
+    response = json_response({
+        'query': query,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': offset + limit if offset + limit < total else None,
+        'items': items
+    })
+    API_REQUESTS.labels(entity, str(response.status_code)).inc()
+    return response
@@ -0,0 +1,88 @@
+"""Startup time, per-query latency and score agreement of the classifier backends.
+
+Each backend runs twice in a fresh process: the first start includes exporting the
+artifact (if it is not cached yet), the second only loads it. Run from the repository root::
+
+    python -m benchmarks.classifier_backends --limit 40
+    python -m benchmarks.classifier_backends --backends pipeline onnx --quantize int8
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.classifier_quantization import corpus, torch_threads_default
+from intents import categories
+from inference import LOCAL_BACKENDS
+
+
+def run_backend(backend: str, quantize: str, limit: int, threads: int):
+    """Child process: start one backend, classify the corpus and print JSON results."""
+    started = time.perf_counter()
+    import torch
+    from inference import load_classifier
+    torch.set_num_threads(threads)
+    classifier = load_classifier(backend=backend, quantize=quantize, device=-1)
+    startup = time.perf_counter() - started
+
+    samples = corpus()[:limit]
+    classifier(samples[0][0], categories)
+    latencies, results = [], []
+    for text, _ in samples:
+        started = time.perf_counter()
+        result = classifier(text, categories)
+        latencies.append(time.perf_counter() - started)
+        results.append(dict(zip(result['labels'], result['scores'])))
+    latencies.sort()
+    print(json.dumps({
+        'startup_seconds': startup,
+        'p50_ms': latencies[len(latencies) // 2] * 1e3,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1e3,
+        'scores': results
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backends', nargs='+', choices=LOCAL_BACKENDS, default=list(LOCAL_BACKENDS))
+    parser.add_argument('--quantize', choices=['', 'int8'], default='')
+    parser.add_argument('--limit', type=int, default=None, help='classify only the first N examples')
+    parser.add_argument('--threads', type=int, default=torch_threads_default())
+    parser.add_argument('--backend', choices=LOCAL_BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    limit = args.limit or len(corpus())
+
+    if args.backend:
+        run_backend(args.backend, args.quantize, limit, args.threads)
+        return
+
+    results = {}
+    for backend in dict.fromkeys(['pipeline'] + args.backends):
+        runs = []
+        for _ in range(2):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.classifier_backends', '--backend', backend,
+                 '--quantize', args.quantize, '--limit', str(limit), '--threads', str(args.threads)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[backend] = runs
+
+    # Эталон - пайплайн с той же квантизацией
+    reference = results['pipeline'][1]['scores']
+    print(f"{limit} examples, {args.threads} threads, quantize={args.quantize or 'none'}")
+    print(f"{'backend':12s} {'1st start s':>11s} {'start s':>8s} {'p50 ms':>7s} {'p95 ms':>7s} "
+          f"{'top-1 agree':>11s} {'max |Δscore|':>12s}")
+    for backend, (first, second) in results.items():
+        scores = second['scores']
+        agreement = sum(
+            max(a, key=a.get) == max(b, key=b.get) for a, b in zip(scores, reference)
+        ) / limit
+        delta = max(abs(a[label] - b[label]) for a, b in zip(scores, reference) for label in a)
+        print(f"{backend:12s} {first['startup_seconds']:11.1f} {second['startup_seconds']:8.1f} "
+              f"{second['p50_ms']:7.0f} {second['p95_ms']:7.0f} {agreement:11.1%} {delta:12.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Latency, RSS and agreement of the int8-quantized classifier against fp32.
+
+The corpus is the labelled examples of ``intents.category_patterns``. Every
+variant runs in its own process so RSS is not shared. Run from the repository root::
+
+    python -m benchmarks.classifier_quantization
+    python -m benchmarks.classifier_quantization --limit 40 --threads 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from intents import categories, category_patterns
+
+VARIANTS = {
+    'fp32': '',
+    'int8': 'int8',
+}
+
+
+def corpus():
+    return [(example, category) for category, patterns in category_patterns.items() for example in patterns['examples']]
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is missing."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def torch_threads_default() -> int:
+    return int(os.getenv('OMP_NUM_THREADS', str(os.cpu_count() or 1)))
+
+
+def run_variant(variant: str, limit: int, threads: int):
+    """Child process: load one variant, classify the corpus and print JSON results."""
+    import torch
+    from inference import load_classifier
+    torch.set_num_threads(threads)
+    baseline = rss_mb()
+    started = time.perf_counter()
+    classifier = load_classifier(quantize=VARIANTS[variant], device=-1)
+    load_seconds = time.perf_counter() - started
+    loaded = rss_mb()
+
+    samples = corpus()[:limit]
+    classifier(samples[0][0], categories)
+    latencies, predictions = [], []
+    for text, _ in samples:
+        started = time.perf_counter()
+        result = classifier(text, categories)
+        latencies.append(time.perf_counter() - started)
+        predictions.append(result['labels'][0])
+    latencies.sort()
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'model_rss_mb': loaded - baseline,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'p50_ms': latencies[len(latencies) // 2] * 1e3,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1e3,
+        'predictions': predictions
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--limit', type=int, default=None, help='classify only the first N examples')
+    parser.add_argument('--threads', type=int, default=torch_threads_default())
+    parser.add_argument('--variant', choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    limit = args.limit or len(corpus())
+
+    if args.variant:
+        run_variant(args.variant, limit, args.threads)
+        return
+
+    results = {}
+    for variant in VARIANTS:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.classifier_quantization', '--variant', variant,
+             '--limit', str(limit), '--threads', str(args.threads)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[variant] = json.loads(output.strip().splitlines()[-1])
+
+    labels = [category for _, category in corpus()[:limit]]
+    reference = results['fp32']['predictions']
+    print(f"{limit} examples, {args.threads} threads")
+    print(f"{'variant':8s} {'load s':>7s} {'model MB':>9s} {'peak MB':>8s} {'p50 ms':>7s} {'p95 ms':>7s} "
+          f"{'agree':>6s} {'accuracy':>8s}")
+    for variant, result in results.items():
+        agreement = sum(a == b for a, b in zip(result['predictions'], reference)) / limit
+        accuracy = sum(a == b for a, b in zip(result['predictions'], labels)) / limit
+        print(f"{variant:8s} {result['load_seconds']:7.1f} {result['model_rss_mb']:9.0f} {result['peak_rss_mb']:8.0f} "
+              f"{result['p50_ms']:7.0f} {result['p95_ms']:7.0f} {agreement:6.1%} {accuracy:8.1%}")
+
+
+if __name__ == '__main__':
+    main()
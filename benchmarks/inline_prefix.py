@@ -0,0 +1,108 @@
+"""Measure inline autocomplete latency of the prefix index on a synthetic directory.
+
+Builds ``prefix_index.PrefixIndex`` in memory from generated employees, activities
+and tasks (no database), then replays keystroke sequences: every prefix of a random
+name, position or title, one or two words at a time. Reports trie lookups without
+the article cache and full answers with it. Run from the repository root::
+
+    python -m benchmarks.inline_prefix --employees 5000 --tasks 20000
+
+Exits with status 1 if the p99 uncached lookup exceeds ``--budget-ms``.
+"""
+import argparse
+import random
+import time
+
+from prefix_index import Card, PrefixIndex, words
+
+FIRST_NAMES = ['Иван', 'Анна', 'Петр', 'Мария', 'Алексей', 'Елена', 'Сергей', 'Ольга', 'Дмитрий', 'Наталья',
+               'Андрей', 'Татьяна', 'Михаил', 'Юлия', 'Николай', 'Ксения', 'Артём', 'Дарья']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов',
+              'Новиков', 'Морозов', 'Волков', 'Соловьёв', 'Васильев', 'Зайцев', 'Павлов', 'Семенов', 'Голубев']
+POSITIONS = ['Python разработчик', 'Frontend разработчик', 'Аналитик данных', 'Менеджер проектов', 'Тестировщик',
+             'DevOps инженер', 'Дизайнер интерфейсов', 'HR менеджер', 'Бухгалтер', 'Руководитель отдела продаж']
+ACTIVITIES = ['Настольные игры', 'Йога', 'Футбол', 'Шахматный турнир', 'Обед с коллегами', 'Книжный клуб',
+              'Волейбол', 'Мастер-класс по фотографии', 'Квиз', 'Бег по набережной']
+TASK_WORDS = ['отчет', 'релиз', 'ревью', 'миграция', 'база', 'данных', 'интеграция', 'платежей', 'дизайн',
+              'лендинга', 'тесты', 'API', 'документация', 'мониторинг', 'оптимизация', 'запросов', 'бот']
+
+
+def make_cards(rng: random.Random, employees: int, activities: int, tasks: int):
+    cards = []
+    names = []
+    for number in range(1, employees + 1):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        position = rng.choice(POSITIONS)
+        names.append(name)
+        cards.append((Card('employee', number, name, position, name), words(name) + words(position)))
+    for number in range(1, activities + 1):
+        name = f"{rng.choice(ACTIVITIES)} #{number}"
+        cards.append((Card('activity', number, name, '', name), words(name)))
+    for number in range(1, tasks + 1):
+        title = ' '.join(rng.choice(TASK_WORDS) for _ in range(rng.randint(2, 5))).capitalize()
+        cards.append((Card('task', number, title, f"#{number}", title), words(title)))
+    return cards, names
+
+
+def keystrokes(rng: random.Random, cards, names, sequences: int):
+    """Queries as typed: each prefix of one or two words of a card title or an employee name."""
+    queries = []
+    for _ in range(sequences):
+        source = rng.choice(names) if rng.random() < 0.5 else rng.choice(cards)[0].title
+        text = ' '.join(source.split()[:rng.choice([1, 2])])
+        queries.extend(text[:end] for end in range(1, len(text) + 1))
+    return queries
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return [samples[min(len(samples) - 1, int(p * len(samples)))] * 1000 for p in (0.5, 0.99)] + [samples[-1] * 1000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--activities', type=int, default=500)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--sequences', type=int, default=2000, help='typed queries, replayed keystroke by keystroke')
+    parser.add_argument('--results', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cards, names = make_cards(rng, args.employees, args.activities, args.tasks)
+    index = PrefixIndex(max_results=args.results, cache_size=len(cards))
+    started = time.perf_counter()
+    index.build(cards)
+    build = time.perf_counter() - started
+    queries = keystrokes(rng, cards, names, args.sequences)
+
+    lookups = []
+    found = 0
+    for query in queries:
+        started = time.perf_counter()
+        found += len(index.search(query))
+        lookups.append(time.perf_counter() - started)
+    # Первый проход заполняет кэш статей, второй отвечает из него
+    answers = {}
+    for label in ('cold', 'cached'):
+        answers[label] = []
+        for query in queries:
+            started = time.perf_counter()
+            index.articles(query)
+            answers[label].append(time.perf_counter() - started)
+
+    print(f"{len(index)} cards indexed in {build:.2f}s; {len(queries)} keystrokes, {found / len(queries):.1f} results each")
+    print("                       p50 / p99 / max, ms")
+    print("  trie lookup          %.3f / %.3f / %.3f" % tuple(percentiles(lookups)))
+    print("  answer, cold cache   %.3f / %.3f / %.3f" % tuple(percentiles(answers['cold'])))
+    print("  answer, cached       %.3f / %.3f / %.3f" % tuple(percentiles(answers['cached'])))
+    print(f"  article cache        {index.stats}")
+    if percentiles(lookups)[1] > args.budget_ms:
+        print(f"FAIL: p99 lookup above {args.budget_ms:g} ms")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
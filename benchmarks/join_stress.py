@@ -0,0 +1,132 @@
+"""Fire hundreds of simultaneous joins at one activity and check that it is never overbooked.
+
+Run from the repository root::
+
+    python -m benchmarks.join_stress --joins 300 --seats 25
+    python -m benchmarks.join_stress --database-url postgresql://bot@localhost/bot_stress
+    python -m benchmarks.join_stress --naive   # the old read-check-append flow, for comparison
+    python -m benchmarks.join_stress --group-commit   # joins coalesced by the write queue
+
+Exits with status 1 if more participants than seats were recorded.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Activity, ActivityType, Base, Employee, activity_participants, add_activity_participant
+from write_queue import WriteQueue
+
+
+def naive_join(session, activity_id, employee_id):
+    """Read the participant count, compare and insert - the flow join_activity used before."""
+    activity = session.get(Activity, activity_id)
+    taken = session.execute(
+        select(func.count()).select_from(activity_participants).where(
+            activity_participants.c.activity_id == activity_id
+        )
+    ).scalar()
+    if taken >= activity.max_participants:
+        return "full"
+    # Окно гонки между проверкой и вставкой
+    time.sleep(0.001)
+    session.execute(activity_participants.insert().values(activity_id=activity_id, employee_id=employee_id))
+    return "joined"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--joins', type=int, default=300)
+    parser.add_argument('--seats', type=int, default=25)
+    parser.add_argument('--naive', action='store_true', help='use the non-atomic check-then-insert flow')
+    parser.add_argument('--group-commit', action='store_true',
+                        help='submit joins through the write queue instead of committing each one')
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.database_url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmpdir.name, 'join_stress.db')}"
+
+    engine = create_engine(url, pool_size=args.joins, max_overflow=0, pool_timeout=60)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+        employees = [Employee(name=f"Сотрудник {i}", email=f"user{i}@company.com") for i in range(args.joins)]
+        activity = Activity(name="Совместный обед", type=ActivityType.LUNCH, max_participants=args.seats, is_active=True)
+        session.add_all(employees + [activity])
+        session.commit()
+        activity_id = activity.id
+        employee_ids = [employee.id for employee in employees]
+
+    join = naive_join if args.naive else add_activity_participant
+    barrier = threading.Barrier(args.joins)
+    outcomes = Counter()
+    lock = threading.Lock()
+    write_queue = WriteQueue(session_factory=Session) if args.group_commit else None
+
+    def run_join(employee_id):
+        if write_queue:
+            return write_queue.submit(lambda session: join(session, activity_id, employee_id)).result()
+        session = Session()
+        try:
+            result = join(session, activity_id, employee_id)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def worker(employee_id):
+        barrier.wait()
+        try:
+            result = run_join(employee_id)
+        except Exception as e:
+            result = f"error: {type(e).__name__}"
+        with lock:
+            outcomes[result] += 1
+
+    threads = [threading.Thread(target=worker, args=(employee_id,)) for employee_id in employee_ids]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with Session() as session:
+        taken = session.execute(
+            select(func.count()).select_from(activity_participants).where(
+                activity_participants.c.activity_id == activity_id
+            )
+        ).scalar()
+        counter = session.get(Activity, activity_id).participant_count
+    engine.dispose()
+    if tmpdir:
+        tmpdir.cleanup()
+
+    mode = " (group commit)" if args.group_commit else ""
+    print(f"{args.joins} concurrent joins in {elapsed:.2f}s against {url.split('://')[0]}{mode}")
+    for result, count in sorted(outcomes.items()):
+        print(f"  {result:30s} {count}")
+    print(f"participants recorded: {taken}/{args.seats}, participant_count: {counter}")
+    if taken > args.seats or taken != outcomes["joined"] or (not args.naive and counter != taken):
+        print("FAIL: activity overbooked or join results do not match stored rows")
+        sys.exit(1)
+    print("OK: no overbooking")
+
+
+if __name__ == '__main__':
+    main()
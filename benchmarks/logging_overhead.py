@@ -0,0 +1,95 @@
+"""Per-message logging overhead on the calling thread: synchronous f-strings vs the queued pipeline.
+
+Run from the repository root::
+
+    python -m benchmarks.logging_overhead --messages 20000
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import logging_setup
+
+QUERY = "Кто из IT отдела знает Python и Docker?"
+# Ответ размером в несколько килобайт, как у search_employees
+RESPONSE = "Найдены следующие сотрудники:\n\n" + (
+    "• Иван Петров - Senior Developer\n"
+    "  🛠️ Навыки: Python, Django, PostgreSQL, Docker\n"
+    "  🎯 Интересы: настольные игры, программирование, путешествия\n"
+    "  📧 Email: ivan@company.com\n\n"
+) * 25
+FILTERS = ["employees.skills ILIKE :skills_1 OR employees.skills ILIKE :skills_2"] * 4
+
+
+def eager_message(logger: logging.Logger):
+    """Log calls of one message as they were before the pipeline."""
+    logger.info(f"Received message: {QUERY}")
+    logger.info(f"Processing query: {QUERY.lower()}")
+    logger.info(f"Rule-based classification: поиск сотрудника with confidence {4.25:.2f}")
+    logger.info(f"Searching employees with query: {QUERY.lower()}")
+    for skill in ('python', 'docker'):
+        logger.info(f"Found skill: {skill}")
+    logger.info(f"Found department: {'it'}")
+    logger.info(f"Applying filters: {FILTERS}")
+    logger.info(f"Classified as: поиск сотрудника with confidence {4.25:.2f}")
+    logger.info(f"Sending response: {RESPONSE}")
+
+
+def lazy_message(logger: logging.Logger):
+    """Log calls of one message through the queued pipeline."""
+    logging_setup.sample_message()
+    logger.info("Received message: %s", QUERY)
+    logger.info("Processing query: %s", QUERY.lower())
+    logger.info("Rule-based classification: %s with confidence %.2f", "поиск сотрудника", 4.25)
+    logger.info("Searching employees with query: %s", QUERY.lower())
+    for skill in ('python', 'docker'):
+        logger.debug("Found skill: %s", skill)
+    logger.debug("Found department: %s", 'it')
+    logger.debug("Applying filters: %s", FILTERS)
+    logger.info("Classified as: %s with confidence %.2f", "поиск сотрудника", 4.25)
+    logger.info("Sending response: %s", RESPONSE, extra={'chat_id': 1, 'response_length': len(RESPONSE)})
+
+
+def measure(func, logger: logging.Logger, messages: int) -> float:
+    """Microseconds per message spent on the calling thread."""
+    started = time.perf_counter()
+    for _ in range(messages):
+        func(logger)
+    return (time.perf_counter() - started) / messages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as sync_file, \
+            tempfile.TemporaryFile('w+', encoding='utf-8') as queued_file:
+        # Исходная конфигурация: basicConfig с синхронной записью
+        before = logging.getLogger('bench.before')
+        before.propagate = False
+        before.setLevel(logging.INFO)
+        handler = logging.StreamHandler(sync_file)
+        handler.setFormatter(logging.Formatter(logging_setup.TEXT_FORMAT))
+        before.addHandler(handler)
+        results = {'before (sync, eager f-strings)': measure(eager_message, before, args.messages)}
+
+        listener = logging_setup.configure_logging(stream=queued_file)
+        after = logging.getLogger('bench.after')
+        # Очередь ограничена, поэтому даем слушателю догнать запись между прогонами
+        for label, rate in (('after (queued, lazy)', 1.0), ('after (queued, lazy, 10% sampled)', 0.1)):
+            logging_setup.LOG_SAMPLE_RATE = rate
+            results[label] = measure(lazy_message, after, args.messages)
+            while not listener.queue.empty():
+                time.sleep(0.01)
+        logging_setup.stop_logging()
+        dropped = logging_setup.LOG_DROPPED.labels().value
+
+    for label, per_message in results.items():
+        print(f"{label:40s} {per_message:8.1f} µs/message")
+    print(f"{'records dropped (queue full)':40s} {dropped:8.0f}")
+
+
+if __name__ == '__main__':
+    main()
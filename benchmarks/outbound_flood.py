@@ -0,0 +1,110 @@
+"""Load-test outbound delivery against the fake Bot API with flood limits switched on.
+
+Starts ``webhook_replay.FakeBotAPIServer`` in-process with Telegram-like limits,
+then fires replies of mixed sizes (some over 4096 characters) at many chats
+through ``outbound.OutboundSender`` using a real ``telegram.Bot``. Run from the
+repository root::
+
+    python -m benchmarks.outbound_flood --chats 50 --replies 4
+    python -m benchmarks.outbound_flood --unpaced   # no client-side limits, for comparison
+
+Exits with status 1 if any reply was not delivered.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from outbound import OutboundSender, split_message
+from webhook_replay import FakeBotAPIServer
+
+
+def make_reply(rng: random.Random, entries: int) -> str:
+    """A search-style reply: a header and "•" entries with indented detail lines."""
+    lines = ["Найдены следующие задачи:", ""]
+    for number in range(entries):
+        lines.append(f"• #{number} Задача {' '.join(rng.choice(['отчет', 'релиз', 'ревью', 'миграция']) for _ in range(6))}")
+        lines.append(f"  📝 {'Описание задачи. ' * rng.randint(2, 8)}")
+        lines.append(f"  📅 Срок: 2025-06-{rng.randint(1, 28):02d}")
+    return '\n'.join(lines)
+
+
+async def run(args, port: int):
+    rng = random.Random(args.seed)
+    if args.unpaced:
+        sender = OutboundSender(rate=float('inf'), chat_rate=float('inf'), chat_burst=float('inf'),
+                                max_retries=args.max_retries)
+    else:
+        sender = OutboundSender(rate=args.rate, chat_rate=args.chat_rate, chat_burst=args.chat_burst,
+                                max_retries=args.max_retries)
+    replies = [
+        (chat_id, make_reply(rng, rng.choice([3, 10, 60])))
+        for chat_id in range(1, args.chats + 1) for _ in range(args.replies)
+    ]
+    rng.shuffle(replies)
+    parts = sum(len(split_message(text)) for _, text in replies)
+
+    request = HTTPXRequest(connection_pool_size=args.pool_size)
+    bot = Bot('123456:fake', base_url=f'http://127.0.0.1:{port}/bot', request=request)
+    latencies = []
+
+    async def deliver(chat_id, text):
+        started = time.perf_counter()
+        outcome = await sender.deliver(bot, chat_id, text)
+        latencies.append(time.perf_counter() - started)
+        return outcome
+
+    async with bot:
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(deliver(chat_id, text) for chat_id, text in replies))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return replies, parts, outcomes, elapsed, latencies, sender
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--replies', type=int, default=4, help='replies per chat, sent concurrently')
+    parser.add_argument('--rate', type=float, default=28.0, help='client-side messages per second')
+    parser.add_argument('--chat-rate', type=float, default=1.0)
+    parser.add_argument('--chat-burst', type=float, default=3.0)
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--flood-rate', type=float, default=30.0, help='fake API limit, messages per second')
+    parser.add_argument('--flood-chat-rate', type=float, default=1.0)
+    parser.add_argument('--flood-chat-burst', type=float, default=3.0)
+    parser.add_argument('--unpaced', action='store_true', help='send without client-side rate limits')
+    parser.add_argument('--pool-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    server = FakeBotAPIServer(('127.0.0.1', 0), args.flood_rate, args.flood_chat_rate, args.flood_chat_burst)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        replies, parts, outcomes, elapsed, latencies, sender = asyncio.run(run(args, server.server_address[1]))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    delivered = outcomes.count('sent')
+    mode = 'unpaced' if args.unpaced else f"paced at {args.rate:g}/s, {args.chat_rate:g}/s per chat"
+    print(f"{len(replies)} replies to {args.chats} chats as {parts} messages, {mode}")
+    print(f"  delivered replies      {delivered}/{len(replies)}")
+    print(f"  wall time              {elapsed:.2f}s ({server.calls.get('sendMessage', 0) / elapsed:.1f} API calls/s)")
+    print(f"  delivery p50/p95/max   {percentile(0.5):.2f}s / {percentile(0.95):.2f}s / {latencies[-1]:.2f}s")
+    print(f"  API answers            {server.calls.get('sendMessage', 0)} calls, rejected {server.rejected or 'none'}")
+    print(f"  client retries         {sender.retries}")
+    if delivered != len(replies):
+        print("FAIL: some replies were not delivered")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Model fallback rate and rule accuracy of the classifier with and without word normalization.
+
+A query falls back to the model when its best rule score is below 0.3. The corpus is
+the labelled examples of ``intents.category_patterns`` plus inflected queries that the
+patterns do not contain verbatim. Run from the repository root::
+
+    python -m benchmarks.rule_normalization --repeat 200
+"""
+import argparse
+import time
+
+from benchmarks.classifier_quantization import corpus
+from intents import category_scores, preprocess_query
+from morphology import normalize_text, stem
+
+RULE_THRESHOLD = 0.3
+
+INFLECTED = [
+    ("мои задачами на неделю", "информация о задаче"),
+    ("что с задачами отдела", "информация о задаче"),
+    ("дедлайны по задачам", "информация о задаче"),
+    ("задачу по проекту", "информация о задаче"),
+    ("проектами занимаемся", "информация о задаче"),
+    ("сроками сдачи", "информация о задаче"),
+    ("приоритетные задачи", "информация о задаче"),
+    ("что на мероприятиях", "информация о мероприятии"),
+    ("расскажи о мероприятиях", "информация о мероприятии"),
+    ("на встречах сегодня", "информация о мероприятии"),
+    ("о тренингах", "информация о мероприятии"),
+    ("про конференциях", "информация о мероприятии"),
+    ("семинарами", "информация о мероприятии"),
+    ("событиями компании", "информация о мероприятии"),
+    ("дни рождений коллег", "информация о мероприятии"),
+    ("сотрудникам отдела", "поиск сотрудника"),
+    ("с коллегами из маркетинга", "поиск сотрудника"),
+    ("о разработчиках", "поиск сотрудника"),
+    ("тестировщиками", "поиск сотрудника"),
+    ("специалистами по данным", "поиск сотрудника"),
+    ("дизайнерами интерфейсов", "поиск сотрудника"),
+    ("аналитиками", "поиск сотрудника"),
+    ("экспертами по безопасности", "поиск сотрудника"),
+    ("к активностям", "социальные активности"),
+    ("в играх после работы", "социальные активности"),
+    ("о развлечениях", "социальные активности"),
+    ("тренировками по йоге", "социальные активности"),
+    ("на обедах вместе", "социальные активности"),
+    ("с хобби коллег", "социальные активности"),
+    ("здравствуйте всем", "приветствие"),
+    ("о правилах офиса", "общая информация"),
+    ("по документации", "общая информация"),
+    ("о процедурах", "общая информация"),
+    ("оборудованием", "общая информация"),
+]
+
+
+def classify(query: str, normalize: bool):
+    """(category, score) as the rule stage of classify_query decides it."""
+    query = preprocess_query(query)
+    scores = category_scores(query)
+    if normalize:
+        normalized_scores = category_scores(normalize_text(query), normalized=True)
+        scores = {category: max(score, normalized_scores[category]) for category, score in scores.items()}
+    category = max(scores, key=scores.get)
+    return category, scores[category]
+
+
+def report(name: str, samples, normalize: bool):
+    hits = [(classify(text, normalize), label) for text, label in samples]
+    fallback = sum(score < RULE_THRESHOLD for (_, score), _ in hits)
+    correct = sum(category == label for (category, score), label in hits if score >= RULE_THRESHOLD)
+    answered = len(samples) - fallback
+    print(f"{name:30s} {fallback / len(samples):9.1%} {correct / max(answered, 1):14.1%}")
+
+
+def per_query_ms(samples, normalize: bool, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, _ in samples:
+            classify(text, normalize)
+    return (time.perf_counter() - started) / (repeat * len(samples)) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    samples = {'pattern examples': corpus(), 'inflected queries': INFLECTED}
+    print(f"{'corpus':30s} {'fallback':>9s} {'rule accuracy':>14s}")
+    for name, items in samples.items():
+        report(f"{name}, raw", items, normalize=False)
+        report(f"{name}, normalized", items, normalize=True)
+
+    tokens = [word for text, _ in corpus() + INFLECTED for word in preprocess_query(text).split()]
+    stem.cache_clear()
+    started = time.perf_counter()
+    for word in tokens:
+        stem(word)
+    cold = (time.perf_counter() - started) / len(tokens) * 1e6
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for word in tokens:
+            stem(word)
+    warm = (time.perf_counter() - started) / (args.repeat * len(tokens)) * 1e6
+    print(f"\nstem per token: {cold:.1f} µs uncached, {warm:.2f} µs cached ({stem.cache_info().currsize} forms)")
+
+    items = corpus() + INFLECTED
+    raw, normalized = per_query_ms(items, False, args.repeat), per_query_ms(items, True, args.repeat)
+    print(f"rules per query: {raw:.3f} ms raw, {normalized:.3f} ms with normalization (+{normalized - raw:.3f} ms)")
+
+
+if __name__ == '__main__':
+    main()
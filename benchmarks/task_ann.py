@@ -0,0 +1,68 @@
+"""Recall and latency of the IVF task index against brute-force cosine search.
+
+Uses synthetic clustered unit vectors (near-duplicate tasks around shared topics),
+so no model or database is needed. Run from the repository root::
+
+    python -m benchmarks.task_ann --vectors 300000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from semantic_search import normalize, top_k
+from task_index import IVFIndex
+
+
+def make_vectors(count: int, dim: int, topics: int, noise: float, rng) -> np.ndarray:
+    centers = normalize(rng.standard_normal((topics, dim)).astype(np.float32))
+    vectors = centers[rng.integers(0, topics, count)] + noise * rng.standard_normal((count, dim)).astype(np.float32)
+    return normalize(vectors).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--vectors', type=int, default=300000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--topics', type=int, default=5000)
+    parser.add_argument('--noise', type=float, default=0.03, help='per-coordinate noise around topic centers')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--inserts', type=int, default=2000, help='vectors added incrementally after training')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.vectors + args.inserts, args.dim, args.topics, args.noise, rng)
+    queries = normalize(
+        vectors[rng.integers(0, len(vectors), args.queries)]
+        + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    ).astype(np.float32)
+
+    live = np.zeros(len(vectors), dtype=bool)
+    live[:args.vectors] = True
+    started = time.perf_counter()
+    ivf = IVFIndex.train(vectors, live)
+    print(f"trained {len(ivf.centroids)} lists over {args.vectors} vectors in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    for row in range(args.vectors, len(vectors)):
+        ivf.add([row], vectors[row:row + 1])
+    elapsed = time.perf_counter() - started
+    print(f"incremental inserts: {args.inserts / elapsed:.0f}/s ({elapsed / args.inserts * 1e3:.2f} ms each)")
+
+    started = time.perf_counter()
+    exact = [set(top_k(vectors @ query, args.k)) for query in queries]
+    brute = (time.perf_counter() - started) / args.queries * 1e3
+    print(f"{'brute force':>12s}  recall@{args.k} 1.000  {brute:7.2f} ms/query")
+
+    for nprobe in (1, 4, 8, 16, 32):
+        started = time.perf_counter()
+        found = [set(ivf.search(vectors, query, args.k, nprobe=nprobe)[0]) for query in queries]
+        latency = (time.perf_counter() - started) / args.queries * 1e3
+        recall = np.mean([len(a & b) / args.k for a, b in zip(found, exact)])
+        print(f"{'nprobe=' + str(nprobe):>12s}  recall@{args.k} {recall:.3f}  {latency:7.2f} ms/query  "
+              f"({brute / latency:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""In-memory calendar of birthdays, events and activities answered with bisect lookups."""
+import bisect
+import calendar
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+
+from models import Activity, Employee, Event, get_session, register_change_hook
+
+logger = logging.getLogger(__name__)
+
+Birthday = namedtuple('Birthday', 'employee_id name department birthday')
+CalendarEntry = namedtuple(
+    'CalendarEntry', 'kind id name type date time location description participant_count max_participants tags'
+)
+
+
+def day_key(day: date) -> int:
+    """Day of year independent of leap years: month * 100 + day."""
+    return day.month * 100 + day.day
+
+
+def next_occurrence(birthday: date, start: date) -> date:
+    """First date on or after ``start`` the birthday is celebrated (29.02 -> 28.02 in common years)."""
+    for year in (start.year, start.year + 1):
+        day = birthday.day
+        if birthday.month == 2 and day == 29 and not calendar.isleap(year):
+            day = 28
+        occurrence = date(year, birthday.month, day)
+        if occurrence >= start:
+            return occurrence
+    return occurrence
+
+
+class CalendarIndex:
+    """Birthdays sorted by day of year and dated entries sorted by date.
+
+    Both are parallel arrays of sort keys and values, so window queries are two
+    bisects plus a slice; rows are replaced one by one when change hooks fire.
+    """
+
+    def __init__(self, max_age: float = 0.0):
+        # Процессы без хуков изменений (HTTP API) перечитывают индекс не реже раза в max_age секунд
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._birthday_keys: List[int] = []
+        self._birthdays: List[Birthday] = []
+        self._birthday_by_employee: Dict[int, Birthday] = {}
+        self._entry_keys: List[Tuple[int, str, int]] = []
+        self._entries: List[CalendarEntry] = []
+        self._entry_by_id: Dict[Tuple[str, int], CalendarEntry] = {}
+
+    # Загрузка
+    def _select_employees(self, ids=None):
+        query = select(Employee.id, Employee.name, Employee.department, Employee.birthday).where(
+            Employee.birthday.isnot(None)
+        )
+        if ids is not None:
+            query = query.where(Employee.id.in_(ids))
+        return [Birthday(*row) for row in self._execute(query)]
+
+    def _select_entries(self, model, ids=None):
+        kind = 'event' if model is Event else 'activity'
+        query = select(
+            model.id, model.name, model.type, model.date, model.time, model.location,
+            model.description, model.participant_count
+        ).where(model.date.isnot(None))
+        if model is Activity:
+            query = query.add_columns(Activity.max_participants, Activity.tags).where(Activity.is_active.is_(True))
+        if ids is not None:
+            query = query.where(model.id.in_(ids))
+        entries = []
+        for row in self._execute(query):
+            values = tuple(row) + ((None, None) if model is Event else ())
+            entries.append(CalendarEntry(kind, *values))
+        return entries
+
+    @staticmethod
+    def _execute(query):
+        session = get_session()
+        try:
+            return session.execute(query).all()
+        finally:
+            session.close()
+
+    def load(self):
+        """Build the index from the database."""
+        birthdays = self._select_employees()
+        entries = self._select_entries(Event) + self._select_entries(Activity)
+        with self._lock:
+            birthdays.sort(key=lambda item: (day_key(item.birthday), item.employee_id))
+            self._birthdays = birthdays
+            self._birthday_keys = [day_key(item.birthday) for item in birthdays]
+            self._birthday_by_employee = {item.employee_id: item for item in birthdays}
+            entries.sort(key=self._entry_key)
+            self._entries = entries
+            self._entry_keys = [self._entry_key(item) for item in entries]
+            self._entry_by_id = {(item.kind, item.id): item for item in entries}
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+        logger.info("Calendar index loaded: %d birthdays, %d dated entries", len(birthdays), len(entries))
+
+    def ensure_loaded(self):
+        if not self._loaded or (self.max_age and time.monotonic() - self._loaded_at > self.max_age):
+            self.load()
+
+    @staticmethod
+    def _entry_key(entry: CalendarEntry) -> Tuple[int, str, int]:
+        return (entry.date.toordinal(), entry.kind, entry.id)
+
+    # Инкрементальное обновление
+    def update_employees(self, ids: Iterable[int]):
+        """Re-read birthdays of the given employees; missing rows are removed."""
+        if not self._loaded:
+            return
+        ids = set(ids)
+        fresh = self._select_employees(ids)
+        with self._lock:
+            for employee_id in ids:
+                old = self._birthday_by_employee.pop(employee_id, None)
+                if old is not None:
+                    position = self._find(self._birthdays, self._birthday_keys, day_key(old.birthday), old)
+                    del self._birthdays[position]
+                    del self._birthday_keys[position]
+            for item in fresh:
+                key = day_key(item.birthday)
+                # Внутри одного дня порядок по ID, как при полной загрузке
+                position = bisect.bisect_left(self._birthday_keys, key)
+                while position < len(self._birthdays) and self._birthday_keys[position] == key \
+                        and self._birthdays[position].employee_id < item.employee_id:
+                    position += 1
+                self._birthday_keys.insert(position, key)
+                self._birthdays.insert(position, item)
+                self._birthday_by_employee[item.employee_id] = item
+
+    def update_entries(self, model, ids: Iterable[int]):
+        """Re-read events or activities with the given IDs; missing rows are removed."""
+        if not self._loaded:
+            return
+        kind = 'event' if model is Event else 'activity'
+        ids = set(ids)
+        fresh = self._select_entries(model, ids)
+        with self._lock:
+            for entry_id in ids:
+                old = self._entry_by_id.pop((kind, entry_id), None)
+                if old is not None:
+                    position = bisect.bisect_left(self._entry_keys, self._entry_key(old))
+                    del self._entries[position]
+                    del self._entry_keys[position]
+            for item in fresh:
+                key = self._entry_key(item)
+                position = bisect.bisect_left(self._entry_keys, key)
+                self._entry_keys.insert(position, key)
+                self._entries.insert(position, item)
+                self._entry_by_id[(kind, item.id)] = item
+
+    def update_events(self, ids: Iterable[int]):
+        self.update_entries(Event, ids)
+
+    def update_activities(self, ids: Iterable[int]):
+        self.update_entries(Activity, ids)
+
+    @staticmethod
+    def _find(values, keys, key, value) -> int:
+        position = bisect.bisect_left(keys, key)
+        while values[position] is not value:
+            position += 1
+        return position
+
+    # Запросы
+    def birthdays_between(self, start: date, end: date) -> List[Tuple[date, Birthday]]:
+        """Birthdays celebrated in [start, end], ordered by date; windows may cross New Year."""
+        self.ensure_loaded()
+        if end < start:
+            return []
+        with self._lock:
+            if (end - start).days >= 365:
+                found = list(self._birthdays)
+            else:
+                low, high = day_key(start), day_key(end)
+                if low <= high:
+                    found = self._birthdays[bisect.bisect_left(self._birthday_keys, low):
+                                            bisect.bisect_right(self._birthday_keys, high)]
+                else:
+                    # Окно через Новый год: хвост года и начало следующего
+                    found = self._birthdays[bisect.bisect_left(self._birthday_keys, low):] + \
+                        self._birthdays[:bisect.bisect_right(self._birthday_keys, high)]
+        result = [(next_occurrence(item.birthday, start), item) for item in found]
+        return sorted((item for item in result if item[0] <= end), key=lambda item: (item[0], item[1].name))
+
+    def birthday_of(self, employee_id: int):
+        self.ensure_loaded()
+        return self._birthday_by_employee.get(employee_id)
+
+    def entries_between(self, start: date, end: date, kinds: Tuple[str, ...] = ('event', 'activity')) -> List[CalendarEntry]:
+        """Events and activities dated within [start, end], ordered by date."""
+        self.ensure_loaded()
+        with self._lock:
+            found = self._entries[bisect.bisect_left(self._entry_keys, (start.toordinal(),)):
+                                  bisect.bisect_left(self._entry_keys, ((end + timedelta(days=1)).toordinal(),))]
+        return [entry for entry in found if entry.kind in kinds]
+
+
+calendar_index = CalendarIndex()
+
+register_change_hook(Employee, calendar_index.update_employees)
+register_change_hook(Event, calendar_index.update_events)
+register_change_hook(Activity, calendar_index.update_activities)
@@ -0,0 +1,233 @@
+"""Daily digest: computed once per day with set-based queries and fanned out to subscribed chats."""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from datetime import time as dt_time
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, extract, func, or_, select
+import metrics
+import outbound
+from admission import TokenBucket
+from models import Activity, DigestSubscription, Employee, Event, Task, TaskStatus, get_session
+
+logger = logging.getLogger(__name__)
+
+# Local time the digest is sent at, HH:MM
+DIGEST_TIME = os.getenv('DIGEST_TIME', '09:00')
+DIGEST_TIMEZONE = os.getenv('DIGEST_TIMEZONE', 'Europe/Moscow')
+# Share of the outbound rate (OUTBOUND_RATE) the digest may take; the rest stays for replies
+DIGEST_SEND_RATE = float(os.getenv('DIGEST_SEND_RATE', '20'))
+DIGEST_SEND_WORKERS = int(os.getenv('DIGEST_SEND_WORKERS', '4'))
+# Longest task list shown in one digest
+DIGEST_MAX_TASKS = 20
+
+DIGEST_SECONDS = metrics.histogram('bot_digest_seconds', 'Time spent computing and sending the daily digest', ['phase'])
+DIGEST_MESSAGES = metrics.counter('bot_digest_messages_total', 'Digest messages by delivery outcome', ['outcome'])
+
+
+def digest_time() -> dt_time:
+    """DIGEST_TIME as a timezone-aware time for JobQueue.run_daily."""
+    hour, minute = (int(part) for part in DIGEST_TIME.split(':'))
+    return dt_time(hour, minute, tzinfo=ZoneInfo(DIGEST_TIMEZONE))
+
+
+def subscribe(session, chat_id: int, employee_id: Optional[int] = None, department: Optional[str] = None):
+    """Create or replace the subscription of a chat."""
+    subscription = session.query(DigestSubscription).filter(DigestSubscription.chat_id == chat_id).first()
+    if subscription is None:
+        subscription = DigestSubscription(chat_id=chat_id)
+        session.add(subscription)
+    subscription.employee_id = employee_id
+    subscription.department = department
+    return subscription
+
+
+def unsubscribe(session, chat_ids: List[int]) -> int:
+    """Remove subscriptions of the given chats; returns the number removed."""
+    if not chat_ids:
+        return 0
+    return session.execute(
+        delete(DigestSubscription).where(DigestSubscription.chat_id.in_(chat_ids))
+    ).rowcount
+
+
+def _format_tasks(tasks: List, today: date, with_assignee: bool) -> str:
+    text = ""
+    for task in tasks[:DIGEST_MAX_TASKS]:
+        overdue = " (просрочено)" if task.deadline < today else ""
+        assignee = f" - {task.assignee}" if with_assignee and task.assignee else ""
+        text += f"• #{task.id} {task.title} [{task.status.value}] до {task.deadline.strftime('%d.%m')}{overdue}{assignee}\n"
+    if len(tasks) > DIGEST_MAX_TASKS:
+        text += f"• … и еще {len(tasks) - DIGEST_MAX_TASKS}\n"
+    return text
+
+
+def compute_digests(session, today: date) -> List[Tuple[int, str]]:
+    """Build (chat_id, text) pairs for all subscriptions with five queries in total."""
+    # Для личной подписки отдел берется из карточки сотрудника
+    subscriptions = session.execute(
+        select(
+            DigestSubscription.chat_id, DigestSubscription.employee_id,
+            func.coalesce(DigestSubscription.department, Employee.department)
+        ).outerjoin(Employee, DigestSubscription.employee_id == Employee.id)
+    ).all()
+    if not subscriptions:
+        return []
+    employee_ids = select(DigestSubscription.employee_id).where(DigestSubscription.employee_id.isnot(None))
+    departments = select(DigestSubscription.department).where(DigestSubscription.department.isnot(None))
+
+    # Открытые задачи с дедлайном сегодня или раньше - только подписчиков и их отделов
+    tasks = session.execute(
+        select(
+            Task.id, Task.title, Task.status, Task.deadline, Task.assignee_id,
+            Employee.name.label('assignee'), Employee.department
+        )
+        .join(Employee, Task.assignee_id == Employee.id)
+        .where(
+            Task.deadline <= today,
+            Task.status != TaskStatus.DONE,
+            or_(Task.assignee_id.in_(employee_ids), Employee.department.in_(departments))
+        )
+        .order_by(Task.deadline, Task.id)
+    ).all()
+    birthdays = session.execute(
+        select(Employee.name, Employee.department).where(
+            extract('month', Employee.birthday) == today.month,
+            extract('day', Employee.birthday) == today.day
+        ).order_by(Employee.name)
+    ).all()
+    events = session.execute(
+        select(Event.name, Event.time, Event.location).where(Event.date == today).order_by(Event.time)
+    ).all()
+    activities = session.execute(
+        select(Activity.name, Activity.time, Activity.location, Activity.participant_count, Activity.max_participants)
+        .where(Activity.date == today, Activity.is_active.is_(True))
+        .order_by(Activity.time)
+    ).all()
+
+    tasks_by_employee = defaultdict(list)
+    tasks_by_department = defaultdict(list)
+    for task in tasks:
+        tasks_by_employee[task.assignee_id].append(task)
+        tasks_by_department[(task.department or '').lower()].append(task)
+    birthdays_by_department = defaultdict(list)
+    for person in birthdays:
+        birthdays_by_department[(person.department or '').lower()].append(person.name)
+
+    # Общая часть одинакова для всех подписчиков
+    common = ""
+    if events:
+        common += "\n📅 Мероприятия сегодня:\n"
+        for item in events:
+            common += f"• {item.name}" + (f" в {item.time.strftime('%H:%M')}" if item.time else "") + (f", {item.location}" if item.location else "") + "\n"
+    if activities:
+        common += "\n🎮 Активности сегодня:\n"
+        for item in activities:
+            seats = f" ({item.participant_count}/{item.max_participants})" if item.max_participants else ""
+            common += f"• {item.name}" + (f" в {item.time.strftime('%H:%M')}" if item.time else "") + f"{seats}\n"
+
+    # Текст строится один раз на сотрудника/отдел, даже если подписано несколько чатов
+    rendered: Dict[Tuple[str, str], Optional[str]] = {}
+    messages = []
+    for chat_id, employee_id, department in subscriptions:
+        if employee_id is not None:
+            key = ('employee', employee_id)
+        elif department:
+            key = ('department', department.lower())
+        else:
+            continue
+        if key not in rendered:
+            if key[0] == 'employee':
+                own_tasks = tasks_by_employee.get(employee_id, [])
+                header = "✅ Ваши задачи с дедлайном:\n"
+            else:
+                own_tasks = tasks_by_department.get(key[1], [])
+                header = f"✅ Задачи отдела {department} с дедлайном:\n"
+            body = ""
+            if own_tasks:
+                body += header + _format_tasks(own_tasks, today, with_assignee=key[0] == 'department')
+            names = birthdays_by_department.get((department or '').lower())
+            if names:
+                body += "\n🎂 День рождения: " + ", ".join(names) + "\n"
+            body += common
+            rendered[key] = f"☀️ Дайджест на {today.strftime('%d.%m.%Y')}\n\n{body.lstrip()}" if body else None
+        if rendered[key]:
+            messages.append((chat_id, rendered[key]))
+        else:
+            DIGEST_MESSAGES.labels('empty').inc()
+    return messages
+
+
+def build_digests(today: Optional[date] = None) -> List[Tuple[int, str]]:
+    session = get_session()
+    try:
+        return compute_digests(session, today or datetime.now(ZoneInfo(DIGEST_TIMEZONE)).date())
+    finally:
+        session.close()
+
+
+async def _send_one(bot, bucket: TokenBucket, chat_id: int, text: str) -> str:
+    # Бакет дайджеста ограничивает его долю; общие лимиты, 429 и повторы - в outbound
+    while not bucket.try_take():
+        await asyncio.sleep(bucket.delay())
+    return await outbound.sender.deliver(bot, chat_id, text)
+
+
+async def send_digests(bot, messages: List[Tuple[int, str]]) -> Dict[str, int]:
+    """Send messages through a rate-limited queue served by a few workers."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    bucket = TokenBucket(DIGEST_SEND_RATE, DIGEST_SEND_RATE)
+    outcomes = defaultdict(int)
+    blocked = []
+
+    async def worker():
+        while True:
+            try:
+                chat_id, text = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            outcome = await _send_one(bot, bucket, chat_id, text)
+            outcomes[outcome] += 1
+            DIGEST_MESSAGES.labels(outcome).inc()
+            if outcome == 'blocked':
+                blocked.append(chat_id)
+
+    await asyncio.gather(*(worker() for _ in range(min(DIGEST_SEND_WORKERS, len(messages)))))
+
+    if blocked:
+        # Чаты, заблокировавшие бота, больше не получают дайджест
+        session = get_session()
+        try:
+            unsubscribe(session, blocked)
+            session.commit()
+        finally:
+            session.close()
+    return dict(outcomes)
+
+
+async def digest_job(context):
+    """JobQueue callback: compute all digests once, then fan them out."""
+    started = time.perf_counter()
+    try:
+        messages = await asyncio.to_thread(build_digests)
+    except Exception as e:
+        logger.error(f"Error computing digest: {e}")
+        metrics.ERRORS.labels('digest').inc()
+        return
+    computed = time.perf_counter()
+    DIGEST_SECONDS.labels('compute').observe(computed - started)
+
+    outcomes = await send_digests(context.bot, messages)
+    elapsed = time.perf_counter() - computed
+    DIGEST_SECONDS.labels('send').observe(elapsed)
+    logger.info(
+        "Digest: %d messages computed in %.2fs, sent in %.2fs (%.1f msg/s): %s",
+        len(messages), computed - started, elapsed, len(messages) / elapsed if elapsed else 0.0, outcomes
+    )
@@ -0,0 +1,230 @@
+"""Streaming export of tasks, events and activities to CSV, JSONL or columnar CSV."""
+import csv
+import enum
+import io
+import json
+import logging
+import tempfile
+from datetime import date, datetime, time
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, exists, select
+
+from models import Activity, Employee, Event, Task, TaskStatus, activity_participants, event_participants, get_session
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ENTITIES = ('tasks', 'events', 'activities')
+EXPORT_FORMATS = ('csv', 'jsonl', 'columnar')
+# Rows fetched from the server-side cursor at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def _task_query(status=None, date_from=None, date_to=None, department=None, assignee=None):
+    query = select(
+        Task.id, Task.title, Task.description, Task.status, Task.priority, Task.deadline, Task.tags,
+        Employee.name.label('assignee'), Employee.department, Task.created_at, Task.updated_at
+    ).outerjoin(Employee, Task.assignee_id == Employee.id)
+    if status:
+        query = query.where(Task.status == status)
+    if date_from:
+        query = query.where(Task.deadline >= date_from)
+    if date_to:
+        query = query.where(Task.deadline <= date_to)
+    if department:
+        query = query.where(Employee.department.ilike(department))
+    if assignee:
+        query = query.where(Employee.name.ilike(f'%{assignee}%'))
+    return query.order_by(Task.id)
+
+
+def _participant_filter(association, key, model, department, assignee):
+    # Мероприятие подходит, если среди участников есть сотрудник отдела / с таким именем
+    conditions = [key == model.id, association.c.employee_id == Employee.id]
+    if department:
+        conditions.append(Employee.department.ilike(department))
+    if assignee:
+        conditions.append(Employee.name.ilike(f'%{assignee}%'))
+    return exists().where(and_(*conditions))
+
+
+def _event_query(status=None, date_from=None, date_to=None, department=None, assignee=None):
+    query = select(
+        Event.id, Event.name, Event.type, Event.date, Event.time, Event.location,
+        Event.description, Event.participant_count
+    )
+    if date_from:
+        query = query.where(Event.date >= date_from)
+    if date_to:
+        query = query.where(Event.date <= date_to)
+    if department or assignee:
+        query = query.where(_participant_filter(
+            event_participants, event_participants.c.event_id, Event, department, assignee
+        ))
+    return query.order_by(Event.id)
+
+
+def _activity_query(status=None, date_from=None, date_to=None, department=None, assignee=None):
+    query = select(
+        Activity.id, Activity.name, Activity.type, Activity.date, Activity.time, Activity.location,
+        Activity.description, Activity.max_participants, Activity.participant_count,
+        Activity.is_active, Activity.tags
+    )
+    if status:
+        query = query.where(Activity.is_active == (status == 'active'))
+    if date_from:
+        query = query.where(Activity.date >= date_from)
+    if date_to:
+        query = query.where(Activity.date <= date_to)
+    if department or assignee:
+        query = query.where(_participant_filter(
+            activity_participants, activity_participants.c.activity_id, Activity, department, assignee
+        ))
+    return query.order_by(Activity.id)
+
+
+_QUERIES = {
+    'tasks': _task_query,
+    'events': _event_query,
+    'activities': _activity_query,
+}
+
+
+def parse_status(entity: str, value: Optional[str]):
+    """Task statuses by name or value; activities accept active/inactive."""
+    if not value:
+        return None
+    value = value.strip().lower().replace('_', ' ')
+    if entity == 'tasks':
+        for status in TaskStatus:
+            if value in (status.name.lower().replace('_', ' '), status.value):
+                return status
+        raise ValueError(f"unknown task status: {value}")
+    if entity == 'activities':
+        if value in ('active', 'inactive'):
+            return value
+        raise ValueError("activity status must be active or inactive")
+    raise ValueError(f"{entity} have no status")
+
+
+def plain_value(value):
+    """JSON/CSV-friendly value: enums by value, dates and times in ISO format."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(session, entity: str, **filters) -> Tuple[List[str], Iterator[Tuple]]:
+    """Column names and a row iterator backed by a server-side cursor."""
+    query = _QUERIES[entity](**filters)
+    result = session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    columns = list(result.keys())
+    return columns, (tuple(plain_value(value) for value in row) for row in result)
+
+
+def _write_csv(columns, rows, out: IO[str]) -> int:
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow('' if value is None else value for value in row)
+        count += 1
+    return count
+
+
+def _write_jsonl(columns, rows, out: IO[str]) -> int:
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        out.write('\n')
+        count += 1
+    return count
+
+
+def _write_columnar(columns, rows, out: IO[str]) -> int:
+    """One CSV line per column: the name followed by all its values."""
+    # Каждая колонка накапливается во временном файле, поэтому память не растет с числом строк
+    spools = [tempfile.TemporaryFile('w+', encoding='utf-8', newline='') for _ in columns]
+    try:
+        writers = [csv.writer(spool, lineterminator='') for spool in spools]
+        count = 0
+        for row in rows:
+            for writer, spool, value in zip(writers, spools, row):
+                spool.write(',')
+                writer.writerow(['' if value is None else value])
+            count += 1
+        for column, spool in zip(columns, spools):
+            csv.writer(out, lineterminator='').writerow([column])
+            spool.seek(0)
+            while True:
+                chunk = spool.read(64 * 1024)
+                if not chunk:
+                    break
+                out.write(chunk)
+            out.write('\n')
+        return count
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+_WRITERS = {
+    'csv': _write_csv,
+    'jsonl': _write_jsonl,
+    'columnar': _write_columnar,
+}
+
+
+def export(entity: str, file_format: str, out: IO[bytes], **filters) -> int:
+    """Write the export to a binary file object and return the number of rows."""
+    if entity not in _QUERIES:
+        raise ValueError(f"unknown entity: {entity}")
+    if file_format not in _WRITERS:
+        raise ValueError(f"unknown format: {file_format}")
+    filters['status'] = parse_status(entity, filters.get('status'))
+    session = get_session()
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=False)
+    try:
+        columns, rows = stream_rows(session, entity, **filters)
+        count = _WRITERS[file_format](columns, rows, text)
+        text.flush()
+    finally:
+        # Не закрываем out вместе с оберткой
+        text.detach()
+        session.close()
+    logger.info("Exported %d %s as %s", count, entity, file_format)
+    return count
+
+
+def export_filename(entity: str, file_format: str) -> str:
+    extension = 'jsonl' if file_format == 'jsonl' else 'csv'
+    suffix = '_columnar' if file_format == 'columnar' else ''
+    return f"{entity}_{datetime.now():%Y%m%d}{suffix}.{extension}"
+
+
+def parse_export_args(args: List[str]) -> Tuple[str, str, Dict]:
+    """Parse "/export tasks csv status=todo from=2025-05-01 to=2025-05-31 dept=IT assignee=Иван"."""
+    if not args or args[0] not in EXPORT_ENTITIES:
+        raise ValueError(f"entity must be one of: {', '.join(EXPORT_ENTITIES)}")
+    entity = args[0]
+    file_format = 'csv'
+    filters = {}
+    keys = {
+        'status': 'status', 'from': 'date_from', 'to': 'date_to',
+        'dept': 'department', 'department': 'department', 'assignee': 'assignee'
+    }
+    for arg in args[1:]:
+        if '=' not in arg:
+            if arg not in EXPORT_FORMATS:
+                raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+            file_format = arg
+            continue
+        key, value = arg.split('=', 1)
+        if key not in keys:
+            raise ValueError(f"unknown filter: {key}")
+        if key in ('from', 'to'):
+            value = datetime.strptime(value, '%Y-%m-%d').date()
+        filters[keys[key]] = value
+    return entity, file_format, filters
@@ -0,0 +1,22 @@
+"""Gunicorn settings for the search API (``gunicorn -c gunicorn.conf.py api:app``)."""
+import os
+
+bind = os.getenv('API_BIND', '127.0.0.1:8000')
+workers = int(os.getenv('API_WORKERS', '4'))
+threads = int(os.getenv('API_THREADS', '2'))
+timeout = int(os.getenv('API_TIMEOUT', '30'))
+
+# Import the app in the master before forking: the normalized vocabularies and the
+# calendar index are built once and shared by the workers copy-on-write
+preload_app = True
+
+
+def on_starting(server):
+    from calendar_index import calendar_index
+    calendar_index.ensure_loaded()
+
+
+def post_fork(server, worker):
+    # Соединения пула, открытые мастером, нельзя делить между процессами
+    from models import engine
+    engine.dispose(close=False)
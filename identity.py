@@ -0,0 +1,129 @@
+"""Telegram user -> employee bindings with an in-process LRU cache in front of the table."""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+import metrics
+from models import BindingRequest, TelegramIdentity
+
+logger = logging.getLogger(__name__)
+
+# Telegram users whose binding (or its absence) is kept in memory
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', '10000'))
+# Telegram user IDs allowed to approve bindings, comma-separated
+BOT_ADMIN_IDS = frozenset(int(item) for item in os.getenv('BOT_ADMIN_IDS', '').replace(' ', '').split(',') if item)
+
+LOOKUPS = metrics.counter('bot_identity_lookups_total', 'Telegram user to employee lookups', ['result'])
+
+
+class IdentityCache:
+    """LRU of telegram_user_id -> employee_id; unbound users are cached as None.
+
+    Bindings change only through ``bind``/``unbind`` in this process, so the
+    handlers update the cache right after committing them.
+    """
+
+    def __init__(self, max_size: int = IDENTITY_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Optional[int]]" = OrderedDict()
+
+    def employee_id(self, session, telegram_user_id: int) -> Optional[int]:
+        with self._lock:
+            if telegram_user_id in self._entries:
+                self._entries.move_to_end(telegram_user_id)
+                LOOKUPS.labels('hit').inc()
+                return self._entries[telegram_user_id]
+        LOOKUPS.labels('miss').inc()
+        employee_id = session.execute(
+            select(TelegramIdentity.employee_id).where(TelegramIdentity.telegram_user_id == telegram_user_id)
+        ).scalar()
+        self.remember(telegram_user_id, employee_id)
+        return employee_id
+
+    def remember(self, telegram_user_id: int, employee_id: Optional[int]):
+        with self._lock:
+            self._entries[telegram_user_id] = employee_id
+            self._entries.move_to_end(telegram_user_id)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def forget(self, telegram_user_id: int):
+        with self._lock:
+            self._entries.pop(telegram_user_id, None)
+
+
+def bind(session, telegram_user_id: int, employee_id: int) -> str:
+    """Bind the Telegram user to the employee: "bound", or "taken" if another account holds the employee."""
+    holder = session.execute(
+        select(TelegramIdentity.telegram_user_id).where(TelegramIdentity.employee_id == employee_id)
+    ).scalar()
+    if holder is not None and holder != telegram_user_id:
+        return "taken"
+    identity = session.query(TelegramIdentity).filter(TelegramIdentity.telegram_user_id == telegram_user_id).first()
+    if identity is None:
+        identity = TelegramIdentity(telegram_user_id=telegram_user_id)
+        session.add(identity)
+    identity.employee_id = employee_id
+    return "bound"
+
+
+def is_admin(telegram_user_id: int) -> bool:
+    return telegram_user_id in BOT_ADMIN_IDS
+
+
+def request_binding(session, telegram_user_id: int, chat_id: int,
+                    employee_id: int) -> Tuple[str, Optional[BindingRequest]]:
+    """File a binding request for an administrator to approve.
+
+    Returns "pending" with the request, "bound" if the account already holds the
+    employee, or "taken" if another account does.
+    """
+    holder = session.execute(
+        select(TelegramIdentity.telegram_user_id).where(TelegramIdentity.employee_id == employee_id)
+    ).scalar()
+    if holder == telegram_user_id:
+        return "bound", None
+    if holder is not None:
+        return "taken", None
+    # Новая заявка заменяет прежнюю заявку этого аккаунта
+    request = session.query(BindingRequest).filter(BindingRequest.telegram_user_id == telegram_user_id).first()
+    if request is None:
+        request = BindingRequest(telegram_user_id=telegram_user_id)
+        session.add(request)
+    request.chat_id = chat_id
+    request.employee_id = employee_id
+    session.flush()
+    return "pending", request
+
+
+def approve(session, request_id: int) -> Tuple[str, Optional[BindingRequest]]:
+    """Turn a request into a binding: "bound", "taken" or "missing"; the request is removed unless missing."""
+    request = session.get(BindingRequest, request_id)
+    if request is None:
+        return "missing", None
+    session.delete(request)
+    return bind(session, request.telegram_user_id, request.employee_id), request
+
+
+def reject(session, request_id: int) -> Optional[BindingRequest]:
+    """Remove a request without binding; returns it, or None if there was none."""
+    request = session.get(BindingRequest, request_id)
+    if request is not None:
+        session.delete(request)
+    return request
+
+
+def unbind(session, telegram_user_id: int) -> int:
+    """Remove the binding and any pending request of the Telegram user; returns the number of rows removed."""
+    session.execute(delete(BindingRequest).where(BindingRequest.telegram_user_id == telegram_user_id))
+    return session.execute(
+        delete(TelegramIdentity).where(TelegramIdentity.telegram_user_id == telegram_user_id)
+    ).rowcount
+
+
+identities = IdentityCache()
@@ -0,0 +1,153 @@
+"""Streaming import of employees from CSV/JSONL exports with batched upserts keyed by email."""
+import csv
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Employee, get_session
+
+logger = logging.getLogger(__name__)
+
+# Columns that may be imported; everything else in the export is ignored
+EMPLOYEE_FIELDS = ('name', 'position', 'department', 'email', 'phone', 'hire_date', 'birthday', 'skills', 'interests', 'bio')
+DATE_FIELDS = ('hire_date', 'birthday')
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def parse_import_date(value: str):
+    """Parse an ISO or dd.mm.yyyy date; empty values become None."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"unsupported date: {value}")
+
+
+def read_records(path: str, file_format: Optional[str] = None) -> Iterator[Dict]:
+    """Yield raw records one by one from a CSV or JSONL file."""
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+        elif file_format == 'jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f"unsupported format: {file_format}")
+
+
+def normalize_record(record: Dict) -> Optional[Dict]:
+    """Keep known fields present in the record, parse dates; records without name or email are rejected."""
+    row = {}
+    for field in EMPLOYEE_FIELDS:
+        # Отсутствующая колонка не трогает поле, пустое значение очищает его
+        if field not in record:
+            continue
+        value = record[field]
+        if isinstance(value, str):
+            value = value.strip() or None
+        row[field] = value
+    if not row.get('name') or not row.get('email'):
+        return None
+    row['email'] = row['email'].lower()
+    for field in DATE_FIELDS:
+        if isinstance(row.get(field), str):
+            row[field] = parse_import_date(row[field])
+    return row
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def upsert_employees(session, rows: List[Dict]) -> List[int]:
+    """Insert or update a batch of employees keyed by email; returns affected IDs.
+
+    Only the fields a row carries are written, so a partial export does not
+    clear the columns it lacks. ``updated_at`` is always set, so the running
+    bot picks the rows up for its indexes.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect not in _UPSERT_DIALECTS:
+        raise ValueError(f"upsert is not supported for {dialect}")
+    # ON CONFLICT не может изменить одну строку дважды за запрос - оставляем последнюю запись
+    rows = list({row['email']: row for row in rows}.values())
+    # Один запрос на набор колонок: у CSV он общий, в JSONL может отличаться от строки к строке
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(field for field in EMPLOYEE_FIELDS if field in row)].append(row)
+    now = datetime.now()
+    ids = []
+    for fields, group in groups.items():
+        statement = _UPSERT_DIALECTS[dialect](Employee)
+        set_ = {field: statement.excluded[field] for field in fields if field != 'email'}
+        set_['updated_at'] = statement.excluded.updated_at
+        statement = statement.on_conflict_do_update(
+            index_elements=[Employee.email], set_=set_
+        ).returning(Employee.id)
+        ids.extend(session.execute(statement, [{**row, 'updated_at': now} for row in group]).scalars().all())
+    return ids
+
+
+def import_employees(path: str, file_format: Optional[str] = None, batch_size: int = 1000,
+                     progress_every: int = 10000) -> Dict:
+    """Stream an export into the employees table; memory use is bounded by the batch size."""
+    stats = {'read': 0, 'upserted': 0, 'skipped': 0, 'batches': 0}
+    started = time.perf_counter()
+    next_progress = progress_every
+    session = get_session()
+    try:
+        for batch in batched(read_records(path, file_format), batch_size):
+            rows = []
+            for number, record in enumerate(batch, stats['read'] + 1):
+                try:
+                    row = normalize_record(record)
+                except ValueError as e:
+                    logger.warning("Skipping record %s: %s", number, e)
+                    row = None
+                if row is None:
+                    stats['skipped'] += 1
+                else:
+                    rows.append(row)
+            stats['read'] += len(batch)
+            if rows:
+                ids = upsert_employees(session, rows)
+                session.commit()
+                # Индексы бота обновятся по updated_at: этот процесс их не держит
+                stats['upserted'] += len(ids)
+            stats['batches'] += 1
+
+            if stats['read'] >= next_progress:
+                elapsed = time.perf_counter() - started
+                logger.info("Imported %d rows (%.0f rows/s)", stats['read'], stats['read'] / elapsed)
+                next_progress += progress_every
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_second'] = round(stats['read'] / stats['seconds'], 1) if stats['seconds'] else 0.0
+    return stats
@@ -0,0 +1,214 @@
+"""Loading of the zero-shot classifier used when the rule-based scores are too low.
+
+Backends (CLASSIFIER_BACKEND):
+
+* ``pipeline`` - the transformers zero-shot-classification pipeline;
+* ``torchscript`` - the NLI model traced once and saved with torch.jit;
+* ``onnx`` - the NLI model exported once to ONNX and run with onnxruntime on CPU;
+* ``sidecar`` - no local model: requests go to ``inference_server.py`` over a Unix socket.
+
+The exported backends reproduce the pipeline scoring: one premise/hypothesis pair
+per candidate label, softmax over the entailment logits.
+"""
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_MODEL = os.getenv('CLASSIFIER_MODEL', 'facebook/bart-large-mnli')
+CLASSIFIER_BACKEND = os.getenv('CLASSIFIER_BACKEND', 'pipeline').lower()
+# "int8" applies dynamic quantization to the linear layers (CPU only); empty keeps fp32
+CLASSIFIER_QUANTIZE = os.getenv('CLASSIFIER_QUANTIZE', '').lower()
+# Exported models are cached here and reused on the next start
+CLASSIFIER_CACHE_DIR = os.getenv('CLASSIFIER_CACHE_DIR', 'model_cache')
+# Same default as the transformers zero-shot pipeline
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+# Backends that load the model into this process
+LOCAL_BACKENDS = ('pipeline', 'torchscript', 'onnx')
+BACKENDS = LOCAL_BACKENDS + ('sidecar',)
+
+
+def default_device() -> int:
+    return 0 if os.environ.get("CUDA_VISIBLE_DEVICES") else -1
+
+
+def quantize_int8(model):
+    """Replace nn.Linear weights with int8; activations are quantized on the fly per batch."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def entailment_id(label2id: Dict[str, int]) -> int:
+    """Index of the entailment logit, found the same way as the pipeline does."""
+    for label, index in label2id.items():
+        if label.lower().startswith('entail'):
+            return index
+    return -1
+
+
+class ZeroShotClassifier:
+    """Pipeline-compatible zero-shot classification over an exported NLI model.
+
+    ``run(input_ids, attention_mask)`` takes int64 NumPy arrays and returns the logits.
+    """
+
+    def __init__(self, tokenizer, run: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                 label2id: Dict[str, int], hypothesis_template: str = HYPOTHESIS_TEMPLATE):
+        self.tokenizer = tokenizer
+        self.run = run
+        self.entailment_id = entailment_id(label2id)
+        self.hypothesis_template = hypothesis_template
+
+    def __call__(self, sequences: Union[str, List[str]], candidate_labels: List[str],
+                 batch_size: Optional[int] = None) -> Union[Dict, List[Dict]]:
+        """Classify one sequence, or a list of them in a single model call (a list of results).
+
+        ``batch_size`` is accepted for pipeline compatibility; the whole list is always one batch.
+        """
+        batch = [sequences] if isinstance(sequences, str) else list(sequences)
+        # Все гипотезы всех последовательностей идут одним батчем, как в пайплайне
+        encoded = self.tokenizer(
+            [sequence for sequence in batch for _ in candidate_labels],
+            [self.hypothesis_template.format(label) for _ in batch for label in candidate_labels],
+            padding=True, truncation='only_first', return_tensors='np'
+        )
+        logits = self.run(encoded['input_ids'].astype(np.int64), encoded['attention_mask'].astype(np.int64))
+        entail = logits[:, self.entailment_id].astype(np.float64).reshape(len(batch), len(candidate_labels))
+        scores = np.exp(entail - entail.max(axis=1, keepdims=True))
+        scores /= scores.sum(axis=1, keepdims=True)
+        results = []
+        for sequence, row in zip(batch, scores):
+            order = np.argsort(-row)
+            results.append({
+                'sequence': sequence,
+                'labels': [candidate_labels[i] for i in order],
+                'scores': [float(row[i]) for i in order]
+            })
+        return results[0] if isinstance(sequences, str) else results
+
+
+def _artifact_path(model_name: str, backend: str, quantize: str) -> str:
+    suffix = '-int8' if quantize == 'int8' else ''
+    extension = 'onnx' if backend == 'onnx' else 'pt'
+    return os.path.join(CLASSIFIER_CACHE_DIR, model_name.replace('/', '--'), f"{backend}{suffix}.{extension}")
+
+
+def _example_inputs(tokenizer):
+    encoded = tokenizer(
+        ["пример запроса", "ещё один пример"], ["This example is a test.", "This example is a test."],
+        padding=True, return_tensors='pt'
+    )
+    return encoded['input_ids'], encoded['attention_mask']
+
+
+def _export_torchscript(model_name: str, tokenizer, path: str, quantize: str):
+    import torch
+    from transformers import AutoModelForSequenceClassification
+    model = AutoModelForSequenceClassification.from_pretrained(model_name, torchscript=True).eval()
+    if quantize == 'int8':
+        model = quantize_int8(model)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, _example_inputs(tokenizer), strict=False)
+    # Пишем во временный файл, чтобы не оставить половину артефакта при сбое
+    torch.jit.save(traced, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def _export_onnx(model_name: str, tokenizer, path: str, quantize: str):
+    import torch
+    from transformers import AutoModelForSequenceClassification
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    model.config.return_dict = False
+    fp32_path = path.replace('-int8', '') if quantize == 'int8' else path
+    if not os.path.exists(fp32_path):
+        with torch.no_grad():
+            torch.onnx.export(
+                model, _example_inputs(tokenizer), fp32_path + '.tmp',
+                input_names=['input_ids', 'attention_mask'], output_names=['logits'],
+                dynamic_axes={
+                    'input_ids': {0: 'batch', 1: 'sequence'},
+                    'attention_mask': {0: 'batch', 1: 'sequence'},
+                    'logits': {0: 'batch'}
+                },
+                opset_version=14
+            )
+        os.replace(fp32_path + '.tmp', fp32_path)
+    if quantize == 'int8':
+        # Квантизованный torch-модуль в ONNX не экспортируется - квантизуем уже готовый граф
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, path + '.tmp', weight_type=QuantType.QInt8)
+        os.replace(path + '.tmp', path)
+
+
+def _load_torchscript(path: str):
+    import torch
+    module = torch.jit.load(path).eval()
+
+    def run(input_ids, attention_mask):
+        with torch.inference_mode():
+            return module(torch.from_numpy(input_ids), torch.from_numpy(attention_mask))[0].numpy()
+    return run
+
+
+def _load_onnx(path: str):
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise RuntimeError("CLASSIFIER_BACKEND=onnx requires the onnxruntime package") from e
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def run(input_ids, attention_mask):
+        return session.run(['logits'], {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+    return run
+
+
+_EXPORTERS = {
+    'torchscript': (_export_torchscript, _load_torchscript),
+    'onnx': (_export_onnx, _load_onnx),
+}
+
+
+def load_classifier(model_name: str = CLASSIFIER_MODEL, quantize: str = CLASSIFIER_QUANTIZE, device: int = None,
+                    backend: str = CLASSIFIER_BACKEND):
+    """Build the configured zero-shot classifier; exported backends are created on first use."""
+    if quantize not in ('', 'int8'):
+        raise ValueError(f"unsupported CLASSIFIER_QUANTIZE: {quantize}")
+    if backend not in BACKENDS:
+        raise ValueError(f"unsupported CLASSIFIER_BACKEND: {backend}")
+    if backend == 'sidecar':
+        # Модель держит отдельный процесс, здесь только клиент
+        from inference_server import InferenceClient
+        return InferenceClient()
+    from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer, pipeline
+    device = default_device() if device is None else device
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    if backend == 'pipeline':
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        if quantize == 'int8':
+            if device >= 0:
+                # Динамическая квантизация PyTorch работает только на CPU
+                logger.warning("CLASSIFIER_QUANTIZE=int8 ignored on GPU")
+            else:
+                model = quantize_int8(model.eval())
+                logger.info("Classifier %s quantized to int8", model_name)
+        return pipeline("zero-shot-classification", model=model, tokenizer=tokenizer, device=device)
+
+    if device >= 0:
+        logger.warning("CLASSIFIER_BACKEND=%s runs on CPU only", backend)
+    export, load = _EXPORTERS[backend]
+    path = _artifact_path(model_name, backend, quantize)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        started = time.perf_counter()
+        export(model_name, tokenizer, path, quantize)
+        logger.info("Exported %s to %s in %.1fs", model_name, path, time.perf_counter() - started)
+    label2id = AutoConfig.from_pretrained(model_name).label2id
+    return ZeroShotClassifier(tokenizer, load(path), label2id)
@@ -0,0 +1,308 @@
+"""Local inference sidecar: one process holds the zero-shot classifier for every bot worker.
+
+Protocol over a Unix domain socket: every message is a 4-byte big-endian length
+followed by UTF-8 JSON. Requests are ``{"op": "classify", "text": ..., "labels": [...]}``
+or ``{"op": "ping"}``; the answer is the pipeline result, ``{"ok": true, ...}`` for a
+ping or ``{"error": ...}``. Concurrent requests with the same labels run as one batch.
+
+Bot processes use it with ``CLASSIFIER_BACKEND=sidecar``::
+
+    python inference_server.py serve --backend onnx &
+    python inference_server.py ping
+"""
+import argparse
+import errno
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import metrics
+from inference import CLASSIFIER_BACKEND, CLASSIFIER_MODEL, LOCAL_BACKENDS, load_classifier
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_SOCKET = os.getenv('INFERENCE_SOCKET', '/tmp/unithack-inference.sock')
+# Client side: seconds to wait for an answer, pooled connections per process and
+# how long the sidecar is skipped after a failure
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', '5.0'))
+INFERENCE_POOL_SIZE = int(os.getenv('INFERENCE_POOL_SIZE', '4'))
+INFERENCE_RETRY_INTERVAL = float(os.getenv('INFERENCE_RETRY_INTERVAL', '5.0'))
+# Server side: largest batch and how long the first request waits for company
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', '16'))
+INFERENCE_BATCH_WAIT = float(os.getenv('INFERENCE_BATCH_WAIT', '0.005'))
+INFERENCE_METRICS_PORT = int(os.getenv('INFERENCE_METRICS_PORT', '0'))
+
+MAX_MESSAGE_SIZE = 1 << 20
+HEADER = struct.Struct('>I')
+
+REQUESTS = metrics.counter('bot_inference_requests_total', 'Sidecar requests made by the bot', ['outcome'])
+BATCH_SIZE = metrics.histogram(
+    'inference_batch_size', 'Requests classified together by the sidecar',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+BATCH_SECONDS = metrics.histogram('inference_batch_seconds', 'Model time per sidecar batch')
+
+
+class InferenceUnavailable(Exception):
+    """The sidecar did not answer; callers fall back to the rule-based result."""
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        buffer += chunk
+    return bytes(buffer)
+
+
+def send_message(sock: socket.socket, payload: Dict):
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock: socket.socket) -> Dict:
+    (size,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"message of {size} bytes exceeds the limit")
+    return json.loads(_recv_exactly(sock, size).decode('utf-8'))
+
+
+class Batcher:
+    """Queue classify requests from connection threads and run them in batches on one thread."""
+
+    def __init__(self, classifier, max_batch: int = INFERENCE_MAX_BATCH, wait: float = INFERENCE_BATCH_WAIT):
+        self.classifier = classifier
+        self.max_batch = max_batch
+        self.wait = wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, text: str, labels: List[str]) -> Future:
+        future = Future()
+        self._queue.put((text, tuple(labels), future))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            BATCH_SIZE.observe(len(batch))
+            # Пайплайн классифицирует пачку только с общим набором меток
+            groups: Dict[tuple, list] = {}
+            for text, labels, future in batch:
+                groups.setdefault(labels, []).append((text, future))
+            for labels, items in groups.items():
+                started = time.perf_counter()
+                try:
+                    # Пайплайн transformers иначе прогоняет пары (текст, гипотеза) по одной;
+                    # batch_size в нем считается в парах, поэтому вся пачка - один вызов модели
+                    results = self.classifier(
+                        [text for text, _ in items], list(labels), batch_size=len(items) * len(labels)
+                    )
+                    if isinstance(results, dict):
+                        results = [results]
+                    for (_, future), result in zip(items, results):
+                        future.set_result(result)
+                except Exception as e:
+                    logger.error(f"Error classifying a batch of {len(items)}: {e}")
+                    for _, future in items:
+                        future.set_exception(e)
+                BATCH_SECONDS.observe(time.perf_counter() - started)
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server: InferenceServer = self.server
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, ValueError):
+                return
+            op = request.get('op')
+            if op == 'classify':
+                try:
+                    response = server.batcher.submit(request['text'], request['labels']).result()
+                except Exception as e:
+                    response = {'error': str(e)}
+            elif op == 'ping':
+                response = {
+                    'ok': True, 'model': server.model_name, 'backend': server.backend,
+                    'pending': server.batcher.pending, 'uptime': round(time.monotonic() - server.started, 1)
+                }
+            else:
+                response = {'error': f"unknown op: {op}"}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server with a thread per bot connection and a shared batcher."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, batcher: Batcher, model_name: str, backend: str):
+        # Сокет, оставшийся от упавшего процесса, мешает bind; живой сокет не трогаем
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                raise OSError(errno.EADDRINUSE, f"another inference server is listening on {path}")
+            finally:
+                probe.close()
+        super().__init__(path, _ConnectionHandler)
+        self.batcher = batcher
+        self.model_name = model_name
+        self.backend = backend
+        self.started = time.monotonic()
+
+
+class InferenceClient:
+    """Pipeline-compatible classifier that forwards calls to the sidecar over pooled connections."""
+
+    def __init__(self, path: str = INFERENCE_SOCKET, pool_size: int = INFERENCE_POOL_SIZE,
+                 timeout: float = INFERENCE_TIMEOUT, retry_interval: float = INFERENCE_RETRY_INTERVAL):
+        self.path = path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._idle: "queue.LifoQueue[socket.socket]" = queue.LifoQueue()
+        self._down_until = 0.0
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _exchange(self, payload: Dict) -> Dict:
+        try:
+            sock, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            sock, reused = self._connect(), False
+        try:
+            send_message(sock, payload)
+            response = recv_message(sock)
+        except (OSError, ValueError) as e:
+            sock.close()
+            if not reused or isinstance(e, socket.timeout):
+                raise
+            # Соединение из пула могло устареть после перезапуска сайдкара - пробуем новое
+            sock = self._connect()
+            try:
+                send_message(sock, payload)
+                response = recv_message(sock)
+            except (OSError, ValueError):
+                sock.close()
+                raise
+        self._idle.put(sock)
+        return response
+
+    def request(self, payload: Dict) -> Dict:
+        if time.monotonic() < self._down_until:
+            REQUESTS.labels('skipped').inc()
+            raise InferenceUnavailable('sidecar recently failed')
+        if not self._slots.acquire(timeout=self.timeout):
+            REQUESTS.labels('pool_exhausted').inc()
+            raise InferenceUnavailable('no free sidecar connection')
+        try:
+            response = self._exchange(payload)
+        except (OSError, ValueError) as e:
+            REQUESTS.labels('unavailable').inc()
+            self._down_until = time.monotonic() + self.retry_interval
+            raise InferenceUnavailable(str(e)) from e
+        finally:
+            self._slots.release()
+        if 'error' in response:
+            REQUESTS.labels('error').inc()
+            raise InferenceUnavailable(response['error'])
+        REQUESTS.labels('ok').inc()
+        return response
+
+    def __call__(self, sequence: str, candidate_labels: List[str]) -> Dict:
+        return self.request({'op': 'classify', 'text': sequence, 'labels': list(candidate_labels)})
+
+    def ping(self) -> Dict:
+        return self.request({'op': 'ping'})
+
+
+def serve(path: str, backend: Optional[str], max_batch: int, batch_wait: float):
+    backend = backend or (CLASSIFIER_BACKEND if CLASSIFIER_BACKEND in LOCAL_BACKENDS else 'pipeline')
+    started = time.perf_counter()
+    classifier = load_classifier(backend=backend)
+    logger.info(f"Loaded {CLASSIFIER_MODEL} ({backend}) in {time.perf_counter() - started:.1f}s")
+
+    metrics.start_http_server(INFERENCE_METRICS_PORT)
+    server = InferenceServer(path, Batcher(classifier, max_batch, batch_wait), CLASSIFIER_MODEL, backend)
+    logger.info(f"Inference sidecar listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    server = subparsers.add_parser('serve', help='load the classifier and answer on the socket')
+    server.add_argument('--socket', default=INFERENCE_SOCKET)
+    server.add_argument('--backend', choices=LOCAL_BACKENDS, help='CLASSIFIER_BACKEND by default')
+    server.add_argument('--max-batch', type=int, default=INFERENCE_MAX_BATCH)
+    server.add_argument('--batch-wait', type=float, default=INFERENCE_BATCH_WAIT, help='seconds')
+
+    ping = subparsers.add_parser('ping', help='health check: exit 0 if the sidecar answers')
+    ping.add_argument('--socket', default=INFERENCE_SOCKET)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'serve':
+        serve(args.socket, args.backend, args.max_batch, args.batch_wait)
+    else:
+        try:
+            print(json.dumps(InferenceClient(args.socket, pool_size=1).ping()))
+        except InferenceUnavailable as e:
+            print(json.dumps({'ok': False, 'error': str(e)}))
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
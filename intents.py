@@ -0,0 +1,450 @@
+"""Query categories with the keywords, phrases and examples used to classify them, and the rule scoring."""
+import re
+from typing import Dict
+
+from morphology import Vocabulary, normalize_list
+
+# Define categories for classification with examples and synonyms
+categories = [
+    "поиск сотрудника",
+    "информация о мероприятии",
+    "информация о задаче",
+    "социальные активности",
+    "приветствие",
+    "общая информация",
+    "неопределенный запрос"
+]
+
+# Define example queries and synonyms for each category with improved patterns
+category_patterns = {
+    "приветствие": {
+        "keywords": [
+            'привет', 'здравствуй', 'добрый', 'начать', 'помощь', 'хеллоу',
+            'хай', 'здорово', 'приветствую', 'доброе', 'добрый'
+        ],
+        "synonyms": [
+            'здравствуйте', 'доброе утро', 'добрый день', 'добрый вечер',
+            'хеллоу', 'хай', 'приветствую', 'здорово', 'добро пожаловать',
+            'рад видеть', 'как дела', 'как жизнь'
+        ],
+        "examples": [
+            "привет",
+            "здравствуй",
+            "добрый день",
+            "начать",
+            "помощь",
+            "как пользоваться",
+            "что умеешь",
+            "как дела",
+            "доброе утро",
+            "добрый вечер",
+            "рад тебя видеть",
+            "как жизнь"
+        ]
+    },
+    "поиск сотрудника": {
+        "keywords": [
+            'отдел', 'отделе', 'it', 'hr', 'sales', 'marketing', 'проект', 'project',
+            'разработка', 'разработчик', 'менеджер', 'директор', 'руководитель',
+            'специалист', 'инженер', 'аналитик', 'дизайнер', 'тестировщик',
+            'кто', 'найти', 'показать', 'список', 'сотрудники', 'коллеги',
+            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
+            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения'
+        ],
+        "synonyms": [
+            'найти', 'показать', 'кто', 'какие', 'список', 'сотрудники', 'работники',
+            'коллеги', 'люди', 'команда', 'группа', 'отдел', 'подразделение',
+            'искать', 'поиск', 'найти', 'показать', 'вывести', 'отобразить',
+            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
+            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения',
+            'специалист', 'эксперт', 'профессионал', 'мастер', 'гуру'
+        ],
+        "examples": [
+            "кто работает в отделе",
+            "найти сотрудника",
+            "кто из отдела",
+            "покажи сотрудников",
+            "кто работает над проектом",
+            "список сотрудников",
+            "какие люди работают",
+            "кто в команде",
+            "покажи команду разработки",
+            "кто отвечает за проект",
+            "найти специалиста по",
+            "кто руководит отделом",
+            "кто занимается разработкой",
+            "покажи всех сотрудников отдела",
+            "кто знает python",
+            "кто умеет работать с базами данных",
+            "найти эксперта по тестированию",
+            "кто может помочь с проектом",
+            "кто имеет опыт в маркетинге",
+            "покажи специалистов по дизайну"
+        ]
+    },
+    "информация о мероприятии": {
+        "keywords": [
+            'мероприятие', 'мероприятия', 'корпоратив', 'тренинг', 'встреча',
+            'неделе', 'недели', 'месяц', 'месяца', 'день', 'дня', 'дата',
+            'время', 'расписание', 'план', 'календарь', 'событие', 'события',
+            'день рождения', 'дни рождения', 'праздник', 'праздники',
+            'конференция', 'семинар', 'вебинар', 'презентация', 'доклад',
+            'выступление', 'обучение', 'курс', 'лекция', 'мастер-класс'
+        ],
+        "synonyms": [
+            'когда', 'расписание', 'план', 'календарь', 'дата', 'время',
+            'запланировано', 'назначено', 'будет', 'пройдет', 'состоится',
+            'организовано', 'подготовлено', 'устроено', 'праздновать',
+            'отмечать', 'поздравлять', 'чествовать', 'проводить',
+            'организовывать', 'планировать', 'готовить', 'устраивать'
+        ],
+        "examples": [
+            "какие мероприятия",
+            "когда корпоратив",
+            "расписание мероприятий",
+            "какие встречи",
+            "когда тренинг",
+            "что запланировано",
+            "какие события",
+            "что будет на неделе",
+            "какие встречи запланированы",
+            "расписание на месяц",
+            "когда следующее мероприятие",
+            "что готовится в отделе",
+            "когда день рождения",
+            "какие праздники",
+            "когда конференция",
+            "расписание тренингов",
+            "какие семинары на этой неделе",
+            "когда мастер-класс",
+            "что запланировано на месяц",
+            "какие мероприятия в офисе"
+        ]
+    },
+    "информация о задаче": {
+        "keywords": [
+            'задача', 'задачи', 'дедлайн', 'проект', 'работа', 'поручение',
+            'обязанность', 'функция', 'роль', 'ответственность', 'контроль',
+            'проверка', 'тестирование', 'разработка', 'внедрение',
+            'срок', 'статус', 'прогресс', 'выполнение', 'todo', 'in progress', 'done',
+            'блокер', 'проблема', 'ошибка', 'баг', 'фича', 'улучшение',
+            'оптимизация', 'рефакторинг', 'документация', 'отчет'
+        ],
+        "synonyms": [
+            'сделать', 'выполнить', 'срок', 'статус', 'прогресс', 'ход',
+            'продвижение', 'этап', 'стадия', 'фаза', 'процесс', 'работа',
+            'дело', 'поручение', 'обязанность', 'контролировать',
+            'проверять', 'отслеживать', 'мониторить', 'в работе',
+            'текущие', 'к выполнению', 'сделано', 'выполнено',
+            'заблокировано', 'проблема', 'ошибка', 'исправить',
+            'улучшить', 'оптимизировать', 'переписать', 'документировать'
+        ],
+        "examples": [
+            "какие задачи",
+            "что нужно сделать",
+            "какие дедлайны",
+            "статус задачи",
+            "когда сдать",
+            "что в работе",
+            "текущие задачи",
+            "мои поручения",
+            "что на контроле",
+            "какие проекты в работе",
+            "статус разработки",
+            "ход выполнения",
+            "что нужно сделать до",
+            "какие задачи у",
+            "покажи задачи к выполнению",
+            "какие задачи в работе",
+            "покажи выполненные задачи",
+            "есть ли блокеры",
+            "какие проблемы",
+            "статус проекта"
+        ]
+    },
+    "социальные активности": {
+        "keywords": [
+            'обед', 'игра', 'игры', 'встреча', 'встречи', 'общение',
+            'команда', 'командный', 'вместе', 'совместно', 'активность',
+            'активности', 'досуг', 'отдых', 'развлечение', 'развлечения',
+            'йога', 'спорт', 'фитнес', 'танцы', 'музыка', 'кино',
+            'театр', 'концерт', 'выставка', 'музей', 'парк', 'прогулка',
+            'вечеринка', 'праздник', 'корпоратив', 'тимбилдинг'
+        ],
+        "synonyms": [
+            'поиграть', 'пообедать', 'встретиться', 'познакомиться',
+            'пообщаться', 'провести время', 'отдохнуть', 'развлечься',
+            'командная игра', 'совместный обед', 'групповая активность',
+            'заняться спортом', 'позаниматься йогой', 'потанцевать',
+            'сходить в кино', 'посетить выставку', 'погулять в парке',
+            'отпраздновать', 'провести тимбилдинг', 'организовать вечеринку'
+        ],
+        "examples": [
+            "кто хочет поиграть",
+            "кто идет на обед",
+            "кто хочет встретиться",
+            "найти партнера для игры",
+            "кто свободен на обед",
+            "кто хочет пообщаться",
+            "найти компанию для",
+            "кто хочет присоединиться",
+            "кто готов поиграть",
+            "кто хочет пообедать вместе",
+            "кто занимается йогой",
+            "кто хочет в кино",
+            "кто идет на выставку",
+            "кто хочет в парк",
+            "кто готов к тимбилдингу",
+            "кто хочет на вечеринку",
+            "кто занимается спортом",
+            "кто танцует",
+            "кто любит музыку",
+            "кто хочет в театр"
+        ]
+    },
+    "общая информация": {
+        "keywords": [
+            'что', 'как', 'где', 'когда', 'почему', 'зачем',
+            'информация', 'справка', 'помощь', 'подсказка',
+            'правила', 'политика', 'процедуры', 'процессы',
+            'структура', 'организация', 'компания', 'офис',
+            'рабочее место', 'оборудование', 'ресурсы',
+            'документы', 'файлы', 'база знаний', 'wiki'
+        ],
+        "synonyms": [
+            'расскажи', 'объясни', 'покажи', 'найди', 'дай',
+            'информацию', 'справку', 'помощь', 'подсказку',
+            'правила', 'политику', 'процедуры', 'процессы',
+            'структуру', 'организацию', 'компанию', 'офис',
+            'рабочее место', 'оборудование', 'ресурсы',
+            'документы', 'файлы', 'базу знаний', 'wiki'
+        ],
+        "examples": [
+            "как работает",
+            "где находится",
+            "когда открыто",
+            "что нужно знать",
+            "какие правила",
+            "как пользоваться",
+            "где найти",
+            "как получить доступ",
+            "что делать если",
+            "как решить проблему",
+            "где посмотреть",
+            "как узнать",
+            "что нового",
+            "какие изменения",
+            "как обновить",
+            "где документация",
+            "как настроить",
+            "что требуется",
+            "как начать",
+            "где справка"
+        ]
+    }
+}
+
+# Search vocabularies: what a query may call a skill, role, department, task status or priority
+skill_keywords = Vocabulary({
+    'python': ['python', 'питон'],
+    'java': ['java', 'джава'],
+    'javascript': ['javascript', 'js', 'джаваскрипт'],
+    'react': ['react', 'реакт'],
+    'django': ['django', 'джанго'],
+    'docker': ['docker', 'докер'],
+    'postgresql': ['postgresql', 'postgres', 'постгрес'],
+    'mongodb': ['mongodb', 'монго'],
+    'selenium': ['selenium', 'селениум'],
+    'pytest': ['pytest', 'питест'],
+    'postman': ['postman', 'постман'],
+    'jira': ['jira', 'джира'],
+    'agile': ['agile', 'аджайл'],
+    'scrum': ['scrum', 'скрам'],
+    'fastapi': ['fastapi', 'фастапи']
+})
+
+role_keywords = Vocabulary({
+    'разработка': [
+        'разработка', 'разработчик', 'программист', 'код', 'кодить',
+        'developer', 'programmer', 'coder', 'software', 'engineer'
+    ],
+    'руководство': [
+        'руководитель', 'директор', 'менеджер', 'глава', 'начальник',
+        'manager', 'director', 'head', 'lead', 'chief', 'senior'
+    ],
+    'тестирование': [
+        'тестирование', 'тестировщик', 'qa', 'контроль качества',
+        'tester', 'qa engineer', 'quality', 'testing'
+    ],
+    'дизайн': [
+        'дизайн', 'дизайнер', 'ui', 'ux', 'интерфейс',
+        'designer', 'ui/ux', 'interface', 'frontend'
+    ],
+    'аналитика': [
+        'аналитик', 'анализ', 'исследование', 'исследователь',
+        'analyst', 'researcher', 'research', 'analysis'
+    ]
+})
+
+department_keywords = Vocabulary({
+    'it': ['it', 'айти', 'информационные технологии', 'разработка', 'development'],
+    'hr': ['hr', 'эйчар', 'кадры', 'персонал', 'human resources'],
+    'sales': ['sales', 'продажи', 'сейлз', 'коммерция'],
+    'marketing': ['marketing', 'маркетинг', 'реклама', 'продвижение']
+})
+
+# Keyed by models.TaskStatus member name
+task_status_keywords = Vocabulary({
+    'TODO': [
+        'todo', 'сделать', 'выполнить', 'к выполнению', 'новые',
+        'ожидает', 'ожидающие', 'в очереди', 'в планах'
+    ],
+    'IN_PROGRESS': [
+        'в работе', 'текущие', 'выполняются', 'активные',
+        'in progress', 'разработка', 'разрабатывается'
+    ],
+    'DONE': [
+        'done', 'сделано', 'выполнено', 'завершено', 'готово',
+        'завершенные', 'выполненные', 'готовые'
+    ],
+    'BLOCKED': [
+        'blocked', 'блокер', 'блокеры', 'заблокировано',
+        'проблема', 'проблемы', 'ошибка', 'ошибки',
+        'препятствие', 'препятствия'
+    ]
+})
+
+task_priority_keywords = Vocabulary({
+    'high': ['высокий', 'высокая', 'срочно', 'срочная', 'критично', 'критичная'],
+    'medium': ['средний', 'средняя', 'обычный', 'обычная'],
+    'low': ['низкий', 'низкая', 'не срочно', 'не срочная']
+})
+
+# Extra (weight, vocabulary) checks added to the score of a category
+category_vocabularies = {
+    "поиск сотрудника": [
+        (1.0, skill_keywords),
+        (0.8, Vocabulary({
+            'разработчик': ['разработчик', 'программист', 'developer', 'coder'],
+            'тестировщик': ['тестировщик', 'qa', 'tester'],
+            'менеджер': ['менеджер', 'manager', 'руководитель'],
+            'дизайнер': ['дизайнер', 'designer', 'ui/ux'],
+            'аналитик': ['аналитик', 'analyst']
+        })),
+        (0.8, Vocabulary({
+            'it': ['it', 'айти', 'разработка'],
+            'hr': ['hr', 'эйчар', 'кадры'],
+            'sales': ['sales', 'продажи'],
+            'marketing': ['marketing', 'маркетинг']
+        }))
+    ],
+    "информация о мероприятии": [
+        (1.0, Vocabulary({
+            'сегодня': ['сегодня', 'сейчас', 'в данный момент'],
+            'завтра': ['завтра', 'на следующий день'],
+            'неделя': ['неделе', 'недели', 'на этой неделе', 'в течение недели'],
+            'месяц': ['месяце', 'месяца', 'в этом месяце', 'в течение месяца']
+        })),
+        (0.8, Vocabulary({
+            'встреча': ['встреча', 'meeting', 'митинг'],
+            'тренинг': ['тренинг', 'training', 'обучение'],
+            'конференция': ['конференция', 'conference', 'конф'],
+            'семинар': ['семинар', 'seminar', 'вебинар'],
+            'корпоратив': ['корпоратив', 'party', 'вечеринка']
+        }))
+    ],
+    "информация о задаче": [
+        (1.0, Vocabulary({
+            'todo': ['todo', 'сделать', 'выполнить', 'к выполнению'],
+            'in_progress': ['в работе', 'текущие', 'выполняются'],
+            'done': ['done', 'сделано', 'выполнено', 'завершено'],
+            'blocked': ['blocked', 'блокер', 'заблокировано']
+        })),
+        (0.8, task_priority_keywords)
+    ],
+    "социальные активности": [
+        (0.8, Vocabulary({
+            'игры': ['игра', 'игры', 'настольные', 'board games'],
+            'спорт': ['спорт', 'фитнес', 'йога', 'танцы'],
+            'обед': ['обед', 'пообедать', 'lunch'],
+            'развлечения': ['кино', 'театр', 'концерт', 'выставка']
+        }))
+    ]
+}
+
+# Stemmed copy of category_patterns for matching inflected queries
+normalized_patterns = {
+    category: {kind: normalize_list(phrases) for kind, phrases in patterns.items()}
+    for category, patterns in category_patterns.items()
+}
+
+STOP_WORDS = {
+    'и', 'в', 'на', 'с', 'по', 'для', 'не', 'ни', 'но', 'а', 'или',
+    'что', 'как', 'когда', 'где', 'почему', 'зачем', 'кто', 'какой',
+    'какая', 'какие', 'какое', 'каких', 'каким', 'какими', 'каком',
+    'какую', 'какого', 'какому', 'какою',
+    'это', 'этот', 'эта', 'эти', 'этого', 'этой', 'этим', 'этими',
+    'этом', 'эту', 'этою',
+    'быть', 'был', 'была', 'были', 'было', 'буду', 'будешь',
+    'будет', 'будем', 'будете', 'будут', 'стать', 'стал', 'стала',
+    'стали', 'стало', 'стану', 'станешь', 'станет', 'станем',
+    'станете', 'станут'
+}
+
+
+def preprocess_query(query: str) -> str:
+    """Preprocess the query for better classification."""
+    # Convert to lowercase
+    query = query.lower()
+    
+    # Remove punctuation but keep important symbols
+    query = re.sub(r'[^\w\s\-]', ' ', query)
+    
+    # Remove extra spaces and common stop words
+    return ' '.join(word for word in query.split() if word not in STOP_WORDS)
+
+
+def calculate_category_score(query: str, category: str, normalized: bool = False) -> float:
+    """Calculate a score for how well the query matches a category.
+
+    With ``normalized`` the query must already be stemmed; it is matched against the stemmed patterns.
+    """
+    score = 0.0
+    patterns = (normalized_patterns if normalized else category_patterns)[category]
+    
+    # Проверяем наличие ключевых слов
+    for keyword in patterns["keywords"]:
+        if keyword in query:
+            score += 0.4
+        elif any(word.startswith(keyword) or keyword.startswith(word) for word in query.split()):
+            score += 0.2
+    
+    # Проверяем синонимы
+    for synonym in patterns["synonyms"]:
+        if synonym in query:
+            score += 0.3
+        elif any(word.startswith(synonym) or synonym.startswith(word) for word in query.split()):
+            score += 0.15
+    
+    # Проверяем примеры
+    for example in patterns["examples"]:
+        if example in query:
+            score += 0.6
+        elif any(word in example for word in query.split()):
+            score += 0.3
+    
+    # Навыки, роли, отделы, сроки, типы мероприятий, статусы и приоритеты
+    for weight, vocabulary in category_vocabularies.get(category, ()):
+        for keywords in (vocabulary.normalized if normalized else vocabulary).values():
+            if any(keyword in query for keyword in keywords):
+                score += weight
+    
+    return score
+
+
+def category_scores(query: str, normalized: bool = False) -> Dict[str, float]:
+    """Rule-based scores of every category except the fallback one."""
+    return {
+        category: calculate_category_score(query, category, normalized)
+        for category in categories if category != "неопределенный запрос"
+    }
@@ -0,0 +1,156 @@
+"""Non-blocking logging pipeline: records are queued and formatted on a listener thread."""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Optional
+
+import metrics
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# "text" or "json" (one object per line)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Share of messages whose INFO/DEBUG records are kept; warnings and errors are always kept
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+# Longer string arguments are cut, e.g. full chat responses
+LOG_MAX_ARG_LENGTH = int(os.getenv('LOG_MAX_ARG_LENGTH', '500'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+LOG_DROPPED = metrics.counter('bot_log_dropped_total', 'Log records dropped because the queue was full')
+
+# Решение о сэмплировании принимается один раз на сообщение
+_sampled = contextvars.ContextVar('log_sampled', default=None)
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def sample_message() -> bool:
+    """Decide whether verbose records of the current message are kept."""
+    keep = LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+    _sampled.set(keep)
+    return keep
+
+
+def truncate(value, limit: int = LOG_MAX_ARG_LENGTH):
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}…(+{len(value) - limit} chars)"
+    return value
+
+
+class SampledLogger(logging.Logger):
+    """Logger that does not even build INFO/DEBUG records for messages that were not sampled."""
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level < logging.WARNING and _sampled.get() is False:
+            return False
+        return super().isEnabledFor(level)
+
+
+# Логгеры, созданные после импорта этого модуля, проверяют сэмплирование до создания записи
+logging.setLoggerClass(SampledLogger)
+
+
+class SamplingFilter(logging.Filter):
+    """Drop INFO and below for messages that were not sampled, for loggers created before this module."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        keep = _sampled.get()
+        if keep is None:
+            return LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+        return keep
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records without formatting them; drop instead of blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирование откладывается до потока слушателя
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Text formatter that shortens large string arguments before merging them."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.args, dict):
+            record.args = {key: truncate(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(truncate(arg) for arg in record.args)
+        else:
+            record.msg = truncate(record.msg)
+        return super().format(record)
+
+
+class JsonFormatter(TruncatingFormatter):
+    """One JSON object per record, including fields passed through ``extra``."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        super().format(record)
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.message
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = truncate(value) if isinstance(value, str) else value
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(stream=None) -> logging.handlers.QueueListener:
+    """Route all records through a bounded queue to a listener thread writing to ``stream``."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TruncatingFormatter(TEXT_FORMAT))
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter())
+
+    # Поля, которые не используются в форматах, не собираем (см. раздел Optimization в logging HOWTO)
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,148 @@
+"""Maintenance commands for the bot database.
+
+Usage::
+
+    python manage.py repair-counters
+    python manage.py verify-aggregates [--fix]
+    python manage.py import-employees hr_export.csv --batch-size 2000
+    python manage.py export tasks --format jsonl --status in_progress -o tasks.jsonl
+    python manage.py train-tier --log logs/classifications.jsonl
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime
+
+import aggregates
+import export
+import ngram_classifier
+from importer import import_employees
+from models import get_session, recount_participants
+
+logger = logging.getLogger(__name__)
+
+
+def repair_counters(args):
+    """Recompute denormalized participant counters."""
+    session = get_session()
+    try:
+        fixed = recount_participants(session)
+        # Счетчики исправлены UPDATE-запросом в обход событий ORM - пересобираем заполненность
+        aggregates.rebuild(session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    for table, count in fixed.items():
+        logger.info(f"{table}: corrected {count} participant counters")
+
+
+def verify_aggregates(args):
+    """Compare the aggregate tables with a full recompute and optionally rebuild them."""
+    session = get_session()
+    try:
+        problems = aggregates.verify(session)
+        for problem in problems[:50]:
+            logger.warning(problem)
+        if len(problems) > 50:
+            logger.warning(f"... and {len(problems) - 50} more")
+        if problems and args.fix:
+            tasks, activity_types = aggregates.rebuild(session)
+            session.commit()
+            logger.info(f"Rebuilt aggregates: {tasks} task groups, {activity_types} activity types")
+            return
+    finally:
+        session.close()
+    if problems:
+        logger.error(f"Aggregates differ from the source tables in {len(problems)} groups; rerun with --fix")
+        sys.exit(1)
+    logger.info("Aggregates match the source tables")
+
+
+def import_employees_command(args):
+    """Stream a CSV/JSONL export into the employees table."""
+    stats = import_employees(args.path, args.format, args.batch_size, args.progress_every)
+    logger.info(
+        f"Imported {stats['upserted']} employees from {stats['read']} records "
+        f"({stats['skipped']} skipped) in {stats['seconds']}s, {stats['rows_per_second']} rows/s"
+    )
+
+
+def export_command(args):
+    """Stream tasks, events or activities to a file or stdout."""
+    filters = {
+        'status': args.status,
+        'date_from': args.date_from,
+        'date_to': args.date_to,
+        'department': args.department,
+        'assignee': args.assignee
+    }
+    if args.output == '-':
+        count = export.export(args.entity, args.format, sys.stdout.buffer, **filters)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, 'wb') as f:
+            count = export.export(args.entity, args.format, f, **filters)
+    logger.info(f"Exported {count} {args.entity} to {args.output}")
+
+
+def train_tier(args):
+    """Train a new version of the n-gram classification tier."""
+    path, stats = ngram_classifier.train(args.log, args.output_dir, args.epochs)
+    logger.info(
+        f"Saved {path}: {stats['examples']} examples + {stats['logged']} logged queries, "
+        f"holdout accuracy {stats['holdout_accuracy']:.1%} (train {stats['train_accuracy']:.1%})"
+    )
+    if stats['holdout_accuracy'] < args.min_accuracy:
+        logger.warning(f"Holdout accuracy is below {args.min_accuracy:.0%}; pin the previous version with NGRAM_MODEL_VERSION")
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands for the bot database.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    subparsers.add_parser('repair-counters', help='recompute participant_count columns').set_defaults(func=repair_counters)
+    
+    verifier = subparsers.add_parser('verify-aggregates', help='check task_counts and activity_fill against a recompute')
+    verifier.add_argument('--fix', action='store_true', help='rebuild the tables if they differ')
+    verifier.set_defaults(func=verify_aggregates)
+    
+    importer = subparsers.add_parser('import-employees', help='upsert employees from a CSV/JSONL export')
+    importer.add_argument('path')
+    importer.add_argument('--format', choices=['csv', 'jsonl'], help='detected from the extension by default')
+    importer.add_argument('--batch-size', type=int, default=1000)
+    importer.add_argument('--progress-every', type=int, default=10000)
+    importer.set_defaults(func=import_employees_command)
+    
+    exporter = subparsers.add_parser('export', help='stream tasks, events or activities to CSV/JSONL')
+    exporter.add_argument('entity', choices=export.EXPORT_ENTITIES)
+    exporter.add_argument('--format', choices=export.EXPORT_FORMATS, default='csv')
+    exporter.add_argument('-o', '--output', default='-', help='output file, stdout by default')
+    exporter.add_argument('--status', help='task status, or active/inactive for activities')
+    exporter.add_argument('--from', dest='date_from', type=parse_date, help='YYYY-MM-DD, deadline or date')
+    exporter.add_argument('--to', dest='date_to', type=parse_date, help='YYYY-MM-DD, deadline or date')
+    exporter.add_argument('--department')
+    exporter.add_argument('--assignee', help='assignee (tasks) or participant name')
+    exporter.set_defaults(func=export_command)
+    
+    tier = subparsers.add_parser('train-tier', help='train the n-gram classification tier from logged classifications')
+    tier.add_argument('--log', default=ngram_classifier.CLASSIFICATION_LOG,
+                      help='classification log, rotated files included (default: CLASSIFICATION_LOG)')
+    tier.add_argument('--output-dir', default=ngram_classifier.NGRAM_MODEL_DIR)
+    tier.add_argument('--epochs', type=int, default=40)
+    tier.add_argument('--min-accuracy', type=float, default=0.7)
+    tier.set_defaults(func=train_tier)
+    
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,29 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, DateTime, Boolean, ForeignKey, Enum, Text, Table
+from sqlalchemy import create_engine, Column, BigInteger, Integer, String, Date, Time, DateTime, Boolean, ForeignKey, Enum, Text, Table, UniqueConstraint
+from sqlalchemy import select, insert, update, func, exists, literal, or_, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime, time
+from sqlalchemy.schema import CreateColumn
+from datetime import date, datetime, time
+from collections import defaultdict
 import enum
+import logging
 import os
 from dotenv import load_dotenv
 
+import sql_profiling
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Create database engine
 engine = create_engine(os.getenv('DATABASE_URL', 'sqlite:///corporate_bot.db'))
+
+# Time every SQL statement for the slow-query log
+if os.getenv('SQL_PROFILING', '1') == '1':
+    sql_profiling.install(engine)
+
 Session = sessionmaker(bind=engine)
 Base = declarative_base()
 
@@ -38,13 +51,15 @@ class TaskStatus(enum.Enum):
 
 # Association tables
 event_participants = Table('event_participants', Base.metadata,
-    Column('event_id', Integer, ForeignKey('events.id')),
-    Column('employee_id', Integer, ForeignKey('employees.id'))
+    Column('event_id', Integer, ForeignKey('events.id'), index=True),
+    Column('employee_id', Integer, ForeignKey('employees.id')),
+    UniqueConstraint('event_id', 'employee_id')
 )
 
 activity_participants = Table('activity_participants', Base.metadata,
-    Column('activity_id', Integer, ForeignKey('activities.id')),
-    Column('employee_id', Integer, ForeignKey('employees.id'))
+    Column('activity_id', Integer, ForeignKey('activities.id'), index=True),
+    Column('employee_id', Integer, ForeignKey('employees.id')),
+    UniqueConstraint('activity_id', 'employee_id')
 )
 
 # Models
@@ -55,13 +70,15 @@ class Employee(Base):
     name = Column(String(100), nullable=False)
     position = Column(String(100))
     department = Column(String(50))
-    email = Column(String(100))
+    email = Column(String(100), unique=True)
     phone = Column(String(20))
     hire_date = Column(Date)
     birthday = Column(Date)
     skills = Column(Text)
     interests = Column(Text)
     bio = Column(Text)
+    # Lets the bot notice employees changed by other processes (manage.py import-employees)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
     
     # Relationships
     tasks = relationship("Task", back_populates="assignee")
@@ -80,6 +97,8 @@ class Event(Base):
     description = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    # Denormalized number of rows in event_participants
+    participant_count = Column(Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     participants = relationship("Employee", secondary=event_participants, back_populates="events")
@@ -98,7 +117,7 @@ class Task(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
     # Foreign keys
-    assignee_id = Column(Integer, ForeignKey('employees.id'))
+    assignee_id = Column(Integer, ForeignKey('employees.id'), index=True)
     
     # Relationships
     assignee = relationship("Employee", back_populates="tasks")
@@ -118,14 +137,224 @@ class Activity(Base):
     tags = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    # Denormalized number of rows in activity_participants
+    participant_count = Column(Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     participants = relationship("Employee", secondary=activity_participants, back_populates="activities")
 
+class DigestSubscription(Base):
+    __tablename__ = 'digest_subscriptions'
+    
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False, unique=True)
+    # Личный дайджест сотрудника или дайджест отдела
+    employee_id = Column(Integer, ForeignKey('employees.id'), index=True)
+    department = Column(String(50))
+    created_at = Column(DateTime, default=datetime.now)
+    
+    employee = relationship("Employee")
+
+class TelegramIdentity(Base):
+    __tablename__ = 'telegram_identities'
+    
+    id = Column(Integer, primary_key=True)
+    telegram_user_id = Column(BigInteger, nullable=False, unique=True)
+    # Один сотрудник - один аккаунт Telegram
+    employee_id = Column(Integer, ForeignKey('employees.id'), nullable=False, unique=True)
+    created_at = Column(DateTime, default=datetime.now)
+    
+    employee = relationship("Employee")
+
+class BindingRequest(Base):
+    __tablename__ = 'binding_requests'
+    
+    id = Column(Integer, primary_key=True)
+    # Одна ожидающая заявка на аккаунт; до подтверждения администратором сотрудник не занят
+    telegram_user_id = Column(BigInteger, nullable=False, unique=True)
+    chat_id = Column(BigInteger, nullable=False)
+    employee_id = Column(Integer, ForeignKey('employees.id'), nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    
+    employee = relationship("Employee")
+
+# Aggregates maintained incrementally by aggregates.py; keys use '' / 0 / NO_DEADLINE
+# instead of NULL so that every group has exactly one row
+NO_DEADLINE = date.max
+
+class TaskCount(Base):
+    __tablename__ = 'task_counts'
+    
+    # Имя TaskStatus, ID исполнителя и понедельник недели дедлайна
+    status = Column(String(20), primary_key=True)
+    assignee_id = Column(Integer, primary_key=True)
+    deadline_week = Column(Date, primary_key=True)
+    task_count = Column(Integer, nullable=False, default=0)
+
+class ActivityFill(Base):
+    __tablename__ = 'activity_fill'
+    
+    # Имя ActivityType; учитываются только активные активности
+    activity_type = Column(String(20), primary_key=True)
+    activities = Column(Integer, nullable=False, default=0)
+    participants = Column(Integer, nullable=False, default=0)
+    # Места и участники только активностей с ограничением мест, и сколько из них заполнено
+    seats = Column(Integer, nullable=False, default=0)
+    booked = Column(Integer, nullable=False, default=0)
+    full_activities = Column(Integer, nullable=False, default=0)
+
+# Keep participant counters in sync with ORM collection changes; they are flushed
+# in the same transaction as the association rows
+@event.listens_for(Event.participants, 'append')
+@event.listens_for(Activity.participants, 'append')
+def _participant_added(target, value, initiator):
+    target.participant_count = (target.participant_count or 0) + 1
+
+@event.listens_for(Event.participants, 'remove')
+@event.listens_for(Activity.participants, 'remove')
+def _participant_removed(target, value, initiator):
+    target.participant_count = (target.participant_count or 0) - 1
+
+# Callbacks of derived indexes, notified with the IDs of rows changed by bulk writes
+_change_hooks = defaultdict(list)
+
+def register_change_hook(model, callback):
+    """Call ``callback(ids)`` whenever rows of ``model`` are changed through notify_change."""
+    _change_hooks[model].append(callback)
+
+def notify_change(model, ids):
+    """Tell derived indexes that rows of ``model`` changed; failures are logged, not raised."""
+    ids = list(ids)
+    if not ids:
+        return
+    for callback in _change_hooks[model]:
+        try:
+            callback(ids)
+        except Exception as e:
+            logger.error(f"Change hook {callback.__name__} failed for {model.__name__}: {e}")
+
+# ORM writes reach the same hooks: changed IDs are collected at flush time and
+# announced once the transaction commits
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault('changed_ids', defaultdict(set))
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        model = type(instance)
+        if model in _change_hooks and instance.id is not None:
+            changes[model].add(instance.id)
+
+@event.listens_for(Session, 'after_commit')
+def _announce_changes(session):
+    # Освобождение точки сохранения тоже вызывает after_commit - ждем внешней фиксации
+    if session.in_nested_transaction():
+        return
+    changes = session.info.pop('changed_ids', None)
+    for model, ids in (changes or {}).items():
+        notify_change(model, ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    # Откат одной точки сохранения не отменяет изменений остальной транзакции
+    if session.in_nested_transaction():
+        return
+    session.info.pop('changed_ids', None)
+
 def get_session():
     """Get a new database session."""
     return Session()
 
+class ChangePoller:
+    """Announce rows of a model changed by other processes, found by ``updated_at`` past a watermark."""
+    
+    def __init__(self, model):
+        self.model = model
+        self.watermark = None
+    
+    def start(self):
+        """Remember the newest change; rows that exist now are loaded by the indexes on startup."""
+        session = Session()
+        try:
+            self.watermark = session.execute(select(func.max(self.model.updated_at))).scalar()
+        finally:
+            session.close()
+    
+    def poll(self):
+        """Pass IDs changed since the last poll to notify_change; returns how many there were."""
+        query = select(self.model.id, self.model.updated_at).where(self.model.updated_at.isnot(None))
+        if self.watermark is not None:
+            query = query.where(self.model.updated_at > self.watermark)
+        session = Session()
+        try:
+            rows = session.execute(query).all()
+        finally:
+            session.close()
+        if rows:
+            self.watermark = max(updated_at for _, updated_at in rows)
+            notify_change(self.model, [row_id for row_id, _ in rows])
+        return len(rows)
+
+def add_activity_participant(session, activity_id, employee_id):
+    """Atomically add an employee to an activity if a seat is free.
+
+    Returns one of "joined", "already_joined", "full" or "not_found".
+    The caller is responsible for committing the session.
+    """
+    if session.get_bind().dialect.name != 'sqlite':
+        # Блокировка строки активности сериализует конкурентные записи в PostgreSQL;
+        # в SQLite запись и так сериализована блокировкой файла
+        session.execute(select(Activity.id).where(Activity.id == activity_id).with_for_update())
+    
+    already_joined = exists().where(
+        activity_participants.c.activity_id == activity_id,
+        activity_participants.c.employee_id == employee_id
+    )
+    # Один условный INSERT ... SELECT: строка вставляется, только если есть место
+    result = session.execute(
+        insert(activity_participants).from_select(
+            ['activity_id', 'employee_id'],
+            select(Activity.id, literal(employee_id)).where(
+                Activity.id == activity_id,
+                Activity.is_active == True,
+                or_(Activity.max_participants.is_(None), Activity.participant_count < Activity.max_participants),
+                ~already_joined
+            )
+        )
+    )
+    if result.rowcount == 1:
+        session.execute(
+            update(Activity).where(Activity.id == activity_id).values(
+                participant_count=Activity.participant_count + 1
+            )
+        )
+        return "joined"
+    
+    # Определяем причину отказа
+    activity_exists = session.execute(
+        select(Activity.id).where(Activity.id == activity_id, Activity.is_active == True)
+    ).first()
+    if not activity_exists:
+        return "not_found"
+    if session.execute(select(already_joined)).scalar():
+        return "already_joined"
+    return "full"
+
+def recount_participants(session):
+    """Recompute participant counters from the association tables in bulk.
+
+    Returns the number of corrected rows per table. The caller commits.
+    """
+    fixed = {}
+    for model, association, key in (
+        (Event, event_participants, event_participants.c.event_id),
+        (Activity, activity_participants, activity_participants.c.activity_id),
+    ):
+        actual = select(func.count()).select_from(association).where(key == model.id).scalar_subquery()
+        result = session.execute(
+            update(model).where(model.participant_count != actual).values(participant_count=actual)
+        )
+        fixed[model.__tablename__] = result.rowcount
+    return fixed
+
 def parse_date(date_str):
     """Parse date string to datetime object."""
     return datetime.strptime(date_str, "%Y-%m-%d").date()
@@ -134,15 +363,45 @@ def parse_time(time_str):
     """Parse time string to time object."""
     return datetime.strptime(time_str, "%H:%M").time()
 
-def init_db():
-    """Initialize the database with test data."""
-    # Drop all tables and recreate them
-    Base.metadata.drop_all(engine)
+def add_missing_columns():
+    """Add columns declared in the models but missing from existing tables; returns their names."""
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                connection.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=engine.dialect)}"
+                ))
+                for index in table.indexes:
+                    if column.name in index.columns:
+                        index.create(connection)
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+def init_db(reset=False):
+    """Create missing tables and seed test data into an empty database.
+
+    ``reset`` drops all tables first, wiping imported employees, bindings and subscriptions.
+    """
+    if reset:
+        Base.metadata.drop_all(engine)
     Base.metadata.create_all(engine)
+    for column in add_missing_columns():
+        logger.info(f"Added column {column}")
     
     session = Session()
     
     try:
+        # Тестовые данные только для пустой базы: импорт, привязки и подписки переживают перезапуск
+        if session.execute(select(Employee.id).limit(1)).first() is not None:
+            return
+        
         # Create test employees
         employees = [
             Employee(
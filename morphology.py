@@ -0,0 +1,114 @@
+"""Russian word normalization for the rule-based matching: a Snowball stemmer with a bounded cache."""
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+# Distinct word forms kept in the stem cache
+STEM_CACHE_SIZE = int(os.getenv('STEM_CACHE_SIZE', '50000'))
+
+VOWELS = set('аеиоуыэюя')
+
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+                  'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+        ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+         'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+NOUN = ((), ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий',
+             'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю',
+             'ия', 'ья', 'я'))
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _region(word: str, start: int) -> int:
+    """Start of the region after the first non-vowel following a vowel, searching from ``start``."""
+    for i in range(start + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(word: str, limit: int, groups) -> str:
+    """Remove the longest suffix of ``groups`` lying after ``limit``; the first group must follow "а" or "я".
+
+    Returns None when nothing matches, like a failed Snowball ``among``.
+    """
+    best, after_a = '', False
+    for index, suffixes in enumerate(groups):
+        for suffix in suffixes:
+            if len(suffix) > len(best) and word.endswith(suffix) and len(word) - len(suffix) >= limit:
+                best, after_a = suffix, index == 0
+    if not best:
+        return None
+    stem = word[:-len(best)]
+    if after_a and not (len(stem) > limit and stem[-1] in 'ая'):
+        return None
+    return stem
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word: str) -> str:
+    """Snowball stem of a lowercase Russian word; other words are returned unchanged."""
+    word = word.replace('ё', 'е')
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), len(word))
+    if rv >= len(word):
+        return word
+    r2 = _region(word, _region(word, 0))
+
+    # Шаг 1: деепричастие, иначе возвратная частица и прилагательное / глагол / существительное
+    result = _strip(word, rv, PERFECTIVE_GERUND)
+    if result is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        result = _strip(word, rv, ADJECTIVE)
+        if result is not None:
+            result = _strip(result, rv, PARTICIPLE) or result
+        else:
+            result = _strip(word, rv, VERB)
+            if result is None:
+                result = _strip(word, rv, NOUN)
+    word = word if result is None else result
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    # Шаг 3: словообразовательный суффикс в R2
+    word = _strip(word, r2, ((), DERIVATIONAL)) or word
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 1 > rv:
+        word = word[:-1]
+    else:
+        superlative = _strip(word, rv, ((), SUPERLATIVE))
+        if superlative is not None:
+            word = superlative[:-1] if superlative.endswith('нн') else superlative
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase the text and replace every word with its stem."""
+    return ' '.join(stem(word) for word in re.findall(r'\w+', text.lower()))
+
+
+def normalize_list(phrases: Iterable[str]) -> List[str]:
+    return [normalize_text(phrase) for phrase in phrases]
+
+
+class Vocabulary(dict):
+    """Keyword lists by key, with a stemmed copy prepared once for inflected queries."""
+
+    def __init__(self, entries: Dict[object, List[str]]):
+        super().__init__(entries)
+        self.normalized = {key: normalize_list(keywords) for key, keywords in entries.items()}
+
+    def matches(self, query: str, normalized_query: str = None) -> List:
+        """Keys with a keyword in the query as written or, if given, in its normalized form."""
+        return [
+            key for key, keywords in self.items()
+            if any(keyword in query for keyword in keywords)
+            or (normalized_query is not None and any(keyword in normalized_query for keyword in self.normalized[key]))
+        ]
@@ -0,0 +1,296 @@
+"""Char n-gram softmax regression: the cheap tier between the rules and the zero-shot model."""
+import glob
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+NGRAM_MODEL_DIR = os.getenv('NGRAM_MODEL_DIR', 'ngram_models')
+# Pin a weights version; the newest one is used by default
+NGRAM_MODEL_VERSION = os.getenv('NGRAM_MODEL_VERSION')
+# The tier answers only when the top probability beats the runner-up by this much
+NGRAM_MIN_MARGIN = float(os.getenv('NGRAM_MIN_MARGIN', '0.35'))
+# (query, final category) pairs used for retraining, e.g. logs/classifications.jsonl.
+# Holds raw user queries, so it is off unless a path is set
+CLASSIFICATION_LOG = os.getenv('CLASSIFICATION_LOG', '')
+# The log is rotated at this size; this many rotated files (.1 is the newest) are kept
+CLASSIFICATION_LOG_MAX_BYTES = int(os.getenv('CLASSIFICATION_LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+CLASSIFICATION_LOG_BACKUPS = int(os.getenv('CLASSIFICATION_LOG_BACKUPS', '3'))
+
+N_FEATURES = 2 ** 18
+NGRAM_RANGE = (2, 4)
+# Only decisions made by these methods are trusted as training labels
+TRUSTED_METHODS = ('rules', 'normalized', 'model')
+
+TIER_DECISIONS = metrics.counter(
+    'bot_ngram_tier_total', 'N-gram tier decisions on low rule scores; "answered" are avoided model calls', ['outcome']
+)
+
+
+def ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Iterator[str]:
+    """Character n-grams of every word padded with spaces, so word boundaries are features too."""
+    for word in re.findall(r'\w+', text.lower()):
+        padded = f" {word} "
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for start in range(max(1, len(padded) - n + 1)):
+                yield padded[start:start + n]
+
+
+def featurize(text: str, n_features: int = N_FEATURES) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed, L2-normalized n-gram counts as (indices, values)."""
+    counts = {}
+    for gram in ngrams(text):
+        index = zlib.crc32(gram.encode('utf-8')) % n_features
+        counts[index] = counts.get(index, 0) + 1
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    if len(values):
+        values /= np.linalg.norm(values)
+    return indices, values
+
+
+def _batch(features: Sequence[Tuple[np.ndarray, np.ndarray]]):
+    """Concatenate sparse rows into (row numbers, indices, values)."""
+    rows = np.concatenate([np.full(len(indices), row, dtype=np.int64) for row, (indices, _) in enumerate(features)])
+    indices = np.concatenate([indices for indices, _ in features])
+    values = np.concatenate([values for _, values in features])
+    return rows, indices, values
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class NgramClassifier:
+    """Multinomial logistic regression over hashed char n-grams, trained with sparse mini-batch SGD."""
+
+    def __init__(self, classes: List[str], weights: Optional[np.ndarray] = None, bias: Optional[np.ndarray] = None,
+                 n_features: int = N_FEATURES, version: int = 0):
+        self.classes = list(classes)
+        self.n_features = n_features
+        self.weights = weights if weights is not None else np.zeros((n_features, len(classes)), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(classes), dtype=np.float32)
+        self.version = version
+
+    def _logits(self, features) -> np.ndarray:
+        rows, indices, values = _batch(features)
+        logits = np.tile(self.bias, (len(features), 1))
+        np.add.at(logits, rows, self.weights[indices] * values[:, None])
+        return logits
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        return softmax(self._logits([featurize(text, self.n_features) for text in texts]))
+
+    def predict(self, text: str) -> Tuple[str, float, float]:
+        """Best category, its probability and the margin over the runner-up."""
+        proba = self.predict_proba([text])[0]
+        order = np.argsort(-proba)
+        margin = proba[order[0]] - (proba[order[1]] if len(order) > 1 else 0.0)
+        return self.classes[order[0]], float(proba[order[0]]), float(margin)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = 40, learning_rate: float = 5.0,
+            l2: float = 1e-5, batch_size: int = 16, seed: int = 0) -> 'NgramClassifier':
+        features = [featurize(text, self.n_features) for text in texts]
+        targets = np.array([self.classes.index(label) for label in labels])
+        rng = np.random.default_rng(seed)
+        for epoch in range(epochs):
+            # Скорость обучения плавно убывает к последней эпохе
+            rate = learning_rate / (1 + epoch * 0.2)
+            order = rng.permutation(len(features))
+            for start in range(0, len(order), batch_size):
+                chunk = order[start:start + batch_size]
+                batch = [features[i] for i in chunk]
+                rows, indices, values = _batch(batch)
+                gradient = softmax(self._logits(batch))
+                gradient[np.arange(len(chunk)), targets[chunk]] -= 1.0
+                gradient /= len(chunk)
+                # Обновляем только строки весов признаков, встретившихся в батче
+                np.add.at(self.weights, indices, -rate * values[:, None] * gradient[rows])
+                self.bias -= rate * gradient.sum(axis=0)
+                if l2:
+                    touched = np.unique(indices)
+                    self.weights[touched] *= 1 - rate * l2
+        return self
+
+    def accuracy(self, texts: Sequence[str], labels: Sequence[str]) -> float:
+        if not texts:
+            return 0.0
+        predicted = np.argmax(self.predict_proba(texts), axis=1)
+        return float(np.mean([self.classes[i] == label for i, label in zip(predicted, labels)]))
+
+    def save(self, directory: str = NGRAM_MODEL_DIR, **info) -> str:
+        """Write the weights as the next version; returns the path."""
+        os.makedirs(directory, exist_ok=True)
+        self.version = max([_version_of(path) for path in _weight_files(directory)] + [0]) + 1
+        path = os.path.join(directory, f"ngram-v{self.version}.npz")
+        meta = dict(info, classes=self.classes, n_features=self.n_features, ngram_range=NGRAM_RANGE,
+                    trained_at=datetime.now().isoformat(timespec='seconds'))
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, meta=json.dumps(meta, ensure_ascii=False))
+        os.replace(path + '.tmp', path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'NgramClassifier':
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if tuple(meta['ngram_range']) != NGRAM_RANGE:
+                raise ValueError(f"{path} was trained with n-grams {meta['ngram_range']}")
+            return cls(meta['classes'], data['weights'], data['bias'], meta['n_features'], _version_of(path))
+
+
+def _weight_files(directory: str) -> List[str]:
+    return glob.glob(os.path.join(directory, 'ngram-v*.npz'))
+
+
+def _version_of(path: str) -> int:
+    return int(re.search(r'ngram-v(\d+)\.npz$', path).group(1))
+
+
+def load_latest(directory: str = NGRAM_MODEL_DIR, version: Optional[str] = NGRAM_MODEL_VERSION) -> Optional[NgramClassifier]:
+    """The pinned or newest weights, or None if the tier has not been trained yet."""
+    files = _weight_files(directory)
+    if version:
+        files = [path for path in files if _version_of(path) == int(version)]
+    if not files:
+        return None
+    path = max(files, key=_version_of)
+    try:
+        classifier = NgramClassifier.load(path)
+    except Exception as e:
+        logger.error(f"Error loading n-gram tier {path}: {e}")
+        return None
+    logger.info("Loaded n-gram tier v%d (%d classes)", classifier.version, len(classifier.classes))
+    return classifier
+
+
+class ClassificationLog:
+    """Append (query, category, method) records to a size-rotated JSONL file from a background thread."""
+
+    def __init__(self, path: str = CLASSIFICATION_LOG, max_queue: int = 10000,
+                 max_bytes: int = CLASSIFICATION_LOG_MAX_BYTES, backups: int = CLASSIFICATION_LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: "queue.Queue[dict]" = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def record(self, query: str, category: str, method: str, confidence: float):
+        if not self.path:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write, name='classification-log', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait({
+                'ts': time.time(), 'query': query, 'category': category,
+                'method': method, 'confidence': round(confidence, 4)
+            })
+        except queue.Full:
+            # Журнал нужен только для обучения - при перегрузке записи можно терять
+            pass
+
+    def _rotate(self):
+        # path.1 - самый свежий архив, файлы старше backups удаляются
+        for number in range(self.backups, 0, -1):
+            source = f"{self.path}.{number - 1}" if number > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{number}")
+        if not self.backups:
+            os.remove(self.path)
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        f = open(self.path, 'a', encoding='utf-8')
+        try:
+            while True:
+                item = self._queue.get()
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+                if self._queue.empty():
+                    f.flush()
+                if self.max_bytes and f.tell() >= self.max_bytes:
+                    f.close()
+                    self._rotate()
+                    f = open(self.path, 'a', encoding='utf-8')
+        except Exception as e:
+            logger.error(f"Classification log stopped: {e}")
+        finally:
+            f.close()
+
+
+def log_files(path: str) -> List[str]:
+    """The log and its rotated files, oldest first."""
+    rotated = []
+    number = 1
+    while os.path.exists(f"{path}.{number}"):
+        rotated.append(f"{path}.{number}")
+        number += 1
+    return rotated[::-1] + [path]
+
+
+classification_log = ClassificationLog()
+
+
+def read_training_log(path: str) -> Iterable[Tuple[str, str]]:
+    """(query, category) pairs from the classification log and its rotated files, trusted methods only."""
+    if not path:
+        return
+    for file_path in log_files(path):
+        try:
+            f = open(file_path, encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if item.get('method') in TRUSTED_METHODS and item.get('query') and item.get('category'):
+                    yield item['query'], item['category']
+
+
+def train(log_path: str = CLASSIFICATION_LOG, directory: str = NGRAM_MODEL_DIR, epochs: int = 40,
+          holdout: float = 0.1, seed: int = 0) -> Tuple[str, dict]:
+    """Train a new weights version from category examples plus the classification log."""
+    from intents import categories, category_patterns
+    pairs = [(example, category) for category, patterns in category_patterns.items() for example in patterns['examples']]
+    examples = len(pairs)
+    # Один и тот же запрос учитываем один раз, с последней категорией
+    logged = dict(read_training_log(log_path))
+    pairs += list(logged.items())
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(pairs))
+    split = int(len(pairs) * holdout)
+    test = [pairs[i] for i in order[:split]]
+    train_pairs = [pairs[i] for i in order[split:]]
+
+    classifier = NgramClassifier(categories)
+    classifier.fit([text for text, _ in train_pairs], [label for _, label in train_pairs], epochs=epochs, seed=seed)
+    stats = {
+        'examples': examples,
+        'logged': len(logged),
+        'train': len(train_pairs),
+        'holdout': len(test),
+        'holdout_accuracy': round(classifier.accuracy([t for t, _ in test], [label for _, label in test]), 4),
+        'train_accuracy': round(classifier.accuracy([t for t, _ in train_pairs], [label for _, label in train_pairs]), 4)
+    }
+    path = classifier.save(directory, **stats)
+    return path, stats
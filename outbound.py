@@ -0,0 +1,207 @@
+"""Outbound delivery: long replies split on entry boundaries, sends paced by rate limits.
+
+Bot API rejects messages longer than 4096 characters and answers bursts above roughly
+30 messages per second overall, or about one per second in a chat, with 429 and a
+retry_after. ``OutboundSender.deliver`` splits the text, waits for a token from the
+global and the per-chat bucket before each part, keeps parts of one chat in order,
+honours retry_after for all chats at once and retries network errors with backoff.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Hashable, List
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import metrics
+from admission import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Bot API limit, counted in UTF-16 code units like Telegram does
+TELEGRAM_MAX_MESSAGE = 4096
+# Messages per second across all chats and per chat; the per-chat bucket allows short bursts
+OUTBOUND_RATE = float(os.getenv('OUTBOUND_RATE', '28'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+# First backoff after a network error, doubled on every further attempt
+OUTBOUND_BACKOFF = float(os.getenv('OUTBOUND_BACKOFF', '1.0'))
+
+DELIVERY_SECONDS = metrics.histogram(
+    'bot_outbound_delivery_seconds', 'Time from deliver() to the last part being accepted, including waits'
+)
+PARTS = metrics.histogram('bot_outbound_parts', 'Messages a reply was split into', buckets=(1, 2, 3, 5, 10, 20))
+
+
+def text_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _cut(text: str, limit: int) -> List[str]:
+    """Hard split of a single oversized line."""
+    parts = []
+    while text_length(text) > limit:
+        end = limit
+        # Не разрезаем суррогатную пару: длина считается в единицах UTF-16
+        while text_length(text[:end]) > limit:
+            end -= 1
+        parts.append(text[:end])
+        text = text[end:]
+    return parts + [text] if text else parts
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_MESSAGE) -> List[str]:
+    """Split a reply into parts of at most ``limit`` characters without breaking entries.
+
+    An entry is a line that does not start with whitespace together with the indented
+    lines after it, like a "• name" line and its details. Entries longer than the limit
+    are split by lines, and single lines longer than the limit are cut.
+    """
+    if text_length(text) <= limit:
+        return [text]
+    entries: List[List[str]] = []
+    for line in text.split('\n'):
+        if entries and line[:1].isspace():
+            entries[-1].append(line)
+        else:
+            entries.append([line])
+
+    parts = []
+    current = ''
+
+    def add(piece: str):
+        nonlocal current
+        candidate = f"{current}\n{piece}" if current else piece
+        if text_length(candidate) <= limit:
+            current = candidate
+            return
+        if current.strip():
+            parts.append(current)
+        current = piece
+
+    for entry in entries:
+        block = '\n'.join(entry)
+        if text_length(block) <= limit:
+            add(block)
+            continue
+        for line in entry:
+            for piece in _cut(line, limit) if text_length(line) > limit else [line]:
+                add(piece)
+    if current.strip():
+        parts.append(current)
+    return [part.strip('\n') for part in parts]
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+class OutboundSender:
+    """Paces bot.send_message with a global and per-chat token buckets; one instance per bot."""
+
+    def __init__(self, rate: float = OUTBOUND_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST, max_retries: int = OUTBOUND_MAX_RETRIES,
+                 backoff: float = OUTBOUND_BACKOFF, max_chats: int = 10000):
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_chats = max_chats
+        self._bucket = TokenBucket(rate, max(rate, 1.0))
+        self._chat_buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        # Замок чата и число ожидающих его отправок, чтобы удалять замки неактивных чатов
+        self._chat_locks: Dict[Hashable, list] = {}
+        self._paused_until = 0.0
+        self.outcomes: Dict[str, int] = {'sent': 0, 'blocked': 0, 'failed': 0}
+        self.retries: Dict[str, int] = {'retry_after': 0, 'network': 0}
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            # Ограничиваем память: вытесняем давно не писавшие чаты
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _wait_turn(self, chat_id: Hashable):
+        chat_bucket = self._chat_bucket(chat_id)
+        while True:
+            # Токен берется только когда свободны оба бакета, иначе общий тратился бы впустую
+            now = time.monotonic()
+            wait = max(self._paused_until - now, chat_bucket.delay(now=now), self._bucket.delay(now=now))
+            if wait <= 0:
+                chat_bucket.try_take(now=now)
+                self._bucket.try_take(now=now)
+                return
+            await asyncio.sleep(wait)
+
+    async def _send_part(self, bot, chat_id: Hashable, text: str, **kwargs) -> str:
+        for attempt in range(self.max_retries + 1):
+            await self._wait_turn(chat_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return 'sent'
+            except RetryAfter as e:
+                # 429 относится ко всему боту - приостанавливаем отправку во все чаты
+                delay = retry_after_seconds(e)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self.retries['retry_after'] += 1
+                logger.warning("Flood limit hit, pausing sends for %.1fs", delay)
+            except Forbidden:
+                return 'blocked'
+            except BadRequest as e:
+                logger.warning("Message to chat %s rejected: %s", chat_id, e)
+                return 'failed'
+            except TelegramError as e:
+                self.retries['network'] += 1
+                logger.warning("Send to chat %s failed (attempt %d): %s", chat_id, attempt + 1, e)
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        return 'failed'
+
+    async def deliver(self, bot, chat_id: Hashable, text: str, **kwargs) -> str:
+        """Send ``text`` as one or more messages; returns "sent", "blocked" or "failed"."""
+        started = time.perf_counter()
+        parts = split_message(text)
+        PARTS.observe(len(parts))
+        entry = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        outcome = 'sent'
+        try:
+            # Части одного ответа и ответы одному чату уходят по порядку
+            async with entry[0]:
+                for part in parts:
+                    outcome = await self._send_part(bot, chat_id, part, **kwargs)
+                    self.outcomes[outcome] += 1
+                    if outcome != 'sent':
+                        break
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat_id]
+        DELIVERY_SECONDS.observe(time.perf_counter() - started)
+        return outcome
+
+
+# Shared by replies and the digest so that both count against the same Bot API limits
+sender = OutboundSender()
+
+
+def _collect_outbound_metrics():
+    for outcome, value in sender.outcomes.items():
+        yield ('bot_outbound_messages_total', 'counter', 'Outbound message parts by delivery outcome',
+               {'outcome': outcome}, value)
+    for reason, value in sender.retries.items():
+        yield ('bot_outbound_retries_total', 'counter', 'Outbound send retries by reason', {'reason': reason}, value)
+
+
+metrics.REGISTRY.register_collector(_collect_outbound_metrics)
@@ -0,0 +1,397 @@
+"""Inline-mode autocomplete: a prefix trie over employees, activities and tasks with cached result articles."""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+import metrics
+from models import Activity, Employee, Task, get_session, register_change_hook
+
+logger = logging.getLogger(__name__)
+
+# Telegram shows at most 50 inline results
+INLINE_RESULTS = min(int(os.getenv('INLINE_RESULTS', '20')), 50)
+# Distinct queries whose rendered articles are kept in memory
+INLINE_CACHE_SIZE = int(os.getenv('INLINE_CACHE_SIZE', '2048'))
+# Seconds Telegram may cache an answer on its side; short, because cards change on writes
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '10'))
+
+KINDS = ('employee', 'activity', 'task')
+# Trie nodes with at least this many cards are put in result order when the index is built
+EAGER_NODE_SIZE = 256
+
+Card = namedtuple('Card', 'kind id title description text')
+
+LOOKUP_SECONDS = metrics.histogram(
+    'bot_inline_lookup_seconds', 'Time to answer an inline query from the prefix index',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+)
+
+_WORD = re.compile(r'\w+')
+
+
+def words(text: Optional[str]) -> List[str]:
+    """Lowercase words of a name or title, with "ё" folded into "е"."""
+    return _WORD.findall((text or '').lower().replace('ё', 'е'))
+
+
+def normalize_query(query: str) -> Tuple[str, ...]:
+    """Query terms in order, duplicates and terms that prefix another term dropped."""
+    terms = []
+    for term in words(query):
+        if any(other.startswith(term) for other in terms):
+            continue
+        terms = [other for other in terms if not term.startswith(other)] + [term]
+    return tuple(terms)
+
+
+def _employee_card(row) -> Tuple[Card, List[str]]:
+    subtitle = ', '.join(part for part in (row.position, row.department) if part)
+    lines = [f"👤 {row.name}"]
+    if subtitle:
+        lines.append(f"💼 {subtitle}")
+    if row.email:
+        lines.append(f"📧 {row.email}")
+    if row.phone:
+        lines.append(f"📱 {row.phone}")
+    return Card('employee', row.id, row.name, subtitle, '\n'.join(lines)), words(row.name) + words(row.position)
+
+
+def _activity_card(row) -> Tuple[Card, List[str]]:
+    when = ' '.join(part for part in (
+        row.date.strftime('%d.%m.%Y') if row.date else '', row.time.strftime('%H:%M') if row.time else ''
+    ) if part)
+    seats = f"{row.participant_count}/{row.max_participants}" if row.max_participants else str(row.participant_count)
+    subtitle = ' · '.join(part for part in (when, row.location, f"👥 {seats}") if part)
+    lines = [f"🎯 {row.name}" + (f" ({row.type.value})" if row.type else "")]
+    if when:
+        lines.append(f"📅 {when}")
+    if row.location:
+        lines.append(f"📍 {row.location}")
+    lines.append(f"👥 Участников: {seats}")
+    lines.append(f"Присоединиться: /join_activity {row.id}")
+    return Card('activity', row.id, row.name, subtitle, '\n'.join(lines)), words(row.name)
+
+
+def _task_card(row) -> Tuple[Card, List[str]]:
+    # Статус в карточку не попадает: массовая смена статуса не вызывает хуки изменений
+    deadline = f"до {row.deadline.strftime('%d.%m.%Y')}" if row.deadline else ""
+    subtitle = ' · '.join(part for part in (f"#{row.id}", row.assignee, deadline) if part)
+    lines = [f"📋 #{row.id} {row.title}"]
+    if row.assignee:
+        lines.append(f"👤 {row.assignee}")
+    if row.deadline:
+        lines.append(f"📅 Срок: {row.deadline.strftime('%d.%m.%Y')}")
+    return Card('task', row.id, row.title, subtitle, '\n'.join(lines)), words(row.title)
+
+
+def render_article(card: Card) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id=f"{card.kind}:{card.id}",
+        title=card.title,
+        description=card.description or None,
+        input_message_content=InputTextMessageContent(card.text)
+    )
+
+
+def _node() -> list:
+    # Узел: [дочерние узлы по символу, ключи карточек с таким префиксом,
+    # их ранги по порядку выдачи - строятся при первом запросе к узлу]
+    return [{}, set(), None]
+
+
+def _find(root: list, prefix: str) -> Optional[list]:
+    node = root
+    for char in prefix:
+        node = node[0].get(char)
+        if node is None:
+            return None
+    return node
+
+
+def _add_word(root: list, word: str, key: Tuple[str, int], rank: tuple):
+    node = root
+    for char in word:
+        node = node[0].setdefault(char, _node())
+        # Слова одной карточки с общим префиксом учитываются в узле один раз
+        if key not in node[1]:
+            node[1].add(key)
+            if node[2] is not None:
+                bisect.insort(node[2], rank)
+
+
+def _discard_word(root: list, word: str, key: Tuple[str, int], rank: tuple):
+    path = [root]
+    for char in word:
+        node = path[-1][0].get(char)
+        if node is None:
+            break
+        if key in node[1]:
+            node[1].discard(key)
+            if node[2] is not None:
+                del node[2][bisect.bisect_left(node[2], rank)]
+        path.append(node)
+    # Удаляем опустевшие ветви, чтобы трие не рос от переименований
+    for depth in range(len(path) - 1, 0, -1):
+        if path[depth][1] or path[depth][0]:
+            break
+        del path[depth - 1][0][word[depth - 1]]
+
+
+class PrefixIndex:
+    """Trie over the words of employee names and positions, activity names and task titles.
+
+    Every trie node keeps the set of cards that have a word with the node's prefix
+    and, once queried, the same cards in result order, kept sorted on writes. A query
+    walks the trie once per term and scans the smallest ordered list until it has
+    enough cards present in the other terms' sets. Rendered articles are cached per
+    normalized query and dropped only when a changed card matched that query before
+    or after the change.
+    """
+
+    def __init__(self, max_results: int = INLINE_RESULTS, cache_size: int = INLINE_CACHE_SIZE):
+        self.max_results = max_results
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._root = _node()
+        # Первые слова названий: совпадение с ними поднимает карточку в начало выдачи
+        self._heads = _node()
+        self._cards: Dict[Tuple[str, int], Card] = {}
+        self._words: Dict[Tuple[str, int], Tuple[str, ...]] = {}
+        self._rank: Dict[Tuple[str, int], Tuple[int, str, int]] = {}
+        self._cache: "OrderedDict[Tuple[str, ...], List[InlineQueryResultArticle]]" = OrderedDict()
+        self.stats: Dict[str, int] = {'hit': 0, 'miss': 0}
+
+    # Загрузка
+    @staticmethod
+    def _execute(query):
+        session = get_session()
+        try:
+            return session.execute(query).all()
+        finally:
+            session.close()
+
+    def _select_employees(self, ids=None):
+        query = select(Employee.id, Employee.name, Employee.position, Employee.department, Employee.email, Employee.phone)
+        if ids is not None:
+            query = query.where(Employee.id.in_(ids))
+        return [_employee_card(row) for row in self._execute(query)]
+
+    def _select_activities(self, ids=None):
+        query = select(
+            Activity.id, Activity.name, Activity.type, Activity.date, Activity.time, Activity.location,
+            Activity.participant_count, Activity.max_participants
+        ).where(Activity.is_active.is_(True))
+        if ids is not None:
+            query = query.where(Activity.id.in_(ids))
+        return [_activity_card(row) for row in self._execute(query)]
+
+    def _select_tasks(self, ids=None, assignee_ids=None):
+        query = select(Task.id, Task.title, Task.deadline, Employee.name.label('assignee')).outerjoin(
+            Employee, Task.assignee_id == Employee.id
+        )
+        if ids is not None:
+            query = query.where(Task.id.in_(ids))
+        if assignee_ids is not None:
+            query = query.where(Task.assignee_id.in_(assignee_ids))
+        return [_task_card(row) for row in self._execute(query)]
+
+    def load(self):
+        """Build the trie from the database."""
+        cards = self._select_employees() + self._select_activities() + self._select_tasks()
+        self.build(cards)
+        logger.info("Prefix index loaded: %d cards", len(cards))
+
+    def build(self, cards: Iterable[Tuple[Card, List[str]]]):
+        """Replace the whole index with (card, words) pairs."""
+        with self._lock:
+            self._root = _node()
+            self._heads = _node()
+            self._cards.clear()
+            self._words.clear()
+            self._rank.clear()
+            self._cache.clear()
+            for card, card_words in cards:
+                self._insert(card, card_words)
+            # Крупные узлы (короткие префиксы) упорядочиваются сразу, остальные - при первом запросе
+            stack = [*self._root[0].values(), *self._heads[0].values()]
+            while stack:
+                node = stack.pop()
+                if len(node[1]) >= EAGER_NODE_SIZE:
+                    self._ranked(node)
+                    stack.extend(node[0].values())
+            self._loaded = True
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    # Изменение трие; вызывается под блокировкой
+    def _insert(self, card: Card, card_words: List[str]):
+        key = (card.kind, card.id)
+        unique = tuple(dict.fromkeys(card_words))
+        rank = (KINDS.index(card.kind), ' '.join(words(card.title)), card.id)
+        self._cards[key] = card
+        self._words[key] = unique
+        self._rank[key] = rank
+        for word in unique:
+            _add_word(self._root, word, key, rank)
+        head = words(card.title)[:1]
+        if head:
+            _add_word(self._heads, head[0], key, rank)
+
+    def _remove(self, key: Tuple[str, int]):
+        card_words = self._words.pop(key, None)
+        if card_words is None:
+            return
+        card = self._cards.pop(key)
+        rank = self._rank.pop(key)
+        for word in card_words:
+            _discard_word(self._root, word, key, rank)
+        head = words(card.title)[:1]
+        if head:
+            _discard_word(self._heads, head[0], key, rank)
+
+    def _invalidate(self, changed: List[Tuple[str, ...]]):
+        """Drop cached answers of queries that any of the changed word sets matches."""
+        stale = [
+            terms for terms in self._cache
+            if any(all(any(word.startswith(term) for word in card_words) for term in terms) for card_words in changed)
+        ]
+        for terms in stale:
+            del self._cache[terms]
+
+    def _replace(self, kind: str, ids: Iterable[int], fresh: List[Tuple[Card, List[str]]]):
+        with self._lock:
+            changed = []
+            for item_id in ids:
+                old = self._words.get((kind, item_id))
+                if old is not None:
+                    changed.append(old)
+                    self._remove((kind, item_id))
+            for card, card_words in fresh:
+                self._remove((card.kind, card.id))
+                self._insert(card, card_words)
+                changed.append(self._words[(card.kind, card.id)])
+            self._invalidate(changed)
+
+    # Инкрементальное обновление
+    def update_employees(self, ids: Iterable[int]):
+        """Re-read the given employees and the tasks assigned to them; missing rows are removed."""
+        if not self._loaded:
+            return
+        ids = set(ids)
+        self._replace('employee', ids, self._select_employees(ids))
+        # В карточках задач указано имя исполнителя
+        tasks = self._select_tasks(assignee_ids=ids)
+        self._replace('task', [card.id for card, _ in tasks], tasks)
+
+    def update_activities(self, ids: Iterable[int]):
+        """Re-read the given activities; missing and inactive ones are removed."""
+        if not self._loaded:
+            return
+        ids = set(ids)
+        self._replace('activity', ids, self._select_activities(ids))
+
+    def update_tasks(self, ids: Iterable[int]):
+        """Re-read the given tasks; missing rows are removed."""
+        if not self._loaded:
+            return
+        ids = set(ids)
+        self._replace('task', ids, self._select_tasks(ids))
+
+    # Запросы
+    def _ranked(self, node: list) -> list:
+        if node[2] is None:
+            node[2] = sorted(self._rank[key] for key in node[1])
+        return node[2]
+
+    def _lookup(self, terms: Tuple[str, ...]) -> List[Card]:
+        nodes = []
+        for term in terms:
+            node = _find(self._root, term)
+            if node is None:
+                return []
+            nodes.append(node)
+        nodes.sort(key=lambda node: len(node[1]))
+        smallest, others = nodes[0], [node[1] for node in nodes[1:]]
+        found: List[Tuple[str, int]] = []
+        taken: Set[Tuple[str, int]] = set()
+
+        def take(ranks, required):
+            for rank in ranks:
+                if len(found) >= self.max_results:
+                    return
+                key = (KINDS[rank[0]], rank[2])
+                if key not in taken and all(key in keys for keys in required):
+                    taken.add(key)
+                    found.append(key)
+
+        # Сначала карточки, название которых начинается с первого слова запроса,
+        # затем остальные; внутри групп - сотрудники, активности, задачи по алфавиту.
+        # Обходится меньший из упорядоченных списков, поэтому короткий префикс не сортирует тысячи карточек
+        head = _find(self._heads, terms[0])
+        if head is not None:
+            if len(head[1]) < len(smallest[1]):
+                take(self._ranked(head), [node[1] for node in nodes])
+            else:
+                take(self._ranked(smallest), others + [head[1]])
+        take(self._ranked(smallest), others)
+        return [self._cards[key] for key in found]
+
+    def search(self, query: str) -> List[Card]:
+        """Cards matching every word of ``query`` as a prefix, best first."""
+        terms = normalize_query(query)
+        if not terms:
+            return []
+        self.ensure_loaded()
+        with self._lock:
+            return self._lookup(terms)
+
+    def articles(self, query: str) -> List[InlineQueryResultArticle]:
+        """Inline results for ``query``, rendered once per normalized query."""
+        started = time.perf_counter()
+        terms = normalize_query(query)
+        if not terms:
+            return []
+        self.ensure_loaded()
+        with self._lock:
+            results = self._cache.get(terms)
+            if results is not None:
+                self._cache.move_to_end(terms)
+                self.stats['hit'] += 1
+            else:
+                results = [render_article(card) for card in self._lookup(terms)]
+                self._cache[terms] = results
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                self.stats['miss'] += 1
+        LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        return results
+
+    def __len__(self):
+        return len(self._cards)
+
+
+prefix_index = PrefixIndex()
+
+register_change_hook(Employee, prefix_index.update_employees)
+register_change_hook(Activity, prefix_index.update_activities)
+register_change_hook(Task, prefix_index.update_tasks)
+
+
+def _collect_prefix_metrics():
+    for result, value in prefix_index.stats.items():
+        yield ('bot_inline_cache_total', 'counter', 'Inline queries by article cache result', {'result': result}, value)
+    yield ('bot_inline_cards', 'gauge', 'Cards in the inline prefix index', {}, len(prefix_index))
+
+
+metrics.REGISTRY.register_collector(_collect_prefix_metrics)
@@ -0,0 +1,268 @@
+"""Query builders behind the bot's free-text searches, shared by the bot and the HTTP API.
+
+Every builder takes a session and the user's query and returns either an ORM query,
+which callers paginate in SQL, or a ready list when the answer comes from an
+in-memory index.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+import metrics
+import semantic_search
+from calendar_index import calendar_index, next_occurrence
+from export import plain_value
+from intents import department_keywords, role_keywords, skill_keywords, task_priority_keywords, task_status_keywords
+from models import (
+    Activity, ActivityType, Employee, Event, EventType, Task, TaskStatus, activity_participants, event_participants
+)
+from morphology import normalize_text
+
+logger = logging.getLogger(__name__)
+
+SearchResult = Union[Query, list]
+
+EMPLOYEE_FIELDS = ('id', 'name', 'position', 'department', 'email', 'phone', 'hire_date', 'birthday',
+                   'skills', 'interests', 'bio')
+# Week and month windows also return activities from the calendar index, hence kind and the activity columns
+EVENT_FIELDS = ('kind', 'id', 'name', 'type', 'date', 'time', 'location', 'description', 'participant_count',
+                'max_participants', 'tags')
+TASK_FIELDS = ('id', 'title', 'description', 'status', 'priority', 'deadline', 'tags', 'assignee_id',
+               'created_at', 'updated_at')
+ACTIVITY_FIELDS = ('id', 'name', 'type', 'date', 'time', 'location', 'description', 'max_participants',
+                   'participant_count', 'tags', 'created_at', 'updated_at')
+
+
+def _periods(today: date) -> Tuple[date, date, date]:
+    """Start and end of the current week and the end of the 30-day window."""
+    week_start = today - timedelta(days=today.weekday())
+    return week_start, week_start + timedelta(days=6), today + timedelta(days=30)
+
+
+def mentioned_employee(session, query_lower: str) -> Optional[Employee]:
+    """First employee whose name contains a word of the query longer than three letters."""
+    for word in query_lower.split():
+        if len(word) > 3:  # Игнорируем короткие слова
+            employee = session.query(Employee).filter(Employee.name.ilike(f'%{word}%')).first()
+            if employee:
+                return employee
+    return None
+
+
+def employees_query(session, query: str) -> SearchResult:
+    """Employees matching the skills, interests, roles and departments named in the query."""
+    query_lower = query.lower()
+
+    # Извлекаем поисковые термины; словоформы сверяем и по основам слов
+    normalized_query = normalize_text(query_lower)
+    search_interests = []
+    search_skills = skill_keywords.matches(query_lower, normalized_query)
+    search_roles = role_keywords.matches(query_lower, normalized_query)
+    search_departments = department_keywords.matches(query_lower, normalized_query)
+    logger.debug("Found skills: %s, roles: %s, departments: %s", search_skills, search_roles, search_departments)
+
+    # Проверяем интересы
+    if 'йога' in query_lower:
+        search_interests.append('йога')
+    if 'игра' in query_lower or 'игры' in query_lower:
+        search_interests.append('настольные игры')
+    if 'путешествия' in query_lower:
+        search_interests.append('путешествия')
+    if 'танцы' in query_lower:
+        search_interests.append('танцы')
+    if 'теннис' in query_lower:
+        search_interests.append('теннис')
+
+    # Формируем запрос
+    query_filters = []
+    if search_skills:
+        query_filters.append(or_(*[Employee.skills.ilike(f'%{skill}%') for skill in search_skills]))
+    if search_interests:
+        query_filters.append(or_(*[Employee.interests.ilike(f'%{interest}%') for interest in search_interests]))
+    if search_roles:
+        query_filters.append(or_(*[
+            Employee.position.ilike(f'%{keyword}%') for role in search_roles for keyword in role_keywords[role]
+        ]))
+    if search_departments:
+        query_filters.append(or_(*[
+            Employee.department.ilike(f'%{keyword}%')
+            for dept in search_departments for keyword in department_keywords[dept]
+        ]))
+
+    # Если запрос содержит "все" или "всех", показываем всех сотрудников
+    if 'все' in query_lower or 'всех' in query_lower:
+        return session.query(Employee).order_by(Employee.id)
+    if query_filters:
+        return session.query(Employee).filter(and_(*query_filters)).order_by(Employee.id)
+
+    # Без явных критериев сначала пробуем семантический поиск по профилям
+    with metrics.stage('embed'):
+        matches = semantic_search.semantic_index.search(query)
+    if matches:
+        ranked = {employee_id: position for position, (employee_id, _) in enumerate(matches)}
+        employees = session.query(Employee).filter(Employee.id.in_(ranked)).all()
+        employees.sort(key=lambda emp: ranked[emp.id])
+        return employees
+
+    # Если нет конкретных критериев, ищем по всему тексту
+    return session.query(Employee).filter(or_(
+        Employee.name.ilike(f'%{query}%'),
+        Employee.position.ilike(f'%{query}%'),
+        Employee.department.ilike(f'%{query}%'),
+        Employee.interests.ilike(f'%{query}%'),
+        Employee.skills.ilike(f'%{query}%')
+    )).order_by(Employee.id)
+
+
+def is_birthday_query(query: str) -> bool:
+    query_lower = query.lower()
+    return 'день рождения' in query_lower or 'дни рождения' in query_lower
+
+
+def birthdays(session, query: str, today: Optional[date] = None) -> List[Tuple[date, object]]:
+    """(date, calendar_index.Birthday) pairs for a birthday query, from the calendar index."""
+    query_lower = query.lower()
+    today = today or datetime.now().date()
+    week_start, week_end, month_end = _periods(today)
+    employee = mentioned_employee(session, query_lower)
+    if employee:
+        birthday = calendar_index.birthday_of(employee.id)
+        return [(next_occurrence(birthday.birthday, today), birthday)] if birthday else []
+    if 'неделе' in query_lower or 'недели' in query_lower:
+        return calendar_index.birthdays_between(week_start, week_end)
+    return calendar_index.birthdays_between(today, month_end)
+
+
+def events_query(session, query: str, today: Optional[date] = None) -> SearchResult:
+    """Events of a mentioned employee, dated entries of this week or month, trainings or a text match."""
+    query_lower = query.lower()
+    today = today or datetime.now().date()
+    week_start, week_end, month_end = _periods(today)
+
+    employee = mentioned_employee(session, query_lower)
+    if employee:
+        # Если найден сотрудник, ищем мероприятия, связанные с ним
+        return session.query(Event).join(event_participants).join(Employee).filter(
+            Employee.id == employee.id
+        ).order_by(Event.date, Event.id)
+    if 'неделе' in query_lower or 'недели' in query_lower:
+        # Мероприятия и активности на текущую неделю - из календарного индекса
+        return calendar_index.entries_between(week_start, week_end)
+    if 'месяц' in query_lower or 'месяца' in query_lower:
+        # Мероприятия и активности на ближайший месяц
+        return calendar_index.entries_between(today, month_end)
+    if 'семинар' in query_lower or 'тренинг' in query_lower:
+        return session.query(Event).filter(Event.type == EventType.TRAINING).order_by(Event.date, Event.id)
+    # Поиск по названию или типу
+    return session.query(Event).filter(or_(
+        Event.name.ilike(f'%{query}%'),
+        Event.type.ilike(f'%{query}%'),
+        Event.description.ilike(f'%{query}%')
+    )).order_by(Event.date, Event.id)
+
+
+def tasks_query(session, query: str, today: Optional[date] = None, assignee_id: Optional[int] = None) -> SearchResult:
+    """Tasks filtered by the assignee, statuses, priorities, deadline window and tag named in the query.
+
+    A known ``assignee_id`` ("мои задачи") replaces the lookup of an employee named in the query.
+    """
+    query_lower = query.lower()
+    today = today or datetime.now().date()
+    query_filters = []
+
+    # Проверяем, есть ли в запросе упоминание сотрудника
+    employee = mentioned_employee(session, query_lower) if assignee_id is None else None
+    if employee:
+        logger.debug("Found employee: %s", employee.name)
+        query_filters.append(Task.assignee_id == employee.id)
+
+    # Проверяем статусы задач и приоритеты, в том числе по основам слов
+    normalized_query = normalize_text(query_lower)
+    for status in task_status_keywords.matches(query_lower, normalized_query):
+        logger.debug("Found status: %s", status)
+        query_filters.append(Task.status == TaskStatus[status])
+    for priority in task_priority_keywords.matches(query_lower, normalized_query):
+        logger.debug("Found priority: %s", priority)
+        query_filters.append(Task.priority == priority)
+
+    # Проверяем сроки
+    if 'сегодня' in query_lower:
+        query_filters.append(Task.deadline == today)
+    elif 'завтра' in query_lower:
+        query_filters.append(Task.deadline == today + timedelta(days=1))
+    elif 'неделе' in query_lower or 'недели' in query_lower:
+        query_filters.append(Task.deadline <= today + timedelta(days=6))
+    elif 'месяц' in query_lower or 'месяца' in query_lower:
+        query_filters.append(Task.deadline <= today + timedelta(days=30))
+
+    # Проверяем теги
+    if 'тег' in query_lower or 'теги' in query_lower:
+        tag = query_lower.split('тег')[-1].strip()
+        if tag:
+            logger.debug("Filtering by tag: %s", tag)
+            query_filters.append(Task.tags.ilike(f'%{tag}%'))
+
+    # Если нет конкретных фильтров, ищем по всему тексту
+    if assignee_id is not None:
+        query_filters.append(Task.assignee_id == assignee_id)
+    elif not query_filters:
+        query_filters.append(or_(
+            Task.title.ilike(f'%{query}%'),
+            Task.description.ilike(f'%{query}%'),
+            Task.tags.ilike(f'%{query}%')
+        ))
+    logger.debug("Applying filters: %s", query_filters)
+    return session.query(Task).filter(and_(*query_filters)).order_by(Task.id)
+
+
+def activities_query(session, query: str, today: Optional[date] = None) -> SearchResult:
+    """Active activities of a mentioned employee, of this week or month, of a type or matching the text."""
+    query_lower = query.lower()
+    today = today or datetime.now().date()
+    week_start, week_end, month_end = _periods(today)
+    active = session.query(Activity).filter(Activity.is_active == True)
+
+    employee = mentioned_employee(session, query_lower)
+    if employee:
+        # Если найден сотрудник, ищем активности, связанные с ним
+        activities = active.join(activity_participants).join(Employee).filter(Employee.id == employee.id)
+    elif 'все' in query_lower or 'всех' in query_lower:
+        activities = active
+    elif 'неделе' in query_lower or 'недели' in query_lower:
+        activities = active.filter(Activity.date >= week_start, Activity.date <= week_end)
+    elif 'месяц' in query_lower or 'месяца' in query_lower:
+        activities = active.filter(Activity.date >= today, Activity.date <= month_end)
+    elif 'йога' in query_lower:
+        activities = active.filter(Activity.type == ActivityType.TRAINING, Activity.name.ilike('%йога%'))
+    elif 'игра' in query_lower or 'игры' in query_lower:
+        activities = active.filter(Activity.type == ActivityType.GAME)
+    elif 'обед' in query_lower:
+        activities = active.filter(Activity.type == ActivityType.LUNCH)
+    else:
+        # Поиск по названию, типу или описанию
+        activities = active.filter(or_(
+            Activity.name.ilike(f'%{query}%'),
+            Activity.description.ilike(f'%{query}%'),
+            Activity.type.ilike(f'%{query}%'),
+            Activity.tags.ilike(f'%{query}%')
+        ))
+    return activities.order_by(Activity.date, Activity.id)
+
+
+def fetch_all(result: SearchResult) -> list:
+    return result if isinstance(result, list) else result.all()
+
+
+def fetch_page(result: SearchResult, offset: int, limit: int) -> Tuple[list, int]:
+    """One page of rows and the total count; ORM queries are paginated in SQL."""
+    if isinstance(result, list):
+        return result[offset:offset + limit], len(result)
+    return result.offset(offset).limit(limit).all(), result.order_by(None).count()
+
+
+def as_dict(row, fields) -> Dict:
+    """JSON-ready fields of an ORM object or a calendar entry; missing attributes are skipped."""
+    return {field: plain_value(getattr(row, field)) for field in fields if hasattr(row, field)}
@@ -0,0 +1,379 @@
+"""Semantic employee search over sentence embeddings stored in a memory-mapped matrix."""
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from models import Employee, get_session, register_change_hook
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_SEARCH = os.getenv('SEMANTIC_SEARCH', '0') == '1'
+# Small multilingual model; any encoder that works with mean pooling will do
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+EMBEDDING_DIR = os.getenv('EMBEDDING_DIR', 'embeddings')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+# Rows read per keyset page while syncing; no read transaction stays open while embedding
+EMBEDDING_PAGE_SIZE = int(os.getenv('EMBEDDING_PAGE_SIZE', '1000'))
+SEMANTIC_TOP_K = int(os.getenv('SEMANTIC_TOP_K', '5'))
+# Matches below this cosine similarity are not shown
+SEMANTIC_MIN_SCORE = float(os.getenv('SEMANTIC_MIN_SCORE', '0.35'))
+
+
+class Embedder:
+    """Mean-pooled, L2-normalized sentence embeddings from a local transformers encoder."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._model = None
+
+    def _load(self):
+        # Модель загружается при первом использовании, чтобы не замедлять старт бота
+        from transformers import AutoModel, AutoTokenizer
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self._model = AutoModel.from_pretrained(self.model_name).eval()
+
+    @property
+    def dim(self) -> int:
+        with self._lock:
+            if self._model is None:
+                self._load()
+        return self._model.config.hidden_size
+
+    def encode(self, texts: Sequence[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        import torch
+        with self._lock:
+            if self._model is None:
+                self._load()
+            chunks = []
+            for start in range(0, len(texts), batch_size):
+                batch = self._tokenizer(
+                    list(texts[start:start + batch_size]), padding=True, truncation=True,
+                    max_length=256, return_tensors='pt'
+                )
+                with torch.no_grad():
+                    hidden = self._model(**batch).last_hidden_state
+                # Среднее по токенам без паддинга
+                mask = batch['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                chunks.append(pooled.numpy())
+        vectors = np.concatenate(chunks).astype(np.float32) if chunks else np.zeros((0, self.dim), np.float32)
+        return normalize(vectors)
+
+
+_embedder: Optional[Embedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Embedder:
+    """Shared embedder, so the model is loaded once per process."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = Embedder()
+        return _embedder
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def text_hash(text: str) -> int:
+    """Stable 63-bit hash used to detect rows whose text changed."""
+    return int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little') >> 1
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class VectorStore:
+    """Append-only float32 matrix on disk, opened with np.memmap, plus row IDs and text hashes.
+
+    Updated rows are written in place; removed rows are zeroed and their ID set to -1,
+    so the file never has to be rewritten for a single change.
+    """
+
+    def __init__(self, directory: str, name: str, model_name: str):
+        self.directory = directory
+        self.name = name
+        self.model_name = model_name
+        self.dim = 0
+        self.count = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.hashes = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._row_of = {}
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{suffix}")
+
+    def open(self) -> bool:
+        """Map an existing store; False if it is missing or was built with another model."""
+        try:
+            with open(self._path('json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return False
+        if meta.get('model') != self.model_name:
+            logger.info("Vector store %s was built with %s, rebuilding", self.name, meta.get('model'))
+            return False
+        self.dim, self.count = meta['dim'], meta['count']
+        self.ids = np.load(self._path('ids.npy'))[:self.count]
+        self.hashes = np.load(self._path('hash.npy'))[:self.count]
+        self._map()
+        return True
+
+    def create(self, dim: int):
+        os.makedirs(self.directory, exist_ok=True)
+        self.dim, self.count = dim, 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.hashes = np.zeros(0, dtype=np.int64)
+        open(self._path('f32'), 'wb').close()
+        self._save_meta()
+        self._map()
+
+    def _map(self):
+        if self.count:
+            self.vectors = np.memmap(self._path('f32'), dtype=np.float32, mode='r+', shape=(self.count, self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._row_of = {int(row_id): row for row, row_id in enumerate(self.ids) if row_id >= 0}
+
+    def _save_meta(self):
+        # ID и хеши пишутся во временные файлы и подменяются атомарно
+        for suffix, values in (('ids.npy', self.ids), ('hash.npy', self.hashes)):
+            tmp = self._path(suffix + '.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp, self._path(suffix))
+        tmp = self._path('json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_name, 'dim': self.dim, 'count': self.count}, f)
+        os.replace(tmp, self._path('json'))
+
+    def row_of(self, row_id: int) -> Optional[int]:
+        return self._row_of.get(row_id)
+
+    def upsert(self, ids: Sequence[int], hashes: Sequence[int], vectors: np.ndarray) -> List[int]:
+        """Write vectors in place for known IDs and append the rest; returns their row numbers."""
+        rows = []
+        append_ids, append_hashes, append_vectors = [], [], []
+        for row_id, row_hash, vector in zip(ids, hashes, vectors):
+            row = self._row_of.get(row_id)
+            if row is None:
+                append_ids.append(row_id)
+                append_hashes.append(row_hash)
+                append_vectors.append(vector)
+                rows.append(self.count + len(append_ids) - 1)
+            else:
+                self.vectors[row] = vector
+                self.hashes[row] = row_hash
+                rows.append(row)
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+        if append_ids:
+            with open(self._path('f32'), 'ab') as f:
+                f.write(np.asarray(append_vectors, dtype=np.float32).tobytes())
+            self.ids = np.concatenate([self.ids, np.asarray(append_ids, dtype=np.int64)])
+            self.hashes = np.concatenate([self.hashes, np.asarray(append_hashes, dtype=np.int64)])
+            self.count += len(append_ids)
+            self._map()
+        self._save_meta()
+        return rows
+
+    def remove(self, ids: Iterable[int]) -> List[int]:
+        rows = [self._row_of.pop(row_id) for row_id in ids if row_id in self._row_of]
+        for row in rows:
+            self.vectors[row] = 0.0
+            self.ids[row] = -1
+        if rows:
+            self.vectors.flush()
+            self._save_meta()
+        return rows
+
+
+def employee_text(position, skills, interests, bio) -> str:
+    return '. '.join(part for part in (position, skills, interests, bio) if part)
+
+
+class EmbeddingIndex:
+    """Vector store of one table kept in sync by a background thread fed from change hooks.
+
+    Subclasses set ``model`` and ``name`` and implement ``_select()`` and ``_text()``;
+    ``_added`` and ``_removed`` let them maintain derived structures under the same lock.
+    """
+
+    model = None
+    name = None
+
+    def __init__(self, directory: str = EMBEDDING_DIR):
+        self.store = VectorStore(directory, self.name, EMBEDDING_MODEL)
+        self.ready = False
+        self._lock = threading.Lock()
+        self._pending: "queue.Queue[List[int]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def _select(self):
+        """Select of the ID and the columns ``_text`` needs."""
+        raise NotImplementedError
+
+    def _text(self, row) -> str:
+        raise NotImplementedError
+
+    def texts(self, ids=None) -> Iterator[Tuple[int, str]]:
+        """(id, text) pairs in ID order, read in keyset pages."""
+        query = self._select().order_by(self.model.id).limit(EMBEDDING_PAGE_SIZE)
+        if ids is not None:
+            query = query.where(self.model.id.in_(ids))
+        last = None
+        while True:
+            page = query if last is None else query.where(self.model.id > last)
+            # Сессия закрывается до выдачи строк: пока они эмбеддятся, SQLite не держит SHARED-блокировку
+            session = get_session()
+            try:
+                rows = session.execute(page).all()
+            finally:
+                session.close()
+            for row in rows:
+                yield row.id, self._text(row)
+            if len(rows) < EMBEDDING_PAGE_SIZE:
+                return
+            last = rows[-1].id
+
+    def _added(self, rows: List[int]):
+        pass
+
+    def _removed(self, rows: List[int]):
+        pass
+
+    def _opened(self):
+        pass
+
+    def _synced(self):
+        """Called after the initial sync and after every incremental refresh."""
+
+    def start(self):
+        """Open or build the store and keep it in sync with row changes."""
+        if self._thread is not None:
+            return
+        register_change_hook(self.model, self.schedule)
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-index', daemon=True)
+        self._thread.start()
+
+    def schedule(self, ids: Iterable[int]):
+        """Change hook: queue row IDs for re-embedding."""
+        self._pending.put(list(ids))
+
+    def _run(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logger.error(f"Error building {self.name} index: {e}")
+            return
+        self.ready = True
+        while True:
+            ids = set(self._pending.get())
+            # Склеиваем изменения, накопившиеся за время предыдущего прохода
+            while not self._pending.empty():
+                ids.update(self._pending.get_nowait())
+            try:
+                self.refresh(ids)
+            except Exception as e:
+                logger.error(f"Error updating {self.name} index: {e}")
+
+    def _embed(self, rows: List[Tuple[int, str]]):
+        if not rows:
+            return
+        vectors = get_embedder().encode([text for _, text in rows])
+        with self._lock:
+            self._added(self.store.upsert([row_id for row_id, _ in rows], [text_hash(text) for _, text in rows], vectors))
+
+    def _remove(self, ids: Iterable[int]):
+        with self._lock:
+            self._removed(self.store.remove(ids))
+
+    def _changed(self, rows: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        for row_id, text in rows:
+            row = self.store.row_of(row_id)
+            if row is None or self.store.hashes[row] != text_hash(text):
+                yield row_id, text
+
+    def sync(self):
+        """Embed only rows that are new or whose text changed since the last run."""
+        if not self.store.open():
+            self.store.create(get_embedder().dim)
+        self._opened()
+        seen = set()
+
+        def visited():
+            for row_id, text in self.texts():
+                seen.add(row_id)
+                yield row_id, text
+
+        embedded = 0
+        batch = []
+        for item in self._changed(visited()):
+            batch.append(item)
+            if len(batch) >= EMBEDDING_BATCH_SIZE * 8:
+                self._embed(batch)
+                embedded += len(batch)
+                batch = []
+        self._embed(batch)
+        embedded += len(batch)
+        stale = [int(row_id) for row_id in self.store.ids if row_id >= 0 and row_id not in seen]
+        self._remove(stale)
+        self._synced()
+        logger.info(
+            "%s index synced: %d vectors, %d embedded, %d removed", self.name, self.store.count, embedded, len(stale)
+        )
+
+    def refresh(self, ids: Iterable[int]):
+        ids = set(ids)
+        fresh = list(self.texts(ids))
+        self._embed(list(self._changed(fresh)))
+        missing = ids - {row_id for row_id, _ in fresh}
+        if missing:
+            self._remove(missing)
+        self._synced()
+
+
+class EmployeeSemanticIndex(EmbeddingIndex):
+    """Cosine top-k over employee profile embeddings."""
+
+    model = Employee
+    name = 'employees'
+
+    def _select(self):
+        return select(Employee.id, Employee.position, Employee.skills, Employee.interests, Employee.bio)
+
+    def _text(self, row) -> str:
+        return employee_text(row.position, row.skills, row.interests, row.bio)
+
+    def search(self, query: str, k: int = SEMANTIC_TOP_K, min_score: float = SEMANTIC_MIN_SCORE) -> List[Tuple[int, float]]:
+        """(employee_id, cosine similarity) pairs, best first."""
+        if not self.ready:
+            return []
+        vector = get_embedder().encode([query])[0]
+        with self._lock:
+            scores = self.store.vectors @ vector
+            ids = self.store.ids
+            best = top_k(scores, k)
+            return [(int(ids[row]), float(scores[row])) for row in best if ids[row] >= 0 and scores[row] >= min_score]
+
+
+semantic_index = EmployeeSemanticIndex()
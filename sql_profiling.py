@@ -0,0 +1,187 @@
+"""SQL statement timing per statement shape, with a slow-query log and EXPLAIN capture.
+
+The top shapes by total time are served as JSON at ``/sql`` on the metrics endpoint.
+"""
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+import metrics
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('sql.slow')
+
+# Statements slower than this are written to the slow log
+SQL_SLOW_THRESHOLD_MS = float(os.getenv('SQL_SLOW_THRESHOLD_MS', '100'))
+# Minimum interval between two EXPLAIN captures of the same shape
+SQL_EXPLAIN_INTERVAL = float(os.getenv('SQL_EXPLAIN_INTERVAL', '300'))
+# Longest normalized statement used as a metric label; longer ones are cut and tagged with a hash
+SQL_SHAPE_LABEL_LENGTH = int(os.getenv('SQL_SHAPE_LABEL_LENGTH', '120'))
+
+SQL_SECONDS = metrics.histogram(
+    'bot_sql_statement_seconds', 'SQL statement latency by issuing function and statement shape',
+    ['function', 'shape']
+)
+SQL_SLOW = metrics.counter('bot_sql_slow_total', 'Statements over the slow threshold', ['function', 'shape'])
+
+# Функция поиска и категория запроса, от имени которых выполняются запросы
+_tags = contextvars.ContextVar('sql_tags', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\([^)]*\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\([^)]*\)s|%s|:\w+))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class ShapeStats:
+    """Aggregated timings of one statement shape."""
+
+    __slots__ = ('shape', 'statement', 'count', 'total', 'max', 'last_explain')
+
+    def __init__(self, shape: str, statement: str):
+        self.shape = shape
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_explain = 0.0
+
+
+_shapes: Dict[str, ShapeStats] = {}
+_shapes_lock = threading.Lock()
+
+
+def normalize_statement(statement: str) -> str:
+    """Reduce a statement to its shape: literals and IN-lists are replaced by placeholders."""
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _NUMBER_LITERAL.sub('?', statement)
+    statement = _PLACEHOLDER_LIST.sub('(...)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()
+
+
+@functools.lru_cache(maxsize=4096)
+def statement_shape(statement: str) -> str:
+    """Readable label of the statement shape: the normalized statement, cut to SQL_SHAPE_LABEL_LENGTH."""
+    normalized = normalize_statement(statement)
+    if len(normalized) <= SQL_SHAPE_LABEL_LENGTH:
+        return normalized
+    # Хеш различает формы с одинаковым началом
+    digest = hashlib.sha1(normalized.encode()).hexdigest()[:8]
+    return f"{normalized[:SQL_SHAPE_LABEL_LENGTH]}… #{digest}"
+
+
+def tagged(category: str):
+    """Decorator tagging all SQL issued by the wrapped search function with its category."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _tags.set((func.__name__, category))
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _tags.reset(token)
+        return wrapper
+    return decorator
+
+
+def _explain(cursor, dialect_name: str, statement: str, parameters) -> Optional[str]:
+    if dialect_name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif dialect_name == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    # Отдельный курсор, чтобы не потерять результат основного запроса
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        return '\n'.join(' | '.join(str(col) for col in row) for row in explain_cursor.fetchall())
+    finally:
+        explain_cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+    shape = statement_shape(statement)
+    function, category = _tags.get() or ('-', '-')
+
+    stats = _shapes.get(shape)
+    if stats is None:
+        with _shapes_lock:
+            stats = _shapes.setdefault(shape, ShapeStats(shape, normalize_statement(statement)))
+    with _shapes_lock:
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+    SQL_SECONDS.labels(function, shape).observe(elapsed)
+
+    if elapsed * 1000 < SQL_SLOW_THRESHOLD_MS:
+        return
+    SQL_SLOW.labels(function, shape).inc()
+
+    plan = None
+    now = time.monotonic()
+    is_select = statement.lstrip().upper().startswith('SELECT')
+    if is_select and not executemany and now - stats.last_explain >= SQL_EXPLAIN_INTERVAL:
+        stats.last_explain = now
+        try:
+            plan = _explain(cursor, conn.dialect.name, statement, parameters)
+        except Exception as e:
+            logger.error(f"EXPLAIN failed for shape {shape}: {e}")
+    slow_logger.warning(
+        "Slow SQL %.1f ms shape=%s function=%s category=%s\n%s%s",
+        elapsed * 1000, shape, function, category, statement,
+        f"\nPlan:\n{plan}" if plan else ''
+    )
+
+
+def _handle_error(context):
+    # Упавший запрос не доходит до after_cursor_execute - снимаем его время со стека,
+    # иначе следующие запросы этого соединения возьмут чужое время начала
+    # (без контекста выполнения ошибка случилась раньше before_cursor_execute, и снимать нечего)
+    connection = context.connection
+    if context.execution_context is not None and connection is not None and connection.info.get('query_start_time'):
+        connection.info['query_start_time'].pop()
+
+
+def install(engine):
+    """Attach statement timing listeners to the engine."""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+
+def report(limit: int = 20) -> List[Dict]:
+    """Statement shapes ordered by total time spent."""
+    with _shapes_lock:
+        rows = [
+            {
+                'shape': s.shape,
+                'count': s.count,
+                'total_ms': round(s.total * 1000, 2),
+                'avg_ms': round(s.total * 1000 / s.count, 3) if s.count else 0.0,
+                'max_ms': round(s.max * 1000, 2),
+                'statement': s.statement
+            }
+            for s in _shapes.values()
+        ]
+    rows.sort(key=lambda r: r['total_ms'], reverse=True)
+    return rows[:limit]
+
+
+# Отчет по формам запросов отдается рядом с /metrics работающего процесса
+metrics.register_page('/sql', lambda: json.dumps(report(), ensure_ascii=False, indent=1))
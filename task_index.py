@@ -0,0 +1,210 @@
+"""Approximate nearest-neighbour index over task embeddings for similar and duplicate task lookups."""
+import logging
+import math
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from models import Task
+from semantic_search import EMBEDDING_DIR, EmbeddingIndex, get_embedder, top_k
+
+logger = logging.getLogger(__name__)
+
+TASK_INDEX = os.getenv('TASK_INDEX', '0') == '1'
+# Inverted lists probed per query; more lists - better recall, slower lookup
+TASK_INDEX_NPROBE = int(os.getenv('TASK_INDEX_NPROBE', '8'))
+# Cosine similarity above which a new task is reported as a possible duplicate
+TASK_DUPLICATE_THRESHOLD = float(os.getenv('TASK_DUPLICATE_THRESHOLD', '0.9'))
+TASK_SIMILAR_MIN_SCORE = float(os.getenv('TASK_SIMILAR_MIN_SCORE', '0.6'))
+# Below this many vectors a brute-force scan is faster than training the lists
+IVF_MIN_TRAIN_SIZE = 1000
+# Lists are retrained once the index has grown this many times since training
+IVF_RETRAIN_GROWTH = 4
+
+
+def task_text(title, description) -> str:
+    return '. '.join(part for part in (title, description) if part)
+
+
+def train_centroids(vectors: np.ndarray, live: np.ndarray, nlist: int, iterations: int = 10,
+                    sample_size: int = 50000, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the live unit vectors."""
+    rng = np.random.default_rng(seed)
+    rows = np.flatnonzero(live)
+    if len(rows) > sample_size:
+        rows = np.sort(rng.choice(rows, sample_size, replace=False))
+    sample = np.asarray(vectors[rows], dtype=np.float32)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = nearest_centroid(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        # Пустые кластеры заново засеваем случайными векторами
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+    return centroids
+
+
+def nearest_centroid(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 10000) -> np.ndarray:
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        assign[start:start + chunk] = np.argmax(np.asarray(vectors[start:start + chunk]) @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    """Inverted-file index: vectors are bucketed by nearest centroid and only a few buckets are scanned.
+
+    Works on row numbers of an external matrix, so the vectors themselves stay in the memory map.
+    """
+
+    def __init__(self, centroids: np.ndarray, assign: np.ndarray, trained_size: int):
+        self.centroids = centroids
+        self.assign = assign
+        self.trained_size = trained_size
+        self._build_lists()
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, live: np.ndarray, nlist: Optional[int] = None) -> 'IVFIndex':
+        """Train centroids on rows where ``live`` is set and bucket all of them."""
+        size = int(live.sum())
+        nlist = nlist or max(1, int(4 * math.sqrt(size)))
+        centroids = train_centroids(vectors, live, nlist)
+        assign = nearest_centroid(vectors, centroids)
+        assign[~live] = -1
+        return cls(centroids, assign, size)
+
+    def _build_lists(self):
+        order = np.argsort(self.assign, kind='stable')
+        bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def add(self, rows: List[int], vectors: np.ndarray):
+        """Place new or changed rows into their nearest lists."""
+        if len(self.assign) < max(rows) + 1:
+            self.assign = np.concatenate([self.assign, np.full(max(rows) + 1 - len(self.assign), -1, np.int32)])
+        self.remove(rows)
+        for row, centroid in zip(rows, nearest_centroid(vectors, self.centroids)):
+            self.assign[row] = centroid
+            self.lists[centroid] = np.append(self.lists[centroid], row)
+
+    def remove(self, rows: List[int]):
+        for row in rows:
+            if row < len(self.assign) and self.assign[row] >= 0:
+                centroid = self.assign[row]
+                self.lists[centroid] = self.lists[centroid][self.lists[centroid] != row]
+                self.assign[row] = -1
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int, nprobe: int = TASK_INDEX_NPROBE) -> Tuple[np.ndarray, np.ndarray]:
+        """Row numbers and scores of the approximate top k."""
+        probe = top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.lists[centroid] for centroid in probe])
+        if not len(candidates):
+            return candidates, np.zeros(0, dtype=np.float32)
+        candidates.sort()
+        # Чтение строк по возрастанию номера идет последовательно по файлу
+        scores = np.asarray(vectors[candidates]) @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+
+class TaskIndex(EmbeddingIndex):
+    """Task embeddings on disk plus IVF lists, persisted next to the vectors."""
+
+    model = Task
+    name = 'tasks'
+
+    def __init__(self, directory: str = EMBEDDING_DIR):
+        super().__init__(directory)
+        self.ivf: Optional[IVFIndex] = None
+
+    def _select(self):
+        return select(Task.id, Task.title, Task.description)
+
+    def _text(self, row) -> str:
+        return task_text(row.title, row.description)
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.store.directory, f"tasks.{suffix}")
+
+    def _save(self, suffix: str, **arrays):
+        tmp = self._path(suffix + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self._path(suffix))
+
+    def _save_assign(self):
+        # Центроиды меняются только при обучении, назначения - при каждой вставке
+        self._save('assign.npz', assign=self.ivf.assign)
+
+    def _opened(self):
+        try:
+            with np.load(self._path('ivf.npz')) as ivf, np.load(self._path('assign.npz')) as saved:
+                centroids, trained_size, assign = ivf['centroids'], int(ivf['trained_size']), saved['assign']
+        except FileNotFoundError:
+            return
+        # Назначения от другой версии векторов не используем - списки будут обучены заново
+        if len(assign) == self.store.count and centroids.shape[1] == self.store.dim:
+            self.ivf = IVFIndex(centroids, assign, trained_size)
+
+    def _added(self, rows):
+        if self.ivf is not None:
+            self.ivf.add(rows, self.store.vectors[rows])
+            self._save_assign()
+
+    def _removed(self, rows):
+        if self.ivf is not None and rows:
+            self.ivf.remove(rows)
+            self._save_assign()
+
+    def _synced(self):
+        live = self.store.ids >= 0
+        size = int(live.sum())
+        if size < IVF_MIN_TRAIN_SIZE:
+            with self._lock:
+                self.ivf = None
+            return
+        if self.ivf is None or size > IVF_RETRAIN_GROWTH * self.ivf.trained_size:
+            # Векторы меняет только этот поток, поэтому обучаем без блокировки поиска
+            ivf = IVFIndex.train(self.store.vectors, live)
+            with self._lock:
+                self.ivf = ivf
+                self._save('ivf.npz', centroids=ivf.centroids, trained_size=ivf.trained_size)
+                self._save_assign()
+            logger.info("Task index trained: %d lists over %d vectors", len(ivf.centroids), size)
+
+    def similar(self, text: str, k: int = 5, min_score: float = TASK_SIMILAR_MIN_SCORE,
+                exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(task_id, cosine similarity) pairs, best first."""
+        return self.similar_many([text], k, min_score, exclude)[0]
+
+    def similar_many(self, texts: List[str], k: int = 5, min_score: float = TASK_SIMILAR_MIN_SCORE,
+                     exclude: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+        """``similar`` for several texts, encoded with one model call."""
+        if not self.ready or not texts:
+            return [[] for _ in texts]
+        vectors = get_embedder().encode(texts)
+        results = []
+        with self._lock:
+            for vector in vectors:
+                if self.ivf is not None:
+                    rows, scores = self.ivf.search(self.store.vectors, vector, k + 1)
+                else:
+                    scores = self.store.vectors @ vector
+                    rows = top_k(scores, k + 1)
+                    scores = scores[rows]
+                ids = self.store.ids[rows]
+                results.append([
+                    (int(task_id), float(score)) for task_id, score in zip(ids, scores)
+                    if task_id >= 0 and task_id != exclude and score >= min_score
+                ][:k])
+        return results
+
+
+task_index = TaskIndex()
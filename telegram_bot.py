@@ -1,11 +1,33 @@
 import os
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import tempfile
+import time
+from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-from models import init_db, get_session, Employee, Event, Task, TaskStatus, Activity, activity_participants, EventType, ActivityType
-from sqlalchemy import or_, and_
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, InlineQueryHandler
+import aggregates
+import logging_setup
+import metrics
+import outbound
+import sql_profiling
+from admission import model_admission
+from inference import load_classifier
+from inference_server import InferenceUnavailable
+from intents import categories, category_scores, preprocess_query
+from morphology import normalize_text
+import ngram_classifier
+from identity import approve, identities, is_admin, reject, request_binding, unbind, BOT_ADMIN_IDS
+from write_queue import write_queue
+from models import init_db, get_session, ChangePoller, Employee, Task, TaskStatus, Activity, add_activity_participant, notify_change
+from sqlalchemy import func, or_, insert, select, update as sql_update
+from sqlalchemy.orm import joinedload
+import digest
+import export
+import search
+import semantic_search
+from prefix_index import prefix_index, INLINE_CACHE_TIME
+from task_index import task_index, task_text, TASK_DUPLICATE_THRESHOLD, TASK_INDEX
 import re
 from typing import List, Dict, Tuple, Optional
 import json
@@ -16,465 +38,116 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+logging_setup.configure_logging()
 logger = logging.getLogger(__name__)
 
-# Initialize the AI models with better configuration
-classifier = pipeline(
-    "zero-shot-classification",
-    model="facebook/bart-large-mnli",
-    device=0 if os.environ.get("CUDA_VISIBLE_DEVICES") else -1
-)
+# Bot configuration
+BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', "8181926764:AAE0RsZomH3bdhLnGqatSi5W7HH3fwjiEQQ")
+# Base URL of the Bot API, e.g. a local stand-in from webhook_replay.py
+BOT_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+# Update delivery mode: "polling" or "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+# Public URL registered with Telegram; defaults to http://<listen>:<port>/<path>
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+# Local port of the Prometheus metrics endpoint (0 disables it)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+# How many updates are processed concurrently
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '8'))
+# Bot API refuses documents above 50 MB
+EXPORT_MAX_DOCUMENT_SIZE = int(os.getenv('EXPORT_MAX_DOCUMENT_SIZE', str(50 * 1024 * 1024)))
+# Drop and reseed all tables on startup; otherwise only an empty database is seeded
+DB_RESET = os.getenv('DB_RESET', '0') == '1'
+# How often employees changed by other processes (manage.py import-employees) reach the indexes, seconds
+EMPLOYEE_REFRESH_INTERVAL = float(os.getenv('EMPLOYEE_REFRESH_INTERVAL', '60'))
 
-# Define categories for classification with examples and synonyms
-categories = [
-    "поиск сотрудника",
-    "информация о мероприятии",
-    "информация о задаче",
-    "социальные активности",
-    "приветствие",
-    "общая информация",
-    "неопределенный запрос"
-]
-
-# Define example queries and synonyms for each category with improved patterns
-category_patterns = {
-    "приветствие": {
-        "keywords": [
-            'привет', 'здравствуй', 'добрый', 'начать', 'помощь', 'хеллоу',
-            'хай', 'здорово', 'приветствую', 'доброе', 'добрый'
-        ],
-        "synonyms": [
-            'здравствуйте', 'доброе утро', 'добрый день', 'добрый вечер',
-            'хеллоу', 'хай', 'приветствую', 'здорово', 'добро пожаловать',
-            'рад видеть', 'как дела', 'как жизнь'
-        ],
-        "examples": [
-            "привет",
-            "здравствуй",
-            "добрый день",
-            "начать",
-            "помощь",
-            "как пользоваться",
-            "что умеешь",
-            "как дела",
-            "доброе утро",
-            "добрый вечер",
-            "рад тебя видеть",
-            "как жизнь"
-        ]
-    },
-    "поиск сотрудника": {
-        "keywords": [
-            'отдел', 'отделе', 'it', 'hr', 'sales', 'marketing', 'проект', 'project',
-            'разработка', 'разработчик', 'менеджер', 'директор', 'руководитель',
-            'специалист', 'инженер', 'аналитик', 'дизайнер', 'тестировщик',
-            'кто', 'найти', 'показать', 'список', 'сотрудники', 'коллеги',
-            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
-            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения'
-        ],
-        "synonyms": [
-            'найти', 'показать', 'кто', 'какие', 'список', 'сотрудники', 'работники',
-            'коллеги', 'люди', 'команда', 'группа', 'отдел', 'подразделение',
-            'искать', 'поиск', 'найти', 'показать', 'вывести', 'отобразить',
-            'работает', 'трудится', 'занимается', 'отвечает', 'знает',
-            'умеет', 'может', 'способен', 'опыт', 'навыки', 'умения',
-            'специалист', 'эксперт', 'профессионал', 'мастер', 'гуру'
-        ],
-        "examples": [
-            "кто работает в отделе",
-            "найти сотрудника",
-            "кто из отдела",
-            "покажи сотрудников",
-            "кто работает над проектом",
-            "список сотрудников",
-            "какие люди работают",
-            "кто в команде",
-            "покажи команду разработки",
-            "кто отвечает за проект",
-            "найти специалиста по",
-            "кто руководит отделом",
-            "кто занимается разработкой",
-            "покажи всех сотрудников отдела",
-            "кто знает python",
-            "кто умеет работать с базами данных",
-            "найти эксперта по тестированию",
-            "кто может помочь с проектом",
-            "кто имеет опыт в маркетинге",
-            "покажи специалистов по дизайну"
-        ]
-    },
-    "информация о мероприятии": {
-        "keywords": [
-            'мероприятие', 'мероприятия', 'корпоратив', 'тренинг', 'встреча',
-            'неделе', 'недели', 'месяц', 'месяца', 'день', 'дня', 'дата',
-            'время', 'расписание', 'план', 'календарь', 'событие', 'события',
-            'день рождения', 'дни рождения', 'праздник', 'праздники',
-            'конференция', 'семинар', 'вебинар', 'презентация', 'доклад',
-            'выступление', 'обучение', 'курс', 'лекция', 'мастер-класс'
-        ],
-        "synonyms": [
-            'когда', 'расписание', 'план', 'календарь', 'дата', 'время',
-            'запланировано', 'назначено', 'будет', 'пройдет', 'состоится',
-            'организовано', 'подготовлено', 'устроено', 'праздновать',
-            'отмечать', 'поздравлять', 'чествовать', 'проводить',
-            'организовывать', 'планировать', 'готовить', 'устраивать'
-        ],
-        "examples": [
-            "какие мероприятия",
-            "когда корпоратив",
-            "расписание мероприятий",
-            "какие встречи",
-            "когда тренинг",
-            "что запланировано",
-            "какие события",
-            "что будет на неделе",
-            "какие встречи запланированы",
-            "расписание на месяц",
-            "когда следующее мероприятие",
-            "что готовится в отделе",
-            "когда день рождения",
-            "какие праздники",
-            "когда конференция",
-            "расписание тренингов",
-            "какие семинары на этой неделе",
-            "когда мастер-класс",
-            "что запланировано на месяц",
-            "какие мероприятия в офисе"
-        ]
-    },
-    "информация о задаче": {
-        "keywords": [
-            'задача', 'задачи', 'дедлайн', 'проект', 'работа', 'поручение',
-            'обязанность', 'функция', 'роль', 'ответственность', 'контроль',
-            'проверка', 'тестирование', 'разработка', 'внедрение',
-            'срок', 'статус', 'прогресс', 'выполнение', 'todo', 'in progress', 'done',
-            'блокер', 'проблема', 'ошибка', 'баг', 'фича', 'улучшение',
-            'оптимизация', 'рефакторинг', 'документация', 'отчет'
-        ],
-        "synonyms": [
-            'сделать', 'выполнить', 'срок', 'статус', 'прогресс', 'ход',
-            'продвижение', 'этап', 'стадия', 'фаза', 'процесс', 'работа',
-            'дело', 'поручение', 'обязанность', 'контролировать',
-            'проверять', 'отслеживать', 'мониторить', 'в работе',
-            'текущие', 'к выполнению', 'сделано', 'выполнено',
-            'заблокировано', 'проблема', 'ошибка', 'исправить',
-            'улучшить', 'оптимизировать', 'переписать', 'документировать'
-        ],
-        "examples": [
-            "какие задачи",
-            "что нужно сделать",
-            "какие дедлайны",
-            "статус задачи",
-            "когда сдать",
-            "что в работе",
-            "текущие задачи",
-            "мои поручения",
-            "что на контроле",
-            "какие проекты в работе",
-            "статус разработки",
-            "ход выполнения",
-            "что нужно сделать до",
-            "какие задачи у",
-            "покажи задачи к выполнению",
-            "какие задачи в работе",
-            "покажи выполненные задачи",
-            "есть ли блокеры",
-            "какие проблемы",
-            "статус проекта"
-        ]
-    },
-    "социальные активности": {
-        "keywords": [
-            'обед', 'игра', 'игры', 'встреча', 'встречи', 'общение',
-            'команда', 'командный', 'вместе', 'совместно', 'активность',
-            'активности', 'досуг', 'отдых', 'развлечение', 'развлечения',
-            'йога', 'спорт', 'фитнес', 'танцы', 'музыка', 'кино',
-            'театр', 'концерт', 'выставка', 'музей', 'парк', 'прогулка',
-            'вечеринка', 'праздник', 'корпоратив', 'тимбилдинг'
-        ],
-        "synonyms": [
-            'поиграть', 'пообедать', 'встретиться', 'познакомиться',
-            'пообщаться', 'провести время', 'отдохнуть', 'развлечься',
-            'командная игра', 'совместный обед', 'групповая активность',
-            'заняться спортом', 'позаниматься йогой', 'потанцевать',
-            'сходить в кино', 'посетить выставку', 'погулять в парке',
-            'отпраздновать', 'провести тимбилдинг', 'организовать вечеринку'
-        ],
-        "examples": [
-            "кто хочет поиграть",
-            "кто идет на обед",
-            "кто хочет встретиться",
-            "найти партнера для игры",
-            "кто свободен на обед",
-            "кто хочет пообщаться",
-            "найти компанию для",
-            "кто хочет присоединиться",
-            "кто готов поиграть",
-            "кто хочет пообедать вместе",
-            "кто занимается йогой",
-            "кто хочет в кино",
-            "кто идет на выставку",
-            "кто хочет в парк",
-            "кто готов к тимбилдингу",
-            "кто хочет на вечеринку",
-            "кто занимается спортом",
-            "кто танцует",
-            "кто любит музыку",
-            "кто хочет в театр"
-        ]
-    },
-    "общая информация": {
-        "keywords": [
-            'что', 'как', 'где', 'когда', 'почему', 'зачем',
-            'информация', 'справка', 'помощь', 'подсказка',
-            'правила', 'политика', 'процедуры', 'процессы',
-            'структура', 'организация', 'компания', 'офис',
-            'рабочее место', 'оборудование', 'ресурсы',
-            'документы', 'файлы', 'база знаний', 'wiki'
-        ],
-        "synonyms": [
-            'расскажи', 'объясни', 'покажи', 'найди', 'дай',
-            'информацию', 'справку', 'помощь', 'подсказку',
-            'правила', 'политику', 'процедуры', 'процессы',
-            'структуру', 'организацию', 'компанию', 'офис',
-            'рабочее место', 'оборудование', 'ресурсы',
-            'документы', 'файлы', 'базу знаний', 'wiki'
-        ],
-        "examples": [
-            "как работает",
-            "где находится",
-            "когда открыто",
-            "что нужно знать",
-            "какие правила",
-            "как пользоваться",
-            "где найти",
-            "как получить доступ",
-            "что делать если",
-            "как решить проблему",
-            "где посмотреть",
-            "как узнать",
-            "что нового",
-            "какие изменения",
-            "как обновить",
-            "где документация",
-            "как настроить",
-            "что требуется",
-            "как начать",
-            "где справка"
-        ]
-    }
-}
+# Initialize the AI models with better configuration
+classifier = load_classifier()
+# Cheap learned tier consulted before the model; None until trained with manage.py train-tier
+ngram_tier = ngram_classifier.load_latest()
 
-def preprocess_query(query: str) -> str:
-    """Preprocess the query for better classification."""
-    # Convert to lowercase
-    query = query.lower()
-    
-    # Remove punctuation but keep important symbols
-    query = re.sub(r'[^\w\s\-]', ' ', query)
-    
-    # Remove extra spaces
-    query = ' '.join(query.split())
-    
-    # Remove common stop words
-    stop_words = {
-        'и', 'в', 'на', 'с', 'по', 'для', 'не', 'ни', 'но', 'а', 'или',
-        'что', 'как', 'когда', 'где', 'почему', 'зачем', 'кто', 'какой',
-        'какая', 'какие', 'какое', 'каких', 'каким', 'какими', 'каком',
-        'какой', 'какую', 'какого', 'какому', 'какою', 'какою', 'какою',
-        'какою', 'какою', 'какою', 'какою', 'какою', 'какою', 'какою',
-        'это', 'этот', 'эта', 'эти', 'этого', 'этой', 'этим', 'этими',
-        'этом', 'эту', 'этою', 'этою', 'этою', 'этою', 'этою', 'этою',
-        'этою', 'этою', 'этою', 'этою', 'этою', 'этою', 'этою', 'этою',
-        'быть', 'был', 'была', 'были', 'было', 'быть', 'буду', 'будешь',
-        'будет', 'будем', 'будете', 'будут', 'стать', 'стал', 'стала',
-        'стали', 'стало', 'стать', 'стану', 'станешь', 'станет', 'станем',
-        'станете', 'станут'
-    }
-    words = query.split()
-    query = ' '.join(word for word in words if word not in stop_words)
-    
-    return query
+def classify_query(query: str, chat_id: Optional[int] = None) -> Tuple[str, float]:
+    """Classify the user query into one of the predefined categories with confidence score.
 
-def calculate_category_score(query: str, category: str) -> float:
-    """Calculate a score for how well the query matches a category."""
-    score = 0.0
-    patterns = category_patterns[category]
-    
-    # Проверяем наличие ключевых слов
-    for keyword in patterns["keywords"]:
-        if keyword in query:
-            score += 0.4
-        elif any(word.startswith(keyword) or keyword.startswith(word) for word in query.split()):
-            score += 0.2
-    
-    # Проверяем синонимы
-    for synonym in patterns["synonyms"]:
-        if synonym in query:
-            score += 0.3
-        elif any(word.startswith(synonym) or synonym.startswith(word) for word in query.split()):
-            score += 0.15
-    
-    # Проверяем примеры
-    for example in patterns["examples"]:
-        if example in query:
-            score += 0.6
-        elif any(word in example for word in query.split()):
-            score += 0.3
-    
-    # Дополнительные проверки для поиска сотрудников
-    if category == "поиск сотрудника":
-        # Проверяем навыки
-        tech_skills = {
-            'python': ['python', 'питон'],
-            'java': ['java', 'джава'],
-            'javascript': ['javascript', 'js', 'джаваскрипт'],
-            'react': ['react', 'реакт'],
-            'django': ['django', 'джанго'],
-            'docker': ['docker', 'докер'],
-            'postgresql': ['postgresql', 'postgres', 'постгрес'],
-            'mongodb': ['mongodb', 'монго'],
-            'selenium': ['selenium', 'селениум'],
-            'pytest': ['pytest', 'питест'],
-            'postman': ['postman', 'постман'],
-            'jira': ['jira', 'джира'],
-            'agile': ['agile', 'аджайл'],
-            'scrum': ['scrum', 'скрам'],
-            'fastapi': ['fastapi', 'фастапи']
-        }
-        
-        for skill, keywords in tech_skills.items():
-            if any(keyword in query for keyword in keywords):
-                score += 1.0
-        
-        # Проверяем роли и должности
-        roles = {
-            'разработчик': ['разработчик', 'программист', 'developer', 'coder'],
-            'тестировщик': ['тестировщик', 'qa', 'tester'],
-            'менеджер': ['менеджер', 'manager', 'руководитель'],
-            'дизайнер': ['дизайнер', 'designer', 'ui/ux'],
-            'аналитик': ['аналитик', 'analyst']
-        }
-        
-        for role, keywords in roles.items():
-            if any(keyword in query for keyword in keywords):
-                score += 0.8
-        
-        # Проверяем отделы
-        departments = {
-            'it': ['it', 'айти', 'разработка'],
-            'hr': ['hr', 'эйчар', 'кадры'],
-            'sales': ['sales', 'продажи'],
-            'marketing': ['marketing', 'маркетинг']
-        }
-        
-        for dept, keywords in departments.items():
-            if any(keyword in query for keyword in keywords):
-                score += 0.8
-    
-    # Дополнительные проверки для мероприятий
-    if category == "информация о мероприятии":
-        # Проверяем временные периоды
-        time_periods = {
-            'сегодня': ['сегодня', 'сейчас', 'в данный момент'],
-            'завтра': ['завтра', 'на следующий день'],
-            'неделя': ['неделе', 'недели', 'на этой неделе', 'в течение недели'],
-            'месяц': ['месяце', 'месяца', 'в этом месяце', 'в течение месяца']
-        }
-        
-        for period, keywords in time_periods.items():
-            if any(keyword in query for keyword in keywords):
-                score += 1.0
-        
-        # Проверяем типы мероприятий
-        event_types = {
-            'встреча': ['встреча', 'meeting', 'митинг'],
-            'тренинг': ['тренинг', 'training', 'обучение'],
-            'конференция': ['конференция', 'conference', 'конф'],
-            'семинар': ['семинар', 'seminar', 'вебинар'],
-            'корпоратив': ['корпоратив', 'party', 'вечеринка']
-        }
-        
-        for event_type, keywords in event_types.items():
-            if any(keyword in query for keyword in keywords):
-                score += 0.8
-    
-    # Дополнительные проверки для задач
-    if category == "информация о задаче":
-        # Проверяем статусы
-        statuses = {
-            'todo': ['todo', 'сделать', 'выполнить', 'к выполнению'],
-            'in_progress': ['в работе', 'текущие', 'выполняются'],
-            'done': ['done', 'сделано', 'выполнено', 'завершено'],
-            'blocked': ['blocked', 'блокер', 'заблокировано']
-        }
-        
-        for status, keywords in statuses.items():
-            if any(keyword in query for keyword in keywords):
-                score += 1.0
-        
-        # Проверяем приоритеты
-        priorities = {
-            'high': ['высокий', 'высокая', 'срочно', 'срочная', 'критично', 'критичная'],
-            'medium': ['средний', 'средняя', 'обычный', 'обычная'],
-            'low': ['низкий', 'низкая', 'не срочно', 'не срочная']
-        }
-        
-        for priority, keywords in priorities.items():
-            if any(keyword in query for keyword in keywords):
-                score += 0.8
-    
-    # Дополнительные проверки для социальных активностей
-    if category == "социальные активности":
-        # Проверяем типы активностей
-        activity_types = {
-            'игры': ['игра', 'игры', 'настольные', 'board games'],
-            'спорт': ['спорт', 'фитнес', 'йога', 'танцы'],
-            'обед': ['обед', 'пообедать', 'lunch'],
-            'развлечения': ['кино', 'театр', 'концерт', 'выставка']
-        }
-        
-        for activity_type, keywords in activity_types.items():
-            if any(keyword in query for keyword in keywords):
-                score += 0.8
-    
-    return score
-
-def classify_query(query: str) -> Tuple[str, float]:
-    """Classify the user query into one of the predefined categories with confidence score."""
-    query = preprocess_query(query)
-    logger.info(f"Processing query: {query}")
+    Low rule scores go to the n-gram tier first; the AI model is only used when the
+    tier is unsure and admission control grants a slot for the chat, otherwise the
+    best rule-based category is returned.
+    """
+    with metrics.stage('preprocess'):
+        query = preprocess_query(query)
+    logger.info("Processing query: %s", query)
     
     # Calculate scores for each category
-    category_scores = {
-        category: calculate_category_score(query, category)
-        for category in categories if category != "неопределенный запрос"
-    }
+    with metrics.stage('rules'):
+        scores = category_scores(query)
+    
+    # Словоформы, не совпавшие с шаблонами, сравниваем еще раз по основам слов
+    with metrics.stage('normalize'):
+        normalized_scores = category_scores(normalize_text(query), normalized=True)
+    # Правила ответили только благодаря нормализации - вызов модели сэкономлен
+    rule_method = 'normalized' if max(scores.values()) < 0.3 <= max(normalized_scores.values()) else 'rules'
+    scores = {category: max(score, normalized_scores[category]) for category, score in scores.items()}
     
     # Get the category with the highest score
-    max_score_category = max(category_scores.items(), key=lambda x: x[1])
+    max_score_category = max(scores.items(), key=lambda x: x[1])
+    
+    # If the highest score is too low, ask the n-gram tier and then the AI model
+    tier_result = None
+    if max_score_category[1] < 0.3 and ngram_tier is not None:
+        with metrics.stage('ngram'):
+            tier_result = ngram_tier.predict(query)
+        if tier_result[2] < ngram_classifier.NGRAM_MIN_MARGIN:
+            ngram_classifier.TIER_DECISIONS.labels('deferred').inc()
+            tier_result = None
+        else:
+            ngram_classifier.TIER_DECISIONS.labels('answered').inc()
     
-    # If the highest score is too low, use the AI model
-    if max_score_category[1] < 0.3:
-        logger.info("Using AI model for classification")
-        result = classifier(query, categories)
-        max_score_index = result['scores'].index(max(result['scores']))
-        category = result['labels'][max_score_index]
-        confidence = result['scores'][max_score_index]
-        logger.info(f"AI model classified as: {category} with confidence {confidence:.2f}")
+    if tier_result:
+        method = 'ngram'
+        metrics.CLASSIFICATIONS.labels('ngram').inc()
+        category, confidence, margin = tier_result
+        logger.info("N-gram tier classified as: %s with confidence %.2f (margin %.2f)", category, confidence, margin)
+    elif max_score_category[1] < 0.3:
+        with model_admission.admit(chat_id) as admitted:
+            result = None
+            if admitted:
+                logger.info("Using AI model for classification")
+                try:
+                    with metrics.stage('model'):
+                        result = classifier(query, categories)
+                except InferenceUnavailable as e:
+                    logger.warning("Inference sidecar unavailable: %s", e)
+            if result is not None:
+                method = 'model'
+                metrics.CLASSIFICATIONS.labels('model').inc()
+                max_score_index = result['scores'].index(max(result['scores']))
+                category = result['labels'][max_score_index]
+                confidence = result['scores'][max_score_index]
+                logger.info("AI model classified as: %s with confidence %.2f", category, confidence)
+            else:
+                # Бюджет модели исчерпан или сайдкар не ответил - деградируем до лучшей категории по правилам
+                method = 'shed' if not admitted else 'unavailable'
+                metrics.CLASSIFICATIONS.labels(method).inc()
+                category = max_score_category[0]
+                confidence = max_score_category[1]
+                logger.info("Model unavailable (%s), rule-based fallback: %s with confidence %.2f", method, category, confidence)
     else:
+        method = rule_method
+        metrics.CLASSIFICATIONS.labels(method).inc()
         category = max_score_category[0]
         confidence = max_score_category[1]
-        logger.info(f"Rule-based classification: {category} with confidence {confidence:.2f}")
+        logger.info("Rule-based classification: %s with confidence %.2f", category, confidence)
     
     # If confidence is too low, return "неопределенный запрос"
     if confidence < 0.2:
-        return "неопределенный запрос", confidence
+        category = "неопределенный запрос"
     
+    # Итоговые решения правил и модели - обучающие данные для n-граммного уровня
+    ngram_classifier.classification_log.record(query, category, method, confidence)
     return category, confidence
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -541,549 +214,233 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "   • 'Какие мероприятия и активности на месяц?'\n\n"
         "Команды:\n"
         "   /start - Начать работу с ботом\n"
-        "   /help - Показать это сообщение\n\n"
+        "   /help - Показать это сообщение\n"
+        "   /bind email - Привязать аккаунт к сотруднику (для «мои задачи»), после подтверждения администратором\n"
+        "   /unbind - Удалить привязку аккаунта\n"
+        "   /subscribe_digest [отдел] - Ежедневный дайджест задач и событий\n"
+        "   /unsubscribe_digest - Отписаться от дайджеста\n"
+        "   /export tasks|events|activities [csv|jsonl|columnar] [status=… from=… to=… dept=… assignee=…] - Выгрузка (для администраторов)\n\n"
+        "🔎 В любом чате наберите @имя_бота и начало имени, должности, активности или задачи.\n\n"
         "💡 Бот понимает вопросы в свободной форме и старается найти наиболее релевантную информацию."
     )
     await update.message.reply_text(help_text)
 
+@sql_profiling.tagged("поиск сотрудника")
 def search_employees(query: str) -> str:
     """Search for employees based on the query."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching employees with query: {query_lower}")
+    logger.info("Searching employees with query: %s", query_lower)
     
     try:
-        # Определяем ключевые слова для поиска (русские и английские)
-        role_keywords = {
-            'разработка': [
-                'разработка', 'разработчик', 'программист', 'код', 'кодить',
-                'developer', 'programmer', 'coder', 'software', 'engineer'
-            ],
-            'руководство': [
-                'руководитель', 'директор', 'менеджер', 'глава', 'начальник',
-                'manager', 'director', 'head', 'lead', 'chief', 'senior'
-            ],
-            'тестирование': [
-                'тестирование', 'тестировщик', 'qa', 'контроль качества',
-                'tester', 'qa engineer', 'quality', 'testing'
-            ],
-            'дизайн': [
-                'дизайн', 'дизайнер', 'ui', 'ux', 'интерфейс',
-                'designer', 'ui/ux', 'interface', 'frontend'
-            ],
-            'аналитика': [
-                'аналитик', 'анализ', 'исследование', 'исследователь',
-                'analyst', 'researcher', 'research', 'analysis'
-            ]
-        }
-        
-        # Определяем отделы (русские и английские названия)
-        departments = {
-            'it': ['it', 'айти', 'информационные технологии', 'разработка', 'development'],
-            'hr': ['hr', 'эйчар', 'кадры', 'персонал', 'human resources'],
-            'sales': ['sales', 'продажи', 'сейлз', 'коммерция'],
-            'marketing': ['marketing', 'маркетинг', 'реклама', 'продвижение']
-        }
-        
-        # Извлекаем поисковые термины
-        search_terms = []
-        search_roles = []
-        search_departments = []
-        search_skills = []
-        search_interests = []
-        
-        # Проверяем навыки (расширенный список)
-        tech_skills = {
-            'python': ['python', 'питон'],
-            'java': ['java', 'джава'],
-            'javascript': ['javascript', 'js', 'джаваскрипт'],
-            'react': ['react', 'реакт'],
-            'django': ['django', 'джанго'],
-            'docker': ['docker', 'докер'],
-            'postgresql': ['postgresql', 'postgres', 'постгрес'],
-            'mongodb': ['mongodb', 'монго'],
-            'selenium': ['selenium', 'селениум'],
-            'pytest': ['pytest', 'питест'],
-            'postman': ['postman', 'постман'],
-            'jira': ['jira', 'джира'],
-            'agile': ['agile', 'аджайл'],
-            'scrum': ['scrum', 'скрам'],
-            'fastapi': ['fastapi', 'фастапи']
-        }
-        
-        # Проверяем навыки
-        for skill, keywords in tech_skills.items():
-            if any(keyword in query_lower for keyword in keywords):
-                search_skills.append(skill)
-                logger.info(f"Found skill: {skill}")
-        
-        # Проверяем интересы
-        if 'йога' in query_lower:
-            search_interests.append('йога')
-        if 'игра' in query_lower or 'игры' in query_lower:
-            search_interests.append('настольные игры')
-        if 'путешествия' in query_lower:
-            search_interests.append('путешествия')
-        if 'танцы' in query_lower:
-            search_interests.append('танцы')
-        if 'теннис' in query_lower:
-            search_interests.append('теннис')
-        
-        # Проверяем роли
-        for role, keywords in role_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
-                search_roles.append(role)
-                logger.info(f"Found role: {role}")
-        
-        # Проверяем отделы
-        for dept, keywords in departments.items():
-            if any(keyword in query_lower for keyword in keywords):
-                search_departments.append(dept)
-                logger.info(f"Found department: {dept}")
-        
-        # Формируем запрос
-        query_filters = []
-        
-        # Если найдены навыки
-        if search_skills:
-            skill_conditions = []
-            for skill in search_skills:
-                skill_conditions.append(Employee.skills.ilike(f'%{skill}%'))
-            query_filters.append(or_(*skill_conditions))
-        
-        # Если найдены интересы
-        if search_interests:
-            interest_conditions = []
-            for interest in search_interests:
-                interest_conditions.append(Employee.interests.ilike(f'%{interest}%'))
-            query_filters.append(or_(*interest_conditions))
+        with metrics.stage('sql'):
+            employees = search.fetch_all(search.employees_query(session, query))
+        metrics.ROWS_RETURNED.labels('employees').observe(len(employees))
         
-        # Если найдены роли
-        if search_roles:
-            role_conditions = []
-            for role in search_roles:
-                role_keywords_list = role_keywords[role]
-                role_conditions.append(or_(
-                    *[Employee.position.ilike(f'%{keyword}%') for keyword in role_keywords_list]
-                ))
-            query_filters.append(or_(*role_conditions))
-        
-        # Если найдены отделы
-        if search_departments:
-            dept_conditions = []
-            for dept in search_departments:
-                dept_keywords_list = departments[dept]
-                dept_conditions.append(or_(
-                    *[Employee.department.ilike(f'%{keyword}%') for keyword in dept_keywords_list]
-                ))
-            query_filters.append(or_(*dept_conditions))
-        
-        # Если запрос содержит "все" или "всех", показываем всех сотрудников
-        if 'все' in query_lower or 'всех' in query_lower:
-            employees = session.query(Employee).all()
-        # Если нет конкретных критериев, ищем по всему тексту
-        elif not query_filters:
-            employees = session.query(Employee).filter(or_(
-                Employee.name.ilike(f'%{query}%'),
-                Employee.position.ilike(f'%{query}%'),
-                Employee.department.ilike(f'%{query}%'),
-                Employee.interests.ilike(f'%{query}%'),
-                Employee.skills.ilike(f'%{query}%')
-            )).all()
-        else:
-            # Выполняем поиск с фильтрами
-            employees = session.query(Employee).filter(and_(*query_filters)).all()
-        
-        if employees:
-            # Группируем сотрудников по отделам
-            dept_employees = {}
-            for emp in employees:
-                if emp.department not in dept_employees:
-                    dept_employees[emp.department] = []
-                dept_employees[emp.department].append(emp)
+        with metrics.stage('render'):
+            if employees:
+                # Группируем сотрудников по отделам
+                dept_employees = {}
+                for emp in employees:
+                    if emp.department not in dept_employees:
+                        dept_employees[emp.department] = []
+                    dept_employees[emp.department].append(emp)
             
-            # Формируем ответ
-            response = "Найдены следующие сотрудники:\n\n"
-            for dept, emps in dept_employees.items():
-                response += f"📌 {dept}:\n"
-                for emp in emps:
-                    response += f"• {emp.name} - {emp.position}\n"
-                    if emp.skills:
-                        response += f"  🛠️ Навыки: {emp.skills}\n"
-                    if emp.interests:
-                        response += f"  🎯 Интересы: {emp.interests}\n"
-                    if emp.bio:
-                        response += f"  📝 О себе: {emp.bio}\n"
-                    if emp.email:
-                        response += f"  📧 Email: {emp.email}\n"
-                    if emp.phone:
-                        response += f"  📱 Телефон: {emp.phone}\n"
-                    if emp.hire_date:
-                        response += f"  📅 В компании с: {emp.hire_date}\n"
-                    if emp.birthday:
-                        response += f"  🎂 День рождения: {emp.birthday}\n"
-                response += "\n"
-            return response
+                # Формируем ответ
+                response = "Найдены следующие сотрудники:\n\n"
+                for dept, emps in dept_employees.items():
+                    response += f"📌 {dept}:\n"
+                    for emp in emps:
+                        response += f"• {emp.name} - {emp.position}\n"
+                        if emp.skills:
+                            response += f"  🛠️ Навыки: {emp.skills}\n"
+                        if emp.interests:
+                            response += f"  🎯 Интересы: {emp.interests}\n"
+                        if emp.bio:
+                            response += f"  📝 О себе: {emp.bio}\n"
+                        if emp.email:
+                            response += f"  📧 Email: {emp.email}\n"
+                        if emp.phone:
+                            response += f"  📱 Телефон: {emp.phone}\n"
+                        if emp.hire_date:
+                            response += f"  📅 В компании с: {emp.hire_date}\n"
+                        if emp.birthday:
+                            response += f"  🎂 День рождения: {emp.birthday}\n"
+                    response += "\n"
+                return response
         
         return "Сотрудники не найдены. Попробуйте уточнить критерии поиска."
     finally:
         session.close()
 
+@sql_profiling.tagged("информация о мероприятии")
 def search_events(query: str) -> str:
     """Search for events based on the query."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching events with query: {query_lower}")
+    logger.info("Searching events with query: %s", query_lower)
     
     try:
-        from datetime import datetime, timedelta
-        
-        # Определяем временной период
-        today = datetime.now().date()
-        week_start = today - timedelta(days=today.weekday())
-        week_end = week_start + timedelta(days=6)
-        month_end = today + timedelta(days=30)
-        
-        # Проверяем, есть ли в запросе упоминание сотрудника
-        employee_name = None
-        for word in query_lower.split():
-            if len(word) > 3:  # Игнорируем короткие слова
-                employee = session.query(Employee).filter(
-                    Employee.name.ilike(f'%{word}%')
-                ).first()
-                if employee:
-                    employee_name = employee.name
-                    break
-        
-        # Формируем запрос
-        if employee_name:
-            # Если найден сотрудник, ищем мероприятия, связанные с ним
-            events = session.query(Event).join(
-                event_participants
-            ).join(
-                Employee
-            ).filter(
-                Employee.name == employee_name
-            ).all()
-        elif 'неделе' in query_lower or 'недели' in query_lower:
-            # Если запрос о неделе, показываем мероприятия на текущую неделю
-            events = session.query(Event).filter(
-                Event.date >= week_start,
-                Event.date <= week_end
-            ).all()
-        elif 'месяц' in query_lower or 'месяца' in query_lower:
-            # Если запрос о месяце, показываем мероприятия на ближайший месяц
-            events = session.query(Event).filter(
-                Event.date >= today,
-                Event.date <= month_end
-            ).all()
-        elif 'семинар' in query_lower or 'тренинг' in query_lower:
-            # Если запрос о семинарах или тренингах
-            events = session.query(Event).filter(
-                Event.type == EventType.TRAINING
-            ).all()
-        elif 'день рождения' in query_lower:
-            # Если запрос о днях рождения
-            events = session.query(Event).filter(
-                Event.type == EventType.BIRTHDAY
-            ).all()
-        else:
-            # Поиск по названию или типу
-            events = session.query(Event).filter(
-                or_(
-                    Event.name.ilike(f'%{query}%'),
-                    Event.type.ilike(f'%{query}%'),
-                    Event.description.ilike(f'%{query}%')
-                )
-            ).all()
+        with metrics.stage('sql'):
+            # Дни рождения берутся из карточек сотрудников через календарный индекс
+            if search.is_birthday_query(query):
+                birthdays = search.birthdays(session, query)
+                metrics.ROWS_RETURNED.labels('events').observe(len(birthdays))
+                if not birthdays:
+                    return "Дни рождения не найдены."
+                response = "🎂 Дни рождения:\n\n"
+                for day, person in birthdays:
+                    department = f" ({person.department})" if person.department else ""
+                    response += f"• {day.strftime('%d.%m')} - {person.name}{department}\n"
+                return response
+            
+            events = search.fetch_all(search.events_query(session, query))
+        metrics.ROWS_RETURNED.labels('events').observe(len(events))
         
-        if events:
-            # Группируем мероприятия по датам
-            date_events = {}
-            for event in events:
-                if event.date not in date_events:
-                    date_events[event.date] = []
-                date_events[event.date].append(event)
+        with metrics.stage('render'):
+            if events:
+                # Группируем мероприятия по датам
+                date_events = {}
+                for event in events:
+                    if event.date not in date_events:
+                        date_events[event.date] = []
+                    date_events[event.date].append(event)
             
-            # Формируем ответ
-            response = "Найдены следующие мероприятия:\n\n"
-            for date, evts in sorted(date_events.items()):
-                response += f"📅 {date}:\n"
-                for event in evts:
-                    response += f"• {event.name} ({event.type.value})\n"
-                    if event.time:
-                        response += f"  🕒 {event.time}\n"
-                    if event.description:
-                        response += f"  {event.description}\n"
-                    if event.location:
-                        response += f"  📍 {event.location}\n"
-                    if event.participants:
-                        response += f"  👥 Участники: {', '.join(p.name for p in event.participants)}\n"
-                    if event.tags:
-                        response += f"  🏷️ Теги: {event.tags}\n"
-                    response += "\n"
-            return response
+                # Формируем ответ
+                response = "Найдены следующие мероприятия:\n\n"
+                for date, evts in sorted(date_events.items()):
+                    response += f"📅 {date}:\n"
+                    for event in evts:
+                        response += f"• {event.name} ({event.type.value})\n"
+                        if event.time:
+                            response += f"  🕒 {event.time}\n"
+                        if event.description:
+                            response += f"  {event.description}\n"
+                        if event.location:
+                            response += f"  📍 {event.location}\n"
+                        if getattr(event, 'max_participants', None):
+                            response += f"  👥 Участников: {event.participant_count}/{event.max_participants}\n"
+                        elif event.participant_count:
+                            response += f"  👥 Участников: {event.participant_count}\n"
+                        if getattr(event, 'tags', None):
+                            response += f"  🏷️ Теги: {event.tags}\n"
+                        response += "\n"
+                return response
         
         return "Мероприятия не найдены."
     finally:
         session.close()
 
-def search_tasks(query: str) -> str:
-    """Search for tasks based on the query."""
+@sql_profiling.tagged("информация о задаче")
+def search_tasks(query: str, assignee_id: Optional[int] = None) -> str:
+    """Search for tasks based on the query, optionally only those of one assignee."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching tasks with query: {query_lower}")
+    logger.info("Searching tasks with query: %s", query_lower)
     
     try:
-        # Определяем ключевые слова для статусов задач
-        status_keywords = {
-            TaskStatus.TODO: [
-                'todo', 'сделать', 'выполнить', 'к выполнению', 'новые',
-                'ожидает', 'ожидающие', 'в очереди', 'в планах'
-            ],
-            TaskStatus.IN_PROGRESS: [
-                'в работе', 'текущие', 'выполняются', 'активные',
-                'in progress', 'разработка', 'разрабатывается'
-            ],
-            TaskStatus.DONE: [
-                'done', 'сделано', 'выполнено', 'завершено', 'готово',
-                'завершенные', 'выполненные', 'готовые'
-            ],
-            TaskStatus.BLOCKED: [
-                'blocked', 'блокер', 'блокеры', 'заблокировано',
-                'проблема', 'проблемы', 'ошибка', 'ошибки',
-                'препятствие', 'препятствия'
-            ]
-        }
-        
-        # Определяем ключевые слова для приоритетов
-        priority_keywords = {
-            'high': ['высокий', 'высокая', 'срочно', 'срочная', 'критично', 'критичная'],
-            'medium': ['средний', 'средняя', 'обычный', 'обычная'],
-            'low': ['низкий', 'низкая', 'не срочно', 'не срочная']
-        }
-        
-        # Формируем запрос
-        query_filters = []
-        
-        # Проверяем, есть ли в запросе упоминание сотрудника
-        employee_name = None
-        for word in query_lower.split():
-            if len(word) > 3:  # Игнорируем короткие слова
-                employee = session.query(Employee).filter(
-                    Employee.name.ilike(f'%{word}%')
-                ).first()
-                if employee:
-                    employee_name = employee.name
-                    logger.info(f"Found employee: {employee_name}")
-                    query_filters.append(Task.assignee.has(Employee.name == employee_name))
-                    break
-        
-        # Проверяем статусы задач
-        for status, keywords in status_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
-                logger.info(f"Found status: {status}")
-                query_filters.append(Task.status == status)
+        # "Похожие задачи на ..." ищутся по смыслу через индекс задач
+        if 'похож' in query_lower and assignee_id is None:
+            return similar_tasks_response(session, query)
+        # "Сколько задач в работе", "есть ли блокеры" - из агрегатной таблицы
+        if aggregates.is_summary_query(query):
+            with metrics.stage('sql'):
+                # Счет по названному сотруднику или по привязанному аккаунту ("сколько у меня задач")
+                assignee = session.get(Employee, assignee_id) if assignee_id is not None \
+                    else search.mentioned_employee(session, query_lower)
+                return aggregates.task_summary(session, query, assignee=assignee)
         
-        # Проверяем приоритеты
-        for priority, keywords in priority_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
-                logger.info(f"Found priority: {priority}")
-                query_filters.append(Task.priority == priority)
-        
-        # Проверяем сроки
-        today = datetime.now().date()
-        if 'сегодня' in query_lower:
-            logger.info("Filtering for today's tasks")
-            query_filters.append(Task.deadline == today)
-        elif 'завтра' in query_lower:
-            tomorrow = today + timedelta(days=1)
-            logger.info("Filtering for tomorrow's tasks")
-            query_filters.append(Task.deadline == tomorrow)
-        elif 'неделе' in query_lower or 'недели' in query_lower:
-            week_end = today + timedelta(days=6)
-            logger.info(f"Filtering for tasks until {week_end}")
-            query_filters.append(Task.deadline <= week_end)
-        elif 'месяц' in query_lower or 'месяца' in query_lower:
-            month_end = today + timedelta(days=30)
-            logger.info(f"Filtering for tasks until {month_end}")
-            query_filters.append(Task.deadline <= month_end)
-        
-        # Проверяем теги
-        if 'тег' in query_lower or 'теги' in query_lower:
-            tag = query_lower.split('тег')[-1].strip()
-            if tag:
-                logger.info(f"Filtering by tag: {tag}")
-                query_filters.append(Task.tags.ilike(f'%{tag}%'))
-        
-        # Если нет конкретных фильтров, ищем по всему тексту
-        if not query_filters:
-            logger.info("No specific filters found, searching in all fields")
-            query_filters.append(or_(
-                Task.title.ilike(f'%{query}%'),
-                Task.description.ilike(f'%{query}%'),
-                Task.tags.ilike(f'%{query}%')
-            ))
-        
-        # Выполняем поиск с фильтрами
-        logger.info(f"Applying filters: {query_filters}")
-        tasks = session.query(Task).filter(and_(*query_filters)).all()
-        logger.info(f"Found {len(tasks)} tasks")
+        with metrics.stage('sql'):
+            tasks = search.fetch_all(
+                search.tasks_query(session, query, assignee_id=assignee_id).options(joinedload(Task.assignee))
+            )
+            logger.info("Found %d tasks", len(tasks))
+        metrics.ROWS_RETURNED.labels('tasks').observe(len(tasks))
         
-        if tasks:
-            # Группируем задачи по статусу
-            status_tasks = {}
-            for task in tasks:
-                if task.status not in status_tasks:
-                    status_tasks[task.status] = []
-                status_tasks[task.status].append(task)
+        with metrics.stage('render'):
+            if tasks:
+                # Группируем задачи по статусу
+                status_tasks = {}
+                for task in tasks:
+                    if task.status not in status_tasks:
+                        status_tasks[task.status] = []
+                    status_tasks[task.status].append(task)
             
-            # Формируем ответ
-            response = "Найдены следующие задачи:\n\n"
-            for status, tsk in status_tasks.items():
-                response += f"📌 {status.value}:\n"
-                for task in tsk:
-                    response += f"• {task.title}\n"
-                    if task.description:
-                        response += f"  {task.description}\n"
-                    response += f"  📅 Срок: {task.deadline}\n"
-                    response += f"  👤 Исполнитель: {task.assignee.name}\n"
-                    if task.priority:
-                        response += f"  ⚡ Приоритет: {task.priority}\n"
-                    if task.tags:
-                        response += f"  🏷️ Теги: {task.tags}\n"
-                    if task.created_at:
-                        response += f"  📝 Создана: {task.created_at}\n"
-                    if task.updated_at:
-                        response += f"  🔄 Обновлена: {task.updated_at}\n"
-                    response += "\n"
-            return response
+                # Формируем ответ
+                response = "Найдены следующие задачи:\n\n"
+                for status, tsk in status_tasks.items():
+                    response += f"📌 {status.value}:\n"
+                    for task in tsk:
+                        response += f"• {task.title}\n"
+                        if task.description:
+                            response += f"  {task.description}\n"
+                        response += f"  📅 Срок: {task.deadline}\n"
+                        response += f"  👤 Исполнитель: {task.assignee.name}\n"
+                        if task.priority:
+                            response += f"  ⚡ Приоритет: {task.priority}\n"
+                        if task.tags:
+                            response += f"  🏷️ Теги: {task.tags}\n"
+                        if task.created_at:
+                            response += f"  📝 Создана: {task.created_at}\n"
+                        if task.updated_at:
+                            response += f"  🔄 Обновлена: {task.updated_at}\n"
+                        response += "\n"
+                return response
         
         return "Задачи не найдены."
     finally:
         session.close()
 
+@sql_profiling.tagged("социальные активности")
 def search_activities(query: str) -> str:
     """Search for social activities based on the query."""
     session = get_session()
     query_lower = query.lower()
-    logger.info(f"Searching activities with query: {query_lower}")
+    logger.info("Searching activities with query: %s", query_lower)
     
     try:
-        from datetime import datetime, timedelta
-        
-        # Определяем временной период
-        today = datetime.now().date()
-        week_start = today - timedelta(days=today.weekday())
-        week_end = week_start + timedelta(days=6)
-        month_end = today + timedelta(days=30)
-        
-        # Проверяем, есть ли в запросе упоминание сотрудника
-        employee_name = None
-        for word in query_lower.split():
-            if len(word) > 3:  # Игнорируем короткие слова
-                employee = session.query(Employee).filter(
-                    Employee.name.ilike(f'%{word}%')
-                ).first()
-                if employee:
-                    employee_name = employee.name
-                    break
+        # "Сколько свободных мест", "заполненность" - из агрегатной таблицы
+        if aggregates.is_fill_query(query):
+            with metrics.stage('sql'):
+                return aggregates.activity_summary(session)
         
-        # Формируем запрос
-        if employee_name:
-            # Если найден сотрудник, ищем активности, связанные с ним
-            activities = session.query(Activity).join(
-                activity_participants
-            ).join(
-                Employee
-            ).filter(
-                Employee.name == employee_name,
-                Activity.is_active == True
-            ).all()
-        elif 'все' in query_lower or 'всех' in query_lower:
-            # Показываем все активные активности
-            activities = session.query(Activity).filter(
-                Activity.is_active == True
-            ).all()
-        elif 'неделе' in query_lower or 'недели' in query_lower:
-            # Если запрос о неделе, показываем активности на текущую неделю
-            activities = session.query(Activity).filter(
-                Activity.date >= week_start,
-                Activity.date <= week_end,
-                Activity.is_active == True
-            ).all()
-        elif 'месяц' in query_lower or 'месяца' in query_lower:
-            # Если запрос о месяце, показываем активности на ближайший месяц
-            activities = session.query(Activity).filter(
-                Activity.date >= today,
-                Activity.date <= month_end,
-                Activity.is_active == True
-            ).all()
-        elif 'йога' in query_lower:
-            # Если запрос о йоге
-            activities = session.query(Activity).filter(
-                Activity.type == ActivityType.TRAINING,
-                Activity.name.ilike('%йога%'),
-                Activity.is_active == True
-            ).all()
-        elif 'игра' in query_lower or 'игры' in query_lower:
-            # Если запрос об играх
-            activities = session.query(Activity).filter(
-                Activity.type == ActivityType.GAME,
-                Activity.is_active == True
-            ).all()
-        elif 'обед' in query_lower:
-            # Если запрос об обедах
-            activities = session.query(Activity).filter(
-                Activity.type == ActivityType.LUNCH,
-                Activity.is_active == True
-            ).all()
-        else:
-            # Поиск по названию, типу или описанию
-            activities = session.query(Activity).filter(
-                and_(
-                    Activity.is_active == True,
-                    or_(
-                        Activity.name.ilike(f'%{query}%'),
-                        Activity.description.ilike(f'%{query}%'),
-                        Activity.type.ilike(f'%{query}%'),
-                        Activity.tags.ilike(f'%{query}%')
-                    )
-                )
-            ).all()
+        with metrics.stage('sql'):
+            activities = search.fetch_all(search.activities_query(session, query))
+        metrics.ROWS_RETURNED.labels('activities').observe(len(activities))
         
-        if activities:
-            # Группируем активности по датам
-            date_activities = {}
-            for activity in activities:
-                if activity.date not in date_activities:
-                    date_activities[activity.date] = []
-                date_activities[activity.date].append(activity)
+        with metrics.stage('render'):
+            if activities:
+                # Группируем активности по датам
+                date_activities = {}
+                for activity in activities:
+                    if activity.date not in date_activities:
+                        date_activities[activity.date] = []
+                    date_activities[activity.date].append(activity)
             
-            # Формируем ответ
-            response = "Найдены следующие активности:\n\n"
-            for date, acts in sorted(date_activities.items()):
-                response += f"📅 {date}:\n"
-                for activity in acts:
-                    response += f"• {activity.name} ({activity.type.value})\n"
-                    if activity.time:
-                        response += f"  🕒 {activity.time}\n"
-                    if activity.description:
-                        response += f"  {activity.description}\n"
-                    if activity.location:
-                        response += f"  📍 {activity.location}\n"
-                    if activity.max_participants:
-                        response += f"  👥 Максимум участников: {activity.max_participants}\n"
-                    if activity.participants:
-                        response += f"  👥 Участники: {', '.join(p.name for p in activity.participants)}\n"
-                    if activity.tags:
-                        response += f"  🏷️ Теги: {activity.tags}\n"
-                    if activity.created_at:
-                        response += f"  📝 Создана: {activity.created_at}\n"
-                    if activity.updated_at:
-                        response += f"  🔄 Обновлена: {activity.updated_at}\n"
-                    response += "\n"
-            return response
+                # Формируем ответ
+                response = "Найдены следующие активности:\n\n"
+                for date, acts in sorted(date_activities.items()):
+                    response += f"📅 {date}:\n"
+                    for activity in acts:
+                        response += f"• {activity.name} ({activity.type.value})\n"
+                        if activity.time:
+                            response += f"  🕒 {activity.time}\n"
+                        if activity.description:
+                            response += f"  {activity.description}\n"
+                        if activity.location:
+                            response += f"  📍 {activity.location}\n"
+                        if activity.max_participants:
+                            response += f"  👥 Участников: {activity.participant_count}/{activity.max_participants}\n"
+                        elif activity.participant_count:
+                            response += f"  👥 Участников: {activity.participant_count}\n"
+                        if activity.tags:
+                            response += f"  🏷️ Теги: {activity.tags}\n"
+                        if activity.created_at:
+                            response += f"  📝 Создана: {activity.created_at}\n"
+                        if activity.updated_at:
+                            response += f"  🔄 Обновлена: {activity.updated_at}\n"
+                        response += "\n"
+                return response
         
         return "Активности не найдены."
     finally:
@@ -1136,19 +493,36 @@ def search_general_info(query: str) -> str:
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle user messages and respond accordingly."""
+    started = time.perf_counter()
     query = update.message.text
-    logger.info(f"Received message: {query}")
+    logging_setup.sample_message()
+    logger.info("Received message: %s", query)
     
     # Проверяем на приветствие
     if any(word in query.lower() for word in ['привет', 'здравствуй', 'добрый', 'хай', 'хеллоу']):
-        await update.message.reply_text(
-            "👋 Привет! Я корпоративный бот, готовый помочь вам с поиском информации о сотрудниках, "
-            "мероприятиях, задачах и социальных активностях. Просто задайте вопрос в свободной форме!"
-        )
+        metrics.QUERIES.labels("приветствие").inc()
+        with metrics.stage('reply'):
+            await outbound.sender.deliver(
+                context.bot, update.effective_chat.id,
+                "👋 Привет! Я корпоративный бот, готовый помочь вам с поиском информации о сотрудниках, "
+                "мероприятиях, задачах и социальных активностях. Просто задайте вопрос в свободной форме!"
+            )
+        metrics.STAGE_SECONDS.labels('total').observe(time.perf_counter() - started)
         return
     
-    category, confidence = classify_query(query)
-    logger.info(f"Classified as: {category} with confidence {confidence:.2f}")
+    # Личные задачи: привязка из кэша и один запрос по индексу исполнителя
+    if MY_TASKS_PATTERN.search(query.lower()):
+        metrics.QUERIES.labels("информация о задаче").inc()
+        response = my_tasks(update.effective_user, query)
+        with metrics.stage('reply'):
+            await outbound.sender.deliver(context.bot, update.effective_chat.id, response)
+        metrics.STAGE_SECONDS.labels('total').observe(time.perf_counter() - started)
+        return
+    
+    # Классификация может обращаться к модели, поэтому не блокируем цикл событий
+    category, confidence = await asyncio.to_thread(classify_query, query, update.effective_chat.id)
+    logger.info("Classified as: %s with confidence %.2f", category, confidence)
+    metrics.QUERIES.labels(category).inc()
     
     if category == "неопределенный запрос":
         # Пробуем найти ответ в общей информации
@@ -1167,11 +541,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "• Какие активности запланированы на месяц?"
             )
     elif category == "поиск сотрудника":
-        response = search_employees(query)
+        # Семантический поиск кодирует запрос моделью и ждет фоновую синхронизацию индекса
+        response = await asyncio.to_thread(search_employees, query)
     elif category == "информация о мероприятии":
         response = search_events(query)
     elif category == "информация о задаче":
-        response = search_tasks(query)
+        # "Похожие задачи" кодируют запрос моделью
+        response = await asyncio.to_thread(search_tasks, query)
     elif category == "социальные активности":
         response = search_activities(query)
     elif category == "общая информация":
@@ -1179,8 +555,155 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         response = "Извините, я не совсем понял ваш вопрос. Попробуйте переформулировать или используйте /help для получения подсказок."
     
-    logger.info(f"Sending response: {response}")
-    await update.message.reply_text(response)
+    logger.info("Sending response: %s", response, extra={'chat_id': update.effective_chat.id, 'response_length': len(response)})
+    # Длинные ответы делятся на сообщения, отправка идет с учетом лимитов Bot API
+    with metrics.stage('reply'):
+        outcome = await outbound.sender.deliver(context.bot, update.effective_chat.id, response)
+    if outcome != 'sent':
+        logger.warning("Reply to chat %s not delivered: %s", update.effective_chat.id, outcome)
+    metrics.STAGE_SECONDS.labels('total').observe(time.perf_counter() - started)
+
+NOT_BOUND_MESSAGE = "Не удалось найти вас среди сотрудников. Привяжите аккаунт командой /bind ваш@email"
+
+# "мои задачи", "задачи на мне", "сколько у меня задач" - отвечаем по привязке аккаунта, без классификатора.
+# "мне"/"меня" учитываются только рядом со словом "задачи" или в обороте "у меня": "покажи мне задачи Ивана" - не про себя
+MY_TASKS_PATTERN = re.compile(
+    r'\b(мои|моих|моим)\s+(\w+\s+)?задач'
+    r'|\bзадач\w*\s+(на\s+мне|для\s+меня|мои|моих)\b'
+    r'|\bу\s+меня\b.*\bзадач|\bзадач\w*\b.*\bу\s+меня\b'
+)
+
+def resolve_employee_id(session, user) -> Optional[int]:
+    """Employee bound to the Telegram user; answered from the identity cache when possible."""
+    if user is None:
+        return None
+    return identities.employee_id(session, user.id)
+
+def my_tasks(user, query: str) -> str:
+    """Tasks of the employee bound to the Telegram user, filtered like any task query."""
+    session = get_session()
+    try:
+        employee_id = resolve_employee_id(session, user)
+    finally:
+        session.close()
+    if employee_id is None:
+        return NOT_BOUND_MESSAGE
+    return search_tasks(query, assignee_id=employee_id)
+
+async def bind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Request a binding of the Telegram account to an employee by corporate email: /bind ivan@company.com"""
+    email = ' '.join(context.args or []).strip()
+    if not email:
+        await update.message.reply_text("Укажите корпоративную почту: /bind ivan@company.com")
+        return
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+    
+    def file_request(session):
+        # Точное сравнение: ввод пользователя не должен работать как шаблон LIKE
+        employee = session.query(Employee).filter(func.lower(Employee.email) == email.lower()).first()
+        if employee is None:
+            return "not_found", None, None
+        status, request = request_binding(session, user.id, chat_id, employee.id)
+        return status, request.id if request is not None else None, employee.name
+    
+    try:
+        # Запись уходит в общую транзакцию очереди записи
+        status, request_id, employee_name = await write_queue.run(file_request)
+    except Exception as e:
+        logger.error(f"Error binding account: {e}")
+        metrics.ERRORS.labels('bind').inc()
+        await update.message.reply_text("Произошла ошибка при привязке аккаунта. Попробуйте позже.")
+        return
+    if status == "not_found":
+        await update.message.reply_text("Сотрудник с такой почтой не найден.")
+        return
+    if status == "bound":
+        await update.message.reply_text("Аккаунт уже привязан к этому сотруднику.")
+        return
+    if status == "taken":
+        await update.message.reply_text("Этот сотрудник уже привязан к другому аккаунту Telegram.")
+        return
+
+    # Владение почтой никто не проверяет, поэтому привязку подтверждает администратор
+    if not BOT_ADMIN_IDS:
+        logger.warning("Binding request #%d is waiting, but BOT_ADMIN_IDS is empty", request_id)
+    username = f" @{user.username}" if user.username else ""
+    for admin_id in BOT_ADMIN_IDS:
+        await outbound.sender.deliver(
+            context.bot, admin_id,
+            f"🔐 Заявка #{request_id}: {user.full_name}{username} (id {user.id}) → {employee_name} <{email}>\n"
+            f"Подтвердить: /approve_bind {request_id}\nОтклонить: /reject_bind {request_id}"
+        )
+    await update.message.reply_text(
+        f"📨 Заявка #{request_id} отправлена администратору. "
+        "После подтверждения можно будет спросить «мои задачи»."
+    )
+
+async def approve_bind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Approve a binding request (administrators only): /approve_bind 12"""
+    await review_binding(update, context, approved=True)
+
+async def reject_bind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reject a binding request (administrators only): /reject_bind 12"""
+    await review_binding(update, context, approved=False)
+
+async def review_binding(update: Update, context: ContextTypes.DEFAULT_TYPE, approved: bool):
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Укажите номер заявки, например: /approve_bind 12")
+        return
+    request_id = int(context.args[0])
+    
+    def review(session):
+        if approved:
+            status, request = approve(session, request_id)
+        else:
+            request = reject(session, request_id)
+            status = "rejected" if request is not None else "missing"
+        if request is None:
+            return status, None, None, None
+        return status, request.telegram_user_id, request.chat_id, request.employee_id
+    
+    try:
+        status, user_id, chat_id, employee_id = await write_queue.run(review)
+    except Exception as e:
+        logger.error(f"Error reviewing binding request: {e}")
+        metrics.ERRORS.labels('review_binding').inc()
+        await update.message.reply_text("Произошла ошибка. Попробуйте позже.")
+        return
+    if status == "missing":
+        await update.message.reply_text("Заявка не найдена.")
+        return
+
+    if status == "bound":
+        identities.remember(user_id, employee_id)
+        await update.message.reply_text("✅ Привязка подтверждена.")
+        await outbound.sender.deliver(context.bot, chat_id, "✅ Аккаунт привязан. Теперь можно спросить «мои задачи».")
+    elif status == "taken":
+        await update.message.reply_text("Сотрудник уже привязан к другому аккаунту; заявка закрыта.")
+        await outbound.sender.deliver(context.bot, chat_id, "Заявка на привязку аккаунта отклонена.")
+    else:
+        await update.message.reply_text("Заявка отклонена.")
+        await outbound.sender.deliver(context.bot, chat_id, "Заявка на привязку аккаунта отклонена.")
+
+async def unbind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remove the binding of the Telegram account."""
+    user_id = update.effective_user.id
+    
+    def remove(session):
+        return unbind(session, user_id)
+    
+    try:
+        removed = await write_queue.run(remove)
+        identities.forget(user_id)
+        await update.message.reply_text("Привязка аккаунта удалена." if removed else "Аккаунт не был привязан.")
+    except Exception as e:
+        logger.error(f"Error unbinding account: {e}")
+        metrics.ERRORS.labels('unbind').inc()
+        await update.message.reply_text("Произошла ошибка. Попробуйте позже.")
 
 async def create_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Create a new social activity."""
@@ -1202,8 +725,9 @@ async def create_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        session = get_session()
-        try:
+        user = update.effective_user
+        
+        def insert_activity(session):
             # Create new activity
             activity = Activity(
                 name=activity_data['name'],
@@ -1219,23 +743,28 @@ async def create_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             
             # Add creator as first participant
-            activity.participants.append(update.effective_user)
+            creator_id = resolve_employee_id(session, user)
+            if creator_id is not None:
+                activity.participants.append(session.get(Employee, creator_id))
             
             session.add(activity)
-            session.commit()
-            
-            await update.message.reply_text(
-                f"✅ Активность '{activity.name}' успешно создана!\n\n"
-                f"📅 Дата: {activity.date}\n"
-                f"🕒 Время: {activity.time}\n"
-                f"📍 Место: {activity.location}\n"
-                f"👥 Макс. участников: {activity.max_participants}\n\n"
-                f"Присоединяйтесь к активности!"
-            )
-        finally:
-            session.close()
+            session.flush()
+            return activity.id
+        
+        # Запись уходит в общую транзакцию очереди записи
+        await write_queue.run(insert_activity)
+        
+        await update.message.reply_text(
+            f"✅ Активность '{activity_data['name']}' успешно создана!\n\n"
+            f"📅 Дата: {activity_data['date']}\n"
+            f"🕒 Время: {activity_data['time']}\n"
+            f"📍 Место: {activity_data['location']}\n"
+            f"👥 Макс. участников: {activity_data['max_participants']}\n\n"
+            f"Присоединяйтесь к активности!"
+        )
     except Exception as e:
         logger.error(f"Error creating activity: {e}")
+        metrics.ERRORS.labels('create_activity').inc()
         await update.message.reply_text("Произошла ошибка при создании активности. Попробуйте позже.")
 
 def parse_activity_data(message: str) -> Optional[Dict]:
@@ -1272,6 +801,7 @@ def parse_activity_data(message: str) -> Optional[Dict]:
         return None
     except Exception as e:
         logger.error(f"Error parsing activity data: {e}")
+        metrics.ERRORS.labels('parse_activity_data').inc()
         return None
 
 async def join_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1282,49 +812,126 @@ async def join_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Пожалуйста, укажите ID активности.")
             return
         
-        session = get_session()
-        try:
-            activity = session.query(Activity).filter(
-                Activity.id == activity_id,
-                Activity.is_active == True
-            ).first()
-            
-            if not activity:
-                await update.message.reply_text("Активность не найдена или уже неактивна.")
-                return
-            
-            if len(activity.participants) >= activity.max_participants:
-                await update.message.reply_text("К сожалению, все места уже заняты.")
-                return
-            
-            if update.effective_user in activity.participants:
-                await update.message.reply_text("Вы уже участвуете в этой активности.")
-                return
-            
-            activity.participants.append(update.effective_user)
-            session.commit()
+        if not activity_id.isdigit():
+            await update.message.reply_text("ID активности должен быть числом.")
+            return
+        activity_id = int(activity_id)
+        
+        user = update.effective_user
+        
+        def join(session):
+            employee_id = resolve_employee_id(session, user)
+            if employee_id is None:
+                return "not_bound", None
             
-            await update.message.reply_text(
-                f"✅ Вы успешно присоединились к активности '{activity.name}'!\n\n"
-                f"📅 Дата: {activity.date}\n"
-                f"🕒 Время: {activity.time}\n"
-                f"📍 Место: {activity.location}\n"
-                f"👥 Участников: {len(activity.participants)}/{activity.max_participants}"
-            )
-        finally:
-            session.close()
+            # Проверка мест и вставка выполняются одним условным запросом
+            result = add_activity_participant(session, activity_id, employee_id)
+            if result != "joined":
+                return result, None
+            aggregates.record_participants_added(session, activity_id)
+            return result, session.execute(
+                select(
+                    Activity.name, Activity.date, Activity.time, Activity.location,
+                    Activity.participant_count, Activity.max_participants
+                ).where(Activity.id == activity_id)
+            ).one()
+        
+        result, activity = await write_queue.run(join)
+        
+        if result == "not_bound":
+            await update.message.reply_text(NOT_BOUND_MESSAGE)
+            return
+        if result == "not_found":
+            await update.message.reply_text("Активность не найдена или уже неактивна.")
+            return
+        if result == "full":
+            await update.message.reply_text("К сожалению, все места уже заняты.")
+            return
+        if result == "already_joined":
+            await update.message.reply_text("Вы уже участвуете в этой активности.")
+            return
+        
+        # Счетчик изменен запросом, а не через ORM - сообщаем индексам сами;
+        # обработчики индексов читают базу, поэтому вне цикла событий
+        await asyncio.to_thread(notify_change, Activity, [activity_id])
+        await update.message.reply_text(
+            f"✅ Вы успешно присоединились к активности '{activity.name}'!\n\n"
+            f"📅 Дата: {activity.date}\n"
+            f"🕒 Время: {activity.time}\n"
+            f"📍 Место: {activity.location}\n"
+            f"👥 Участников: {activity.participant_count}/{activity.max_participants}"
+        )
     except Exception as e:
         logger.error(f"Error joining activity: {e}")
+        metrics.ERRORS.labels('join_activity').inc()
         await update.message.reply_text("Произошла ошибка при присоединении к активности. Попробуйте позже.")
 
+def similar_tasks_response(session, query: str) -> str:
+    """Answer "похожие задачи на #12" or "похожие задачи на <text>" from the task index."""
+    if not task_index.ready:
+        return "Поиск похожих задач сейчас недоступен. Попробуйте позже."
+    task_id = None
+    match = re.search(r'#(\d+)', query)
+    if match:
+        task = session.get(Task, int(match.group(1)))
+        if not task:
+            return "Задача не найдена."
+        task_id, text = task.id, task_text(task.title, task.description)
+    else:
+        text = re.sub(r'^.*?похож\w*\s*(?:задач\w*\s*)?(?:на\s+)?', '', query, flags=re.IGNORECASE).strip(' ?')
+    if not text:
+        return "Уточните, на что должны быть похожи задачи. Пример: похожие задачи на #12"
+    
+    with metrics.stage('embed'):
+        matches = task_index.similar(text, exclude=task_id)
+    metrics.ROWS_RETURNED.labels('similar_tasks').observe(len(matches))
+    if not matches:
+        return "Похожие задачи не найдены."
+    with metrics.stage('sql'):
+        tasks = {task.id: task for task in session.query(Task).filter(Task.id.in_([m[0] for m in matches])).all()}
+    response = "Похожие задачи:\n\n"
+    for match_id, score in matches:
+        task = tasks.get(match_id)
+        if task:
+            response += f"• #{task.id} {task.title} [{task.status.value}] - {score:.0%}\n"
+    return response
+
+async def find_duplicate_tasks(session, rows: List[Dict]) -> Dict[int, List[Task]]:
+    """Existing tasks that look like near-duplicates of the rows about to be inserted."""
+    duplicates = {}
+    if not task_index.ready or not rows:
+        return duplicates
+    # Все блоки кодируются одним вызовом модели и вне цикла событий
+    with metrics.stage('embed'):
+        found = await asyncio.to_thread(
+            task_index.similar_many, [task_text(row['title'], row['description']) for row in rows],
+            3, TASK_DUPLICATE_THRESHOLD
+        )
+    for index, matches in enumerate(found):
+        if matches:
+            duplicates[index] = [task_id for task_id, _ in matches]
+    if duplicates:
+        ids = {task_id for task_ids in duplicates.values() for task_id in task_ids}
+        tasks = {task.id: task for task in session.query(Task).filter(Task.id.in_(ids)).all()}
+        duplicates = {
+            index: [tasks[task_id] for task_id in task_ids if task_id in tasks]
+            for index, task_ids in duplicates.items()
+        }
+    return duplicates
+
 async def create_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Create a new task."""
+    """Create one or several tasks.
+
+    Several tasks can be created at once: blocks are separated by an empty line or "---".
+    Assignees of all blocks are resolved with one query and the tasks are inserted with one statement.
+    """
     try:
         # Parse task details from message
         message_text = update.message.text
-        task_data = parse_task_data(message_text)
+        blocks = split_task_blocks(message_text)
+        parsed = [parse_task_data(block) for block in blocks]
         
-        if not task_data:
+        if not any(parsed):
             await update.message.reply_text(
                 "Пожалуйста, укажите детали задачи в формате:\n"
                 "Создать задачу: [название]\n"
@@ -1332,51 +939,117 @@ async def create_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Исполнитель: [имя]\n"
                 "Срок: [дд.мм.гггг]\n"
                 "Приоритет: [высокий/средний/низкий]\n"
-                "Теги: [тег1, тег2]"
+                "Теги: [тег1, тег2]\n\n"
+                "Чтобы создать несколько задач, разделите блоки пустой строкой или строкой ---"
             )
             return
         
         session = get_session()
         try:
-            # Find assignee
-            assignee = session.query(Employee).filter(
-                Employee.name.ilike(f"%{task_data['assignee']}%")
-            ).first()
+            # Find all assignees in one query
+            assignees = resolve_assignees(session, [data['assignee'] for data in parsed if data])
             
-            if not assignee:
-                await update.message.reply_text("Исполнитель не найден.")
-                return
+            now = datetime.now()
+            rows = []
+            results = []
+            for number, task_data in enumerate(parsed, 1):
+                if not task_data:
+                    results.append((number, None, "не удалось разобрать блок (нужны название, исполнитель и срок)"))
+                    continue
+                assignee = assignees.get(task_data['assignee'])
+                if not assignee:
+                    results.append((number, None, f"исполнитель '{task_data['assignee']}' не найден"))
+                    continue
+                rows.append(dict(
+                    title=task_data['title'],
+                    description=task_data.get('description'),
+                    assignee_id=assignee.id,
+                    deadline=task_data['deadline'],
+                    priority=task_data.get('priority'),
+                    status=TaskStatus.TODO,
+                    tags=task_data.get('tags'),
+                    created_at=now,
+                    updated_at=now
+                ))
+                results.append((number, len(rows) - 1, assignee.name))
             
-            # Create new task
-            task = Task(
-                title=task_data['title'],
-                description=task_data['description'],
-                assignee=assignee,
-                deadline=task_data['deadline'],
-                priority=task_data['priority'],
-                status=TaskStatus.TODO,
-                tags=task_data['tags'],
-                created_at=datetime.now(),
-                updated_at=datetime.now()
-            )
+            # Предупреждаем о почти одинаковых задачах, но не запрещаем создание
+            duplicates = await find_duplicate_tasks(session, rows)
             
-            session.add(task)
-            session.commit()
+            # Create all tasks with one INSERT in the shared write-queue transaction
+            def insert_tasks(write_session):
+                task_ids = write_session.execute(
+                    insert(Task).returning(Task.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+                aggregates.record_tasks(write_session, rows)
+                return task_ids
             
-            await update.message.reply_text(
-                f"✅ Задача '{task.title}' успешно создана!\n\n"
-                f"📝 Описание: {task.description}\n"
-                f"👤 Исполнитель: {task.assignee.name}\n"
-                f"📅 Срок: {task.deadline}\n"
-                f"⚡ Приоритет: {task.priority}\n"
-                f"🏷️ Теги: {task.tags}"
-            )
+            task_ids = []
+            if rows:
+                task_ids = await write_queue.run(insert_tasks)
+                # Обработчики индексов читают новые строки из базы - вне цикла событий
+                await asyncio.to_thread(notify_change, Task, task_ids)
+            
+            if len(blocks) == 1 and task_ids:
+                task_data = rows[0]
+                await update.message.reply_text(
+                    f"✅ Задача '{task_data['title']}' успешно создана!\n\n"
+                    f"📝 Описание: {task_data['description']}\n"
+                    f"👤 Исполнитель: {results[0][2]}\n"
+                    f"📅 Срок: {task_data['deadline']}\n"
+                    f"⚡ Приоритет: {task_data['priority']}\n"
+                    f"🏷️ Теги: {task_data['tags']}" +
+                    ("\n\n⚠️ Похожие задачи уже есть:\n" + "\n".join(
+                        f"• #{task.id} {task.title} [{task.status.value}]" for task in duplicates[0]
+                    ) if duplicates.get(0) else "")
+                )
+                return
+            if len(blocks) == 1:
+                await update.message.reply_text(f"Задача не создана: {results[0][2]}.")
+                return
+            
+            response = f"Создано задач: {len(task_ids)} из {len(blocks)}\n\n"
+            for number, row_index, detail in results:
+                if row_index is None:
+                    response += f"{number}. ❌ {detail}\n"
+                else:
+                    response += f"{number}. ✅ #{task_ids[row_index]} {rows[row_index]['title']} → {detail}\n"
+                    if duplicates.get(row_index):
+                        response += f"   ⚠️ похожа на {', '.join(f'#{task.id}' for task in duplicates[row_index])}\n"
+            # Сводка по многим блокам может превысить лимит длины сообщения
+            await outbound.sender.deliver(context.bot, update.effective_chat.id, response)
         finally:
             session.close()
     except Exception as e:
         logger.error(f"Error creating task: {e}")
+        metrics.ERRORS.labels('create_task').inc()
         await update.message.reply_text("Произошла ошибка при создании задачи. Попробуйте позже.")
 
+def split_task_blocks(message: str) -> List[str]:
+    """Split a /create_task message into per-task blocks."""
+    # Убираем саму команду, но сохраняем текст после нее
+    message = re.sub(r'^/create_task(@\w+)?\s*', '', message.strip())
+    blocks = re.split(r'\n\s*(?:-{3,}\s*)?\n|\n-{3,}\s*(?:\n|$)', message)
+    return [block.strip() for block in blocks if block.strip()]
+
+def resolve_assignees(session, names: List[str]) -> Dict[str, Employee]:
+    """Resolve assignee names from several tasks with one query."""
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return {}
+    candidates = session.query(Employee).filter(
+        or_(*[Employee.name.ilike(f"%{name}%") for name in names])
+    ).order_by(Employee.id).all()
+    
+    assignees = {}
+    for name in names:
+        needle = name.casefold()
+        for employee in candidates:
+            if needle in employee.name.casefold():
+                assignees[name] = employee
+                break
+    return assignees
+
 def parse_task_data(message: str) -> Optional[Dict]:
     """Parse task details from message text."""
     try:
@@ -1389,9 +1062,8 @@ def parse_task_data(message: str) -> Optional[Dict]:
                 key = key.strip().lower()
                 value = value.strip()
                 
-                if 'название' in key:
-                    task_data['title'] = value
-                elif 'описание' in key:
+                # Название проверяется последним: "Описание задачи", "Срок задачи" тоже содержат "задач"
+                if 'описание' in key:
                     task_data['description'] = value
                 elif 'исполнитель' in key:
                     task_data['assignee'] = value
@@ -1401,6 +1073,8 @@ def parse_task_data(message: str) -> Optional[Dict]:
                     task_data['priority'] = value
                 elif 'теги' in key:
                     task_data['tags'] = value
+                elif 'название' in key or 'задач' in key:
+                    task_data['title'] = value
         
         # Validate required fields
         required_fields = ['title', 'assignee', 'deadline']
@@ -1409,50 +1083,265 @@ def parse_task_data(message: str) -> Optional[Dict]:
         return None
     except Exception as e:
         logger.error(f"Error parsing task data: {e}")
+        metrics.ERRORS.labels('parse_task_data').inc()
         return None
 
+# Maximum number of tasks one /update_task command may touch
+MAX_BULK_TASK_IDS = 1000
+
+def parse_task_ids(spec: str) -> List[int]:
+    """Parse an ID list like "12,15,18-30" into sorted unique IDs."""
+    task_ids = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = (int(bound) for bound in part.split('-', 1))
+            if start > end:
+                start, end = end, start
+            if end - start + 1 > MAX_BULK_TASK_IDS:
+                raise ValueError(f"range {part} is too large")
+            task_ids.update(range(start, end + 1))
+        else:
+            task_ids.add(int(part))
+        if len(task_ids) > MAX_BULK_TASK_IDS:
+            raise ValueError("too many task IDs")
+    return sorted(task_ids)
+
+def parse_task_status(value: str) -> Optional[TaskStatus]:
+    """Parse a status given either as the enum name (in_progress) or its value (в работе)."""
+    value = value.strip().lower()
+    for status in TaskStatus:
+        if value in (status.name.lower(), status.value, status.value.replace(' ', '_')):
+            return status
+    return None
+
 async def update_task_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Update task status."""
+    """Update status of one or several tasks with one bulk UPDATE."""
     try:
-        task_id = context.args[0] if context.args else None
-        new_status = context.args[1] if len(context.args) > 1 else None
+        task_spec = context.args[0] if context.args else None
+        new_status = ' '.join(context.args[1:]) if len(context.args) > 1 else None
         
-        if not task_id or not new_status:
+        if not task_spec or not new_status:
             await update.message.reply_text(
                 "Пожалуйста, укажите ID задачи и новый статус.\n"
-                "Пример: /update_task 123 in_progress"
+                "Пример: /update_task 123 in_progress\n"
+                "Несколько задач: /update_task 12,15,18-30 done"
             )
             return
         
-        session = get_session()
         try:
-            task = session.query(Task).filter(Task.id == task_id).first()
-            
-            if not task:
-                await update.message.reply_text("Задача не найдена.")
-                return
-            
-            # Update status
-            task.status = TaskStatus(new_status)
-            task.updated_at = datetime.now()
-            session.commit()
-            
+            task_ids = parse_task_ids(task_spec)
+        except ValueError:
             await update.message.reply_text(
-                f"✅ Статус задачи '{task.title}' обновлен на {task.status.value}!"
+                f"Не удалось разобрать список ID. Укажите до {MAX_BULK_TASK_IDS} задач, например: 12,15,18-30"
             )
-        finally:
-            session.close()
+            return
+        status = parse_task_status(new_status)
+        if not task_ids:
+            await update.message.reply_text("Пожалуйста, укажите ID задачи.")
+            return
+        if not status:
+            await update.message.reply_text(
+                "Неизвестный статус. Доступные статусы: " +
+                ", ".join(f"{s.name.lower()} ({s.value})" for s in TaskStatus)
+            )
+            return
+        
+        def update_status(session):
+            # Прежние статусы нужны агрегатам, поэтому строки читаются под блокировкой до UPDATE
+            updated = session.execute(
+                select(Task.id, Task.title, Task.status, Task.assignee_id, Task.deadline)
+                .where(Task.id.in_(task_ids)).with_for_update()
+            ).all()
+            session.execute(sql_update(Task).where(Task.id.in_(task_ids)).values(
+                status=status,
+                updated_at=datetime.now()
+            ))
+            aggregates.record_status_change(session, updated, status)
+            return updated
+        
+        updated = await write_queue.run(update_status)
+        if not updated:
+            await update.message.reply_text("Задача не найдена." if len(task_ids) == 1 else "Задачи не найдены.")
+            return
+        
+        if len(task_ids) == 1:
+            await update.message.reply_text(
+                f"✅ Статус задачи '{updated[0].title}' обновлен на {status.value}!"
+            )
+            return
+        
+        updated_ids = {row.id for row in updated}
+        missing = [task_id for task_id in task_ids if task_id not in updated_ids]
+        response = f"✅ Статус {len(updated)} задач обновлен на {status.value}:\n"
+        for row in sorted(updated)[:20]:
+            response += f"• #{row.id} {row.title}\n"
+        if len(updated) > 20:
+            response += f"• … и еще {len(updated) - 20}\n"
+        if missing:
+            response += f"\n❌ Не найдены: {', '.join(map(str, missing[:50]))}"
+            if len(missing) > 50:
+                response += f" … (+{len(missing) - 50})"
+        await outbound.sender.deliver(context.bot, update.effective_chat.id, response)
     except Exception as e:
         logger.error(f"Error updating task status: {e}")
+        metrics.ERRORS.labels('update_task_status').inc()
         await update.message.reply_text("Произошла ошибка при обновлении статуса задачи. Попробуйте позже.")
 
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send tasks, events or activities as a CSV/JSONL document (administrators only)."""
+    # Выгрузка содержит все задачи и события компании - только для администраторов
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+    try:
+        entity, file_format, filters_ = export.parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"Не удалось разобрать параметры: {e}\n"
+            "Пример: /export tasks csv status=in_progress from=2025-05-01 to=2025-05-31 dept=IT assignee=Иван\n"
+            f"Форматы: {', '.join(export.EXPORT_FORMATS)}"
+        )
+        return
+    
+    # Выгрузка пишется на диск, а не в память, и строится вне цикла событий
+    with tempfile.TemporaryFile() as f:
+        try:
+            with metrics.stage('export'):
+                count = await asyncio.to_thread(export.export, entity, file_format, f, **filters_)
+        except ValueError as e:
+            await update.message.reply_text(f"Ошибка в параметрах выгрузки: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Error exporting {entity}: {e}")
+            metrics.ERRORS.labels('export').inc()
+            await update.message.reply_text("Произошла ошибка при выгрузке. Попробуйте позже.")
+            return
+        
+        size = f.tell()
+        if size > EXPORT_MAX_DOCUMENT_SIZE:
+            await update.message.reply_text(
+                f"Выгрузка слишком большая ({size // (1024 * 1024)} МБ). "
+                "Сузьте фильтры или воспользуйтесь командой manage.py export."
+            )
+            return
+        f.seek(0)
+        await update.message.reply_document(
+            document=f,
+            filename=export.export_filename(entity, file_format),
+            caption=f"Строк: {count}"
+        )
+
+async def subscribe_digest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Subscribe the chat to the personal or a department daily digest."""
+    department = ' '.join(context.args or []).strip()
+    chat_id = update.effective_chat.id
+    user = update.effective_user
+    
+    def subscribe(session):
+        if department:
+            # Название отдела берем в том написании, что хранится в базе
+            stored = session.query(Employee.department).filter(
+                Employee.department.ilike(department)
+            ).limit(1).scalar()
+            if not stored:
+                return "not_found", None
+            digest.subscribe(session, chat_id, department=stored)
+            return "subscribed", f"отдела {stored}"
+        employee_id = resolve_employee_id(session, user)
+        if employee_id is None:
+            return "not_bound", None
+        digest.subscribe(session, chat_id, employee_id=employee_id)
+        return "subscribed", "с вашими задачами"
+    
+    try:
+        # Подписки переживают перезапуск бота; запись идет через общую очередь
+        status, target = await write_queue.run(subscribe)
+    except Exception as e:
+        logger.error(f"Error subscribing to digest: {e}")
+        metrics.ERRORS.labels('subscribe_digest').inc()
+        await update.message.reply_text("Произошла ошибка при оформлении подписки. Попробуйте позже.")
+        return
+    if status == "not_found":
+        await update.message.reply_text("Отдел не найден.")
+    elif status == "not_bound":
+        await update.message.reply_text(
+            f"{NOT_BOUND_MESSAGE}\n"
+            "Или подпишитесь на дайджест отдела: /subscribe_digest IT"
+        )
+    else:
+        await update.message.reply_text(
+            f"✅ Вы подписаны на ежедневный дайджест {target}. Он приходит в {digest.DIGEST_TIME}."
+        )
+
+async def unsubscribe_digest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop sending the daily digest to this chat."""
+    chat_id = update.effective_chat.id
+    
+    def remove(session):
+        return digest.unsubscribe(session, [chat_id])
+    
+    try:
+        removed = await write_queue.run(remove)
+        await update.message.reply_text(
+            "Подписка на дайджест отменена." if removed else "Этот чат не подписан на дайджест."
+        )
+    except Exception as e:
+        logger.error(f"Error unsubscribing from digest: {e}")
+        metrics.ERRORS.labels('unsubscribe_digest').inc()
+        await update.message.reply_text("Произошла ошибка при отмене подписки. Попробуйте позже.")
+
+employee_changes = ChangePoller(Employee)
+
+async def refresh_employees(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback: pass employees changed by other processes to the indexes."""
+    try:
+        changed = await asyncio.to_thread(employee_changes.poll)
+    except Exception as e:
+        logger.error(f"Error refreshing employees: {e}")
+        metrics.ERRORS.labels('refresh_employees').inc()
+        return
+    if changed:
+        logger.info(f"Refreshed {changed} employees changed outside the bot")
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer @bot queries from the in-memory prefix index; no database access per keystroke."""
+    query = update.inline_query.query
+    try:
+        results = prefix_index.articles(query)
+    except Exception as e:
+        logger.error(f"Error answering inline query: {e}")
+        metrics.ERRORS.labels('inline_query').inc()
+        results = []
+    # Ответ зависит только от текста запроса, поэтому Telegram может делить кэш между пользователями
+    await update.inline_query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+
 def main():
     """Start the bot."""
-    # Initialize database
-    init_db()
+    # Initialize database; bindings, subscriptions and imported employees are kept
+    init_db(reset=DB_RESET)
+    employee_changes.start()
+    
+    # Expose metrics for Prometheus
+    metrics.start_http_server(METRICS_PORT, METRICS_LISTEN)
+    
+    # Embed employee profiles and tasks in the background; lookups degrade until they are ready
+    if semantic_search.SEMANTIC_SEARCH:
+        semantic_search.semantic_index.start()
+    if TASK_INDEX:
+        task_index.start()
+    
+    # Inline autocomplete answers from memory, so the index is built before polling starts
+    prefix_index.load()
     
     # Create the Application
-    application = Application.builder().token("8181926764:AAE0RsZomH3bdhLnGqatSi5W7HH3fwjiEQQ").build()
+    builder = Application.builder().token(BOT_TOKEN).concurrent_updates(BOT_CONCURRENT_UPDATES)
+    if BOT_API_BASE_URL:
+        base_url = BOT_API_BASE_URL.rstrip('/')
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -1461,10 +1350,40 @@ def main():
     application.add_handler(CommandHandler("join_activity", join_activity))
     application.add_handler(CommandHandler("create_task", create_task))
     application.add_handler(CommandHandler("update_task", update_task_status))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("subscribe_digest", subscribe_digest))
+    application.add_handler(CommandHandler("unsubscribe_digest", unsubscribe_digest))
+    application.add_handler(CommandHandler("bind", bind_command))
+    application.add_handler(CommandHandler("unbind", unbind_command))
+    application.add_handler(CommandHandler("approve_bind", approve_bind_command))
+    application.add_handler(CommandHandler("reject_bind", reject_bind_command))
+    application.add_handler(InlineQueryHandler(inline_query))
+    
+    # Daily digest is computed once and fanned out to subscribed chats
+    application.job_queue.run_daily(digest.digest_job, time=digest.digest_time(), name='daily_digest')
+    # Employees imported by manage.py land in another process; the bot polls for them
+    application.job_queue.run_repeating(refresh_employees, interval=EMPLOYEE_REFRESH_INTERVAL, name='employee_refresh')
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
     # Start the Bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_SECRET_TOKEN:
+            raise RuntimeError("WEBHOOK_SECRET_TOKEN must be set in webhook mode")
+        logger.info(f"Starting webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        # Telegram передает секрет в заголовке X-Telegram-Bot-Api-Secret-Token,
+        # запросы с неверным секретом отклоняются встроенным сервером с кодом 403
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES
+        )
+    elif BOT_MODE == 'polling':
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    else:
+        raise RuntimeError(f"Unknown BOT_MODE: {BOT_MODE}")
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""Offline stand-ins for exercising the bot in webhook mode.
+
+Two tools live here:
+
+* ``fake-api`` - a minimal Bot API server. Point the bot at it with
+  ``TELEGRAM_API_BASE_URL=http://127.0.0.1:8081`` so that ``getMe``,
+  ``setWebhook`` and ``sendMessage`` never leave the machine. With
+  ``--flood-rate``/``--flood-chat-rate`` it answers sends above those rates
+  with 429 and retry_after, and texts over 4096 characters with 400, like
+  the real API.
+* ``replay`` - posts recorded ``Update`` JSON to the bot's webhook endpoint
+  with the secret token header and reports latency and throughput.
+
+Example::
+
+    python webhook_replay.py fake-api --port 8081 &
+    BOT_MODE=webhook WEBHOOK_SECRET_TOKEN=s3cret \\
+        TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 python telegram_bot.py &
+    python webhook_replay.py replay updates.jsonl --secret s3cret -c 16 -n 1000
+"""
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from admission import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_MESSAGE_LENGTH = 4096
+SEND_METHODS = ('sendMessage', 'sendDocument')
+
+
+class BotAPIError(Exception):
+    """Error answer of the fake API: HTTP status, description and optional parameters."""
+
+    def __init__(self, code: int, description: str, parameters: Optional[Dict] = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """Answer Bot API calls with canned successful responses."""
+
+    server_version = 'FakeBotAPI/1.0'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _read_params(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if not body:
+            return {}
+        if 'json' in content_type:
+            return json.loads(body)
+        # python-telegram-bot отправляет параметры как form-data / urlencoded
+        from urllib.parse import parse_qsl
+        if 'multipart/form-data' in content_type:
+            from email.parser import BytesParser
+            message = BytesParser().parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+            )
+            return {
+                part.get_param('name', header='content-disposition'): part.get_payload(decode=True).decode()
+                for part in message.get_payload()
+            }
+        return dict(parse_qsl(body.decode()))
+
+    def do_POST(self):
+        method = self.path.rstrip('/').rsplit('/', 1)[-1]
+        params = self._read_params()
+        try:
+            status, body = 200, {'ok': True, 'result': self.server.handle_method(method, params)}
+        except BotAPIError as e:
+            status, body = e.code, {'ok': False, 'error_code': e.code, 'description': e.description}
+            if e.parameters:
+                body['parameters'] = e.parameters
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST
+
+
+class FakeBotAPIServer(ThreadingHTTPServer):
+    """Bot API stand-in that records every call it receives."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, flood_rate: float = 0.0, flood_chat_rate: float = 0.0, flood_chat_burst: float = 3.0):
+        super().__init__(address, FakeBotAPIHandler)
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self.calls: Dict[str, int] = {}
+        self.rejected: Dict[int, int] = {}
+        # 0 отключает соответствующее ограничение
+        self.flood_chat_rate = flood_chat_rate
+        self.flood_chat_burst = flood_chat_burst
+        self._flood_bucket = TokenBucket(flood_rate, flood_rate) if flood_rate else None
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+
+    def _check_send(self, params: Dict):
+        text = params.get('text', '')
+        if len(text.encode('utf-16-le')) // 2 > MAX_MESSAGE_LENGTH:
+            raise BotAPIError(400, 'Bad Request: message is too long')
+        buckets = [self._flood_bucket] if self._flood_bucket else []
+        if self.flood_chat_rate:
+            chat_id = str(params.get('chat_id', ''))
+            if chat_id not in self._chat_buckets:
+                self._chat_buckets[chat_id] = TokenBucket(self.flood_chat_rate, self.flood_chat_burst)
+            buckets.append(self._chat_buckets[chat_id])
+        delay = max((bucket.delay() for bucket in buckets), default=0.0)
+        if delay > 0:
+            # Как и настоящий API, сообщаем целое число секунд
+            raise BotAPIError(429, f'Too Many Requests: retry after {max(1, round(delay))}',
+                              {'retry_after': max(1, round(delay))})
+        for bucket in buckets:
+            bucket.try_take()
+
+    def handle_method(self, method: str, params: Dict):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if method in SEND_METHODS:
+                try:
+                    self._check_send(params)
+                except BotAPIError as e:
+                    self.rejected[e.code] = self.rejected.get(e.code, 0) + 1
+                    raise
+        if method == 'getMe':
+            return {
+                'id': 1, 'is_bot': True, 'first_name': 'Corporate Bot',
+                'username': 'corporate_bot', 'can_join_groups': True,
+                'can_read_all_group_messages': False, 'supports_inline_queries': True
+            }
+        if method in ('sendMessage', 'sendDocument', 'editMessageText'):
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': params.get('text', '')
+            }
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        return True
+
+
+def load_updates(path: str) -> List[Dict]:
+    """Load recorded updates from a JSON list or a JSONL file."""
+    with open(path, encoding='utf-8') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def make_text_update(update_id: int, text: str, chat_id: int = 1000) -> Dict:
+    """Build a private-chat message update for the given text."""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Load'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': text
+        }
+    }
+
+
+def post_update(url: str, update: Dict, secret: Optional[str], timeout: float) -> int:
+    """POST one update to the webhook and return the HTTP status code."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    if secret:
+        request.add_header(SECRET_HEADER, secret)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def replay(url: str, updates: List[Dict], secret: Optional[str], total: int,
+           concurrency: int, timeout: float = 10.0) -> Dict:
+    """Replay updates against the webhook and return latency statistics."""
+    update_ids = itertools.count(1)
+    latencies = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def send(i: int):
+        update = dict(updates[i % len(updates)])
+        # Telegram отбрасывает повторные update_id, поэтому выдаем новые
+        update['update_id'] = next(update_ids)
+        started = time.perf_counter()
+        status = post_update(url, update, secret, timeout)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    return {
+        'requests': total,
+        'seconds': round(wall, 3),
+        'rps': round(total / wall, 1) if wall else 0.0,
+        'p50_ms': round(percentile(0.50), 2),
+        'p95_ms': round(percentile(0.95), 2),
+        'p99_ms': round(percentile(0.99), 2),
+        'statuses': statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fake = subparsers.add_parser('fake-api', help='run a local Bot API stand-in')
+    fake.add_argument('--host', default='127.0.0.1')
+    fake.add_argument('--port', type=int, default=8081)
+    fake.add_argument('--flood-rate', type=float, default=0.0, help='sends per second before 429, 0 = unlimited')
+    fake.add_argument('--flood-chat-rate', type=float, default=0.0, help='sends per second per chat before 429')
+    fake.add_argument('--flood-chat-burst', type=float, default=3.0)
+
+    rep = subparsers.add_parser('replay', help='post recorded updates to the webhook')
+    rep.add_argument('updates', help='JSON/JSONL file with Update objects, or a text file with --text')
+    rep.add_argument('--url', default='http://127.0.0.1:8443/telegram')
+    rep.add_argument('--secret', help='value for the secret token header')
+    rep.add_argument('--text', action='store_true', help='treat each line as a message text')
+    rep.add_argument('-n', '--total', type=int, default=100)
+    rep.add_argument('-c', '--concurrency', type=int, default=8)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'fake-api':
+        server = FakeBotAPIServer((args.host, args.port), args.flood_rate, args.flood_chat_rate, args.flood_chat_burst)
+        logger.info(f"Fake Bot API listening on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.info(f"Calls served: {server.calls}, rejected by status: {server.rejected}")
+            server.server_close()
+    else:
+        if args.text:
+            with open(args.updates, encoding='utf-8') as f:
+                updates = [make_text_update(i, line.strip()) for i, line in enumerate(f, 1) if line.strip()]
+        else:
+            updates = load_updates(args.updates)
+        print(json.dumps(replay(args.url, updates, args.secret, args.total, args.concurrency), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
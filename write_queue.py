@@ -0,0 +1,141 @@
+"""Group commit for the bot's write commands.
+
+Handlers submit a mutation, a callable that takes a session and returns a plain
+result. One writer thread takes everything queued within WRITE_QUEUE_WINDOW seconds
+and runs it in a single transaction, each mutation under its own savepoint: a
+failing mutation is rolled back alone and the rest share one commit (one fsync on
+SQLite). Results are handed out only after the commit, so ORM objects must not be
+returned - they are expired by then. Throughput is ``rate(bot_writes_total)``.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+import metrics
+from models import get_session
+
+logger = logging.getLogger(__name__)
+
+# How long the first mutation waits for company and the largest transaction
+WRITE_QUEUE_WINDOW = float(os.getenv('WRITE_QUEUE_WINDOW', '0.005'))
+WRITE_QUEUE_MAX_BATCH = int(os.getenv('WRITE_QUEUE_MAX_BATCH', '64'))
+
+WRITES = metrics.counter('bot_writes_total', 'Mutations through the write queue', ['outcome'])
+BATCH_SIZE = metrics.histogram(
+    'write_batch_size', 'Mutations committed in one transaction',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+COMMIT_SECONDS = metrics.histogram('write_commit_seconds', 'Time to run and commit one write batch')
+QUEUE_SECONDS = metrics.histogram('write_queue_seconds', 'Time a mutation waits before its batch starts')
+
+Mutation = Callable[[Any], Any]
+
+
+class WriteQueue:
+    """Single writer thread that coalesces queued mutations into one transaction."""
+
+    def __init__(self, session_factory=get_session, window: float = WRITE_QUEUE_WINDOW,
+                 max_batch: int = WRITE_QUEUE_MAX_BATCH):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, mutation: Mutation) -> Future:
+        # Поток запускается при первой записи, чтобы импорт модуля ничего не запускал
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((mutation, future, time.perf_counter()))
+        return future
+
+    async def run(self, mutation: Mutation):
+        """Submit the mutation and wait for its result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(mutation))
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            collected = self._collect()
+            started = time.perf_counter()
+            batch = []
+            for mutation, future, queued in collected:
+                # Отмененные обработчиком записи не выполняем; остальные отменить уже нельзя
+                if future.set_running_or_notify_cancel():
+                    QUEUE_SECONDS.observe(started - queued)
+                    batch.append((mutation, future))
+            if not batch:
+                continue
+            BATCH_SIZE.observe(len(batch))
+            self._commit_batch(batch)
+            COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+    def _begin(self, session):
+        if session.get_bind().dialect.name == 'sqlite':
+            # pysqlite не открывает транзакцию перед SAVEPOINT, и RELEASE первой точки
+            # сохранения зафиксировал бы ее отдельно; IMMEDIATE сразу берет блокировку записи
+            session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+
+    def _commit_batch(self, batch: List[Tuple[Mutation, Future]]):
+        session = self.session_factory()
+        applied = []
+        try:
+            self._begin(session)
+            for mutation, future in batch:
+                try:
+                    with session.begin_nested():
+                        result = mutation(session)
+                except Exception as e:
+                    logger.error(f"Write failed: {e}")
+                    WRITES.labels('failed').inc()
+                    future.set_exception(e)
+                    continue
+                applied.append((mutation, future, result))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            session.close()
+            unresolved = [(mutation, future) for mutation, future in batch if not future.done()]
+            if len(batch) > 1:
+                # Общий коммит не прошел - повторяем каждую запись в своей транзакции,
+                # чтобы одна из них не лишила результата остальные
+                logger.warning("Commit of %d writes failed, retrying one by one: %s", len(unresolved), e)
+                for item in unresolved:
+                    self._commit_batch([item])
+                return
+            logger.error(f"Write batch failed: {e}")
+            metrics.ERRORS.labels('write_queue').inc()
+            for _, future in unresolved:
+                WRITES.labels('failed').inc()
+                future.set_exception(e)
+            return
+        session.close()
+        for _, future, result in applied:
+            WRITES.labels('committed').inc()
+            future.set_result(result)
+
+
+write_queue = WriteQueue()